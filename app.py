@@ -1,65 +1,101 @@
-from flask import Flask, render_template, redirect, url_for, request, session, jsonify
+from flask import Flask, render_template, redirect, url_for, request, session, jsonify, make_response, Response, stream_with_context, g
+from werkzeug.http import is_resource_modified
 from utils.logger_config import setup_logger
 import json
-from models import get_subjects, add_subject, add_section_to_subject, add_topic_to_section, delete_topic_from_section, delete_section_from_subject, delete_subject_from_data, subject_has_sections, section_has_topics, update_topic_details, update_section_details, update_subject_details
+import hashlib
+import random
+import time
+import click
+import config
+from flask.json.provider import DefaultJSONProvider
+from storage import JsonFileStorage, SqliteStorage, Entity, LazyDetails
+from models import VERSION_CONFLICT, topic_fragment, prerender_topics, get_store, get_entity, get_changes, wait_for_changes, apply_batch, add_change_listener, search, import_records, new_import_context, export_notebook, get_subjects, get_version, get_subject_by_name, get_subject_summaries, list_sections, list_topics, add_subject, add_section_to_subject, add_topic_to_section, delete_topic_from_section, delete_section_from_subject, delete_subject_from_data, subject_has_sections, section_has_topics, update_topic_details, update_section_details, update_subject_details
 from utils import check_login
-from datetime import timedelta
-from marshmallow import Schema, fields, validate
+from utils.render_cache import RenderCache
+from utils.topic_render import RENDERER_VERSION
+from utils.static_site import StaticSiteBuilder
+from utils.metrics import REGISTRY, REQUEST_LATENCY, RENDER_CACHE_LOOKUPS
+from datetime import datetime, timedelta, timezone
+from marshmallow import Schema, fields, validate, EXCLUDE, ValidationError
 import os
-if os.name == 'nt':
-    import msvcrt
-else:
-    import fcntl
 
 # Set up logger for the application
 logger = setup_logger('app')
 
+class NotebookJSONProvider(DefaultJSONProvider):
+    """Serialises store entities and lazily loaded topic details like the dicts they stand for."""
+    @staticmethod
+    def default(o):
+        if isinstance(o, (Entity, LazyDetails)):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
+
 app = Flask(__name__)
+app.json = NotebookJSONProvider(app)
 app.secret_key = 'your_secret_key'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)
 app.config['SESSION_COOKIE_SECURE'] = True
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 
-# Add this near the top of your file with other constants
-JSON_FILE = "path/to/your/json/file.json"  # Replace with your actual JSON file path
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+IMPORT_CHUNK_SIZE = 1000
+BATCH_MAX_OPERATIONS = 1000
 
-# Replace any fcntl.flock() usage with this class
-class FileLock:
-    def __init__(self, file):
-        self.file = file
-        
-    def acquire(self):
-        if os.name == 'nt':
-            try:
-                msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
-            except OSError:
-                return False
-            return True
-        else:
-            try:
-                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-            except (IOError, BlockingIOError):
-                return False
-            return True
-            
-    def release(self):
-        if os.name == 'nt':
-            try:
-                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
-            except OSError:
-                pass
-        else:
-            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+def templates_digest():
+    """Short hash of the template sources and topic renderer, so a deploy changes every ETag."""
+    digest = hashlib.sha1(f"topic-render-v{RENDERER_VERSION}".encode())
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:8]
+
+TEMPLATES_DIGEST = templates_digest()
+
+# Templates insert topic content rendered when it was saved
+app.add_template_global(topic_fragment)
+
+# Rendered subject pages, dropped as soon as anything inside the subject changes
+subject_page_cache = RenderCache(config.RENDER_CACHE_BYTES)
+
+def evict_subject_page(store, record, subject_id):
+    if record is None:
+        subject_page_cache.clear()
+    else:
+        subject_page_cache.evict(subject_id)
+
+add_change_listener(evict_subject_page)
+
+# Static copy of the public pages, kept current by one worker if enabled
+static_site = StaticSiteBuilder(
+    app, config.STATIC_SITE_DIR, get_store, TEMPLATES_DIGEST, config.STATIC_SITE_STATE_DIR,
+    config.STATIC_SITE_DELAY
+)
+if config.STATIC_SITE_AUTO:
+    add_change_listener(static_site.on_change)
 
 @app.before_request
 def before_request():
-    """Log all requests"""
-    logger.info(f"Request: {request.method} {request.url} from {request.remote_addr}")
+    g.request_start = time.perf_counter()
 
 @app.after_request
 def after_request(response):
-    """Log all responses"""
-    logger.info(f"Response: {response.status_code}")
+    """
+    Record the request's latency and log one access line. Successful
+    requests are sampled at ACCESS_LOG_SAMPLE_RATE; client and server
+    errors are always logged.
+    """
+    if 'request_start' in g:
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - g.request_start,
+            route=request.url_rule.rule if request.url_rule else 'unmatched',
+            method=request.method,
+            status=response.status_code
+        )
+    if response.status_code >= 400 or random.random() < config.ACCESS_LOG_SAMPLE_RATE:
+        logger.info("Request: %s %s from %s -> %s",
+                    request.method, request.url, request.remote_addr, response.status_code)
     return response
 
 @app.errorhandler(Exception)
@@ -77,12 +113,63 @@ def internal_error(error):
     logger.error(f"Internal error: {error}", exc_info=True)
     return jsonify({'error': 'Internal server error'}), 500
 
+def conditional_response(etag, last_modified, render):
+    """
+    Answer 304 when the client's If-None-Match / If-Modified-Since copy is
+    current, otherwise call render(). `last_modified` is in epoch seconds. Either way attach ETag, Last-Modified
+    and Cache-Control so browsers and proxies can revalidate cheaply.
+    """
+    last_modified = datetime.fromtimestamp(last_modified, timezone.utc) if last_modified else None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response(render())
+    else:
+        response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = config.HTTP_CACHE_MAX_AGE
+    response.cache_control.must_revalidate = True
+    return response
+
 def validate_json_request():
     if not request.is_json:
         return jsonify({'error': 'Content-Type must be application/json'}), 415
     return None
 
+def entity_etag(version):
+    """ETag of a subject, section or topic at `version` (see models.entity_version)."""
+    return f"v{version}"
+
+def if_match_versions():
+    """
+    Entity versions the request's If-Match header accepts, or None when it
+    has none or is '*'. Weak tags never match, as RFC 9110 requires.
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    return {int(tag[1:]) for tag in if_match.as_set() if tag[:1] == 'v' and tag[1:].isdigit()}
+
+def versioned_response(payload, status, version):
+    """JSON response carrying the entity's ETag when its version is known."""
+    response = jsonify(payload)
+    response.status_code = status
+    if version is not None:
+        response.set_etag(entity_etag(version))
+    return response
+
+def entity_response(kind, entity_id):
+    entity = get_entity(kind, entity_id)
+    if entity is None:
+        return jsonify({'error': f"{kind.capitalize()} not found"}), 404
+    return conditional_response(entity_etag(entity['version']), None, lambda: jsonify(entity))
+
 ### Public Routes ###
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics, summed over every worker on this host."""
+    return Response(REGISTRY.expose(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')  # Checked working
 def index():
     """
@@ -90,20 +177,35 @@ def index():
     If the user is logged in, show the admin options. Otherwise, show the login popup.
     """
     logger.debug("Accessing index page")
-    subjects = get_subjects()
-    logger.info("Index page loaded successfully")
-    return render_template('/public/index.html', subjects=subjects)
+    seq, modified = get_version()
+
+    def render():
+        subjects = get_subjects()
+        logger.info("Index page loaded successfully")
+        return render_template('/public/index.html', subjects=subjects)
+
+    return conditional_response(f"index-{seq}-{TEMPLATES_DIGEST}", modified, render)
 
 @app.route('/subject/<subject_name>')
 def subject_page(subject_name):
     """
     Render the page for a specific subject with topics.
     """
-    subjects = get_subjects()  # Use the function that returns the subjects list
-    subject = next((s for s in subjects if s['name'] == subject_name), None)
+    subject, version, modified = get_subject_by_name(subject_name)
     if subject is None:
         return "Subject not found", 404
-    return render_template('/public/subject_page.html', subject=subject)
+
+    def render():
+        html = subject_page_cache.get(subject['id'], version)
+        RENDER_CACHE_LOOKUPS.inc(result='miss' if html is None else 'hit')
+        if html is None:
+            html = render_template('/public/subject_page.html', subject=subject).encode('utf-8')
+            subject_page_cache.put(subject['id'], version, html)
+        return html
+
+    return conditional_response(
+        f"subject-{subject['id']}-{version}-{TEMPLATES_DIGEST}", modified, render
+    )
 
 ### Authentication Routes ###
 @app.route('/login', methods=['GET', 'POST'])  # Checked working
@@ -161,21 +263,424 @@ def manage_subjects():
         return render_template('/admin/subjects.html', subjects=subjects)
     return redirect(url_for('index'))
 
+def page_args():
+    """Read `cursor`, `limit` and `fields` query parameters for list endpoints."""
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    field_names = request.args.get('fields')
+    selected = {f.strip() for f in field_names.split(',') if f.strip()} if field_names else None
+    return request.args.get('cursor'), limit, selected
+
+def select_fields(items, selected):
+    """Keep only the requested keys (id is always kept) of each item."""
+    if not selected:
+        return items
+    return [{k: v for k, v in item.items() if k == 'id' or k in selected} for item in items]
+
 @app.route('/api/subjects', methods=['GET'])
 def api_get_subjects():
-    """API to fetch all subjects."""
+    """
+    API to fetch all subjects.
+    With ?view=summary only subject fields and section/topic counts are returned.
+    'seq' is where to start following /api/changes from.
+    """
     try:
-        subjects = get_subjects()
-        logger.debug(f"API returning subjects: {subjects}")
-        return jsonify({'subjects': subjects})
+        view = request.args.get('view', 'full')
+        seq, modified = get_version()
+
+        def render():
+            if view == 'summary':
+                return jsonify({'subjects': get_subject_summaries(), 'seq': seq})
+            return jsonify({'subjects': get_subjects(), 'seq': seq})
+
+        return conditional_response(f"subjects-{view}-{seq}", modified, render)
     except Exception as e:
         logger.error(f"Error in api_get_subjects: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/changes', methods=['GET'])
+def api_get_changes():
+    """
+    Entities created, updated or deleted after ?since=<seq> (the 'seq' of
+    /api/subjects or of the previous call). With resync_required the
+    history no longer reaches back that far: refetch /api/subjects.
+    """
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'error': 'since must be a non-negative integer'}), 400
+    try:
+        return jsonify(get_changes(since)), 200
+    except Exception as e:
+        logger.error(f"Error in api_get_changes: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def sse_message(event, event_id, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+@app.route('/api/events', methods=['GET'])
+def api_events():
+    """
+    Server-Sent Events for admin pages: a 'change' event per committed
+    mutation, {"seq", "op", "kind", "id", "version"} with the seq as event
+    id, from any worker. A reconnect resumes after Last-Event-ID (or
+    ?since= on the first connect); if that is older than the change
+    history, a 'resync' event says to refetch /api/subjects. The stream
+    closes after EVENTS_STREAM_SECONDS and EventSource reconnects; it
+    holds a worker thread until then (see config.py).
+    """
+    if 'logged_in' not in session or not session['logged_in']:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if config.EVENTS_STREAM_SECONDS <= 0:
+        return '', 204
+
+    resume = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since = int(resume) if resume else get_version()[0]
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be a seq'}), 400
+
+    def stream():
+        seq = since
+        yield f"retry: {int(config.EVENTS_POLL_INTERVAL * 1000) + 1000}\n\n"
+        deadline = time.monotonic() + config.EVENTS_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            wait = min(deadline - time.monotonic(), config.EVENTS_HEARTBEAT)
+            events, current = wait_for_changes(seq, max(wait, 0))
+            if events is None:
+                yield sse_message('resync', current, {'seq': current})
+                seq = current
+            elif events:
+                yield ''.join(sse_message('change', event['seq'], event) for event in events)
+                seq = events[-1]['seq']
+            else:
+                yield ": keep-alive\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # let proxies pass events through as they come
+    })
+
+@app.route('/api/export', methods=['GET'])
+def api_export():
+    """
+    Stream the whole notebook (?format=json|ndjson) with chunked transfer
+    encoding. NDJSON output can be fed back to /api/import.
+    """
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'ndjson'):
+        return jsonify({'error': 'format must be json or ndjson'}), 400
+    try:
+        chunks = export_notebook(fmt)
+        mimetype = 'application/json' if fmt == 'json' else 'application/x-ndjson'
+        return Response(stream_with_context(chunks), mimetype=mimetype)
+    except Exception as e:
+        logger.error(f"Error in api_export: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/subjects/<int:subject_id>/sections', methods=['GET'])
+def api_get_sections(subject_id):
+    """API to page through a subject's sections (?cursor=&limit=&fields=)."""
+    try:
+        cursor, limit, selected = page_args()
+        result = list_sections(subject_id, cursor, limit)
+        if result is None:
+            return jsonify({'error': 'Subject not found'}), 404
+        sections, next_cursor = result
+        return jsonify({'sections': select_fields(sections, selected), 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in api_get_sections: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/sections/<int:section_id>/topics', methods=['GET'])
+def api_get_topics(section_id):
+    """
+    API to page through a section's topics (?cursor=&limit=&fields=).
+    Leave `details` out of `fields` to skip the text, code and table payloads.
+    """
+    try:
+        cursor, limit, selected = page_args()
+        result = list_topics(section_id, cursor, limit)
+        if result is None:
+            return jsonify({'error': 'Section not found'}), 404
+        topics, next_cursor = result
+        return jsonify({'topics': select_fields(topics, selected), 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in api_get_topics: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/subjects/<int:subject_id>', methods=['GET'])
+def api_get_subject(subject_id):
+    """One subject without its sections; the ETag is what PUT/DELETE take in If-Match."""
+    try:
+        return entity_response('subject', subject_id)
+    except Exception as e:
+        logger.error(f"Error in api_get_subject: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/sections/<int:section_id>', methods=['GET'])
+def api_get_section(section_id):
+    """One section without its topics, with its version as ETag."""
+    try:
+        return entity_response('section', section_id)
+    except Exception as e:
+        logger.error(f"Error in api_get_section: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/topics/<int:topic_id>', methods=['GET'])
+def api_get_topic(topic_id):
+    """One topic with its details, with its version as ETag."""
+    try:
+        return entity_response('topic', topic_id)
+    except Exception as e:
+        logger.error(f"Error in api_get_topic: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/search', methods=['GET'])
+def api_search():
+    """
+    Full-text search (?q=&limit=&offset=&type=subject|section|topic),
+    BM25-ranked, with snippets.
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Query parameter q is required'}), 400
+        limit = max(1, min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE))
+        offset = max(0, request.args.get('offset', 0, type=int))
+        kind = request.args.get('type')
+        total, results = search(query, limit, offset, {kind} if kind else None)
+        next_offset = offset + limit if offset + limit < total else None
+        return jsonify({'results': results, 'total': total, 'next_offset': next_offset})
+    except Exception as e:
+        logger.error(f"Error in api_search: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 class SubjectSchema(Schema):
     name = fields.Str(required=True, validate=validate.Length(min=1))
     description = fields.Str(required=True)
 
+class SectionSchema(Schema):
+    name = fields.Str(required=True, validate=validate.Length(min=1))
+
+class TopicSchema(Schema):
+    name = fields.Str(required=True, validate=validate.Length(min=1))
+    text = fields.Str(load_default='')
+    code = fields.Str(load_default='')
+    table = fields.Dict(allow_none=True, load_default=None)
+    image = fields.Str(allow_none=True, load_default=None)
+
+class ImportSubjectSchema(SubjectSchema):
+    class Meta:
+        unknown = EXCLUDE
+
+class ImportSectionSchema(SectionSchema):
+    class Meta:
+        unknown = EXCLUDE
+    subject = fields.Str()
+    subject_id = fields.Int()
+
+class ImportTopicSchema(TopicSchema):
+    class Meta:
+        unknown = EXCLUDE
+    subject = fields.Str()
+    subject_id = fields.Int()
+    section = fields.Str()
+    section_id = fields.Int()
+
+IMPORT_SCHEMAS = {
+    'subject': ImportSubjectSchema(),
+    'section': ImportSectionSchema(),
+    'topic': ImportTopicSchema()
+}
+
+def parse_import_line(line):
+    """
+    Validate one NDJSON import line; returns (record, error). A line of a
+    known type that fails validation still gets a record, carrying just
+    its type.
+    """
+    try:
+        data = json.loads(line)
+    except ValueError as e:
+        return None, f"Invalid JSON: {str(e)}"
+    if not isinstance(data, dict):
+        return None, "Expected a JSON object"
+    schema = IMPORT_SCHEMAS.get(data.get('type'))
+    if schema is None:
+        return None, "type must be one of subject, section, topic"
+    try:
+        record = schema.load(data)
+    except ValidationError as e:
+        return {'type': data['type']}, e.messages
+    for key in ('name', 'description', 'text', 'code'):
+        if isinstance(record.get(key), str):
+            record[key] = record[key].strip()
+    record['type'] = data['type']
+    return record, None
+
+class BatchUpdateSubjectSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+    id = fields.Int(required=True)
+    version = fields.Int()
+    name = fields.Str(validate=validate.Length(min=1))
+    description = fields.Str()
+
+class BatchUpdateSectionSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+    id = fields.Int(required=True)
+    version = fields.Int()
+    name = fields.Str(validate=validate.Length(min=1))
+
+class BatchUpdateTopicSchema(BatchUpdateSectionSchema):
+    text = fields.Str()
+    code = fields.Str()
+    table = fields.Dict(allow_none=True)
+    image = fields.Str(allow_none=True)
+
+class BatchDeleteSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+    id = fields.Int(required=True)
+    version = fields.Int()
+
+BATCH_SCHEMAS = {
+    **{('add', kind): schema for kind, schema in IMPORT_SCHEMAS.items()},
+    ('update', 'subject'): BatchUpdateSubjectSchema(),
+    ('update', 'section'): BatchUpdateSectionSchema(),
+    ('update', 'topic'): BatchUpdateTopicSchema(),
+    **{('delete', kind): BatchDeleteSchema() for kind in ('subject', 'section', 'topic')}
+}
+
+def parse_batch_operation(data):
+    """Validate one /api/batch operation; returns (operation, error)."""
+    if not isinstance(data, dict):
+        return None, "Expected a JSON object"
+    schema = BATCH_SCHEMAS.get((data.get('op'), data.get('type')))
+    if schema is None:
+        return None, "op must be one of add, update, delete and type one of subject, section, topic"
+    try:
+        operation = schema.load(data)
+    except ValidationError as e:
+        return None, e.messages
+    for key in ('name', 'description', 'text', 'code'):
+        if isinstance(operation.get(key), str):
+            operation[key] = operation[key].strip()
+    operation['op'] = data['op']
+    operation['type'] = data['type']
+    return operation, None
+
+def import_ndjson(lines, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import an iterable of NDJSON lines (str or bytes) chunk by chunk.
+    Returns a summary with per-line errors.
+    """
+    context = new_import_context()
+    summary = {'imported': 0, 'failed': 0, 'errors': []}
+    chunk = []
+
+    def flush():
+        results = import_records([record for _, record in chunk], context)
+        for (line_number, _), (success, message, _) in zip(chunk, results):
+            if success:
+                summary['imported'] += 1
+            else:
+                summary['failed'] += 1
+                summary['errors'].append({'line': line_number, 'error': message})
+        chunk.clear()
+
+    for line_number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        record, error = parse_import_line(line)
+        if record is None:
+            summary['failed'] += 1
+            summary['errors'].append({'line': line_number, 'error': error})
+            continue
+        if error is not None:
+            # Imported as a failure, so lines relying on it as their parent fail too
+            record['error'] = error
+        record['line'] = line_number
+        chunk.append((line_number, record))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    summary['errors'].sort(key=lambda error: error['line'])
+    return summary
+
+@app.route('/api/import', methods=['POST'])
+def api_import():
+    """
+    Bulk-add subjects, sections and topics from an NDJSON request body,
+    one {"type": "subject"|"section"|"topic", ...} object per line.
+    """
+    if 'logged_in' not in session or not session['logged_in']:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        summary = import_ndjson(request.stream)
+        logger.info("Imported %d records, %d failed", summary['imported'], summary['failed'])
+        return jsonify(summary), 200
+        
+    except Exception as e:
+        logger.error(f"Error in api_import: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """
+    Apply {"operations": [{"op": "add"|"update"|"delete", "type":
+    "subject"|"section"|"topic", ...}, ...]} in order, all or nothing,
+    with one write. Updates and deletes take an "id" and optionally the
+    "version" they expect; adds take the fields /api/import lines take.
+    """
+    if 'logged_in' not in session or not session['logged_in']:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        data = request.get_json(silent=True)
+        operations = data.get('operations') if isinstance(data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': 'operations must be a non-empty list'}), 400
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            return jsonify({'error': f'At most {BATCH_MAX_OPERATIONS} operations per batch'}), 400
+
+        parsed = []
+        errors = []
+        for index, item in enumerate(operations):
+            operation, error = parse_batch_operation(item)
+            if error is not None:
+                errors.append({'index': index, 'error': error})
+            parsed.append(operation)
+        if errors:
+            return jsonify({'committed': False, 'errors': errors}), 400
+
+        committed, results = apply_batch(parsed)
+        payload = {'committed': committed, 'results': []}
+        for index, (success, message, value) in enumerate(results):
+            result = {'index': index, 'success': success, 'message': message}
+            if value is not None:
+                result['id' if parsed[index]['op'] == 'add' else 'version'] = value
+            payload['results'].append(result)
+        if committed:
+            logger.info("Applied a batch of %d operations", len(parsed))
+            return jsonify(payload), 200
+        if results and results[-1][1] == VERSION_CONFLICT:
+            return jsonify(payload), 412
+        return jsonify(payload), 400
+        
+    except Exception as e:
+        logger.error(f"Error in api_batch: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/subjects/<int:subject_id>', methods=['PUT'])
 def update_subject(subject_id):
     """API endpoint to update a subject."""
@@ -195,10 +700,12 @@ def update_subject(subject_id):
         if not name:
             return jsonify({'error': 'Subject name is required'}), 400
             
-        success, message = update_subject_details(subject_id, name, description)
+        success, message, version = update_subject_details(subject_id, name, description, expected_versions=if_match_versions())
         
         if success:
-            return jsonify({'message': message}), 200
+            return versioned_response({'message': message, 'version': version}, 200, version)
+        if message == VERSION_CONFLICT:
+            return versioned_response({'error': message, 'version': version}, 412, version)
         return jsonify({'error': message}), 400
         
     except Exception as e:
@@ -218,10 +725,12 @@ def update_section(section_id):
         if not name:
             return jsonify({'error': 'Section name is required'}), 400
             
-        success, message = update_section_details(section_id, name)
+        success, message, version = update_section_details(section_id, name, expected_versions=if_match_versions())
         
         if success:
-            return jsonify({'message': message}), 200
+            return versioned_response({'message': message, 'version': version}, 200, version)
+        if message == VERSION_CONFLICT:
+            return versioned_response({'error': message, 'version': version}, 412, version)
         return jsonify({'error': message}), 400
         
     except Exception as e:
@@ -243,10 +752,12 @@ def update_topic(topic_id):
         if not name:
             return jsonify({'error': 'Topic name is required'}), 400
             
-        success, message = update_topic_details(topic_id, name, text, code)
+        success, message, version = update_topic_details(topic_id, name, text, code, expected_versions=if_match_versions())
         
         if success:
-            return jsonify({'message': message}), 200
+            return versioned_response({'message': message, 'version': version}, 200, version)
+        if message == VERSION_CONFLICT:
+            return versioned_response({'error': message, 'version': version}, 412, version)
         return jsonify({'error': message}), 400
         
     except Exception as e:
@@ -332,9 +843,11 @@ def delete_topic(topic_id):
         return jsonify({'error': 'Unauthorized'}), 401
 
     try:
-        success, message = delete_topic_from_section(topic_id)
+        success, message = delete_topic_from_section(topic_id, expected_versions=if_match_versions())
         if success:
             return jsonify({'message': message}), 200
+        if message == VERSION_CONFLICT:
+            return jsonify({'error': message}), 412
         return jsonify({'error': message}), 400
     except Exception as e:
         logger.error(f"Error in delete_topic: {str(e)}")
@@ -356,9 +869,11 @@ def delete_section(section_id):
         return jsonify({'error': 'Unauthorized'}), 401
 
     try:
-        success, message = delete_section_from_subject(section_id)
+        success, message = delete_section_from_subject(section_id, expected_versions=if_match_versions())
         if success:
             return jsonify({'message': message}), 200
+        if message == VERSION_CONFLICT:
+            return jsonify({'error': message}), 412
         return jsonify({'error': message}), 400
     except Exception as e:
         logger.error(f"Error in delete_section: {str(e)}")
@@ -380,31 +895,85 @@ def delete_subject(subject_id):
         return jsonify({'error': 'Unauthorized'}), 401
 
     try:
-        success, message = delete_subject_from_data(subject_id)
+        success, message = delete_subject_from_data(subject_id, expected_versions=if_match_versions())
         if success:
             return jsonify({'message': message}), 200
+        if message == VERSION_CONFLICT:
+            return jsonify({'error': message}), 412
         return jsonify({'error': message}), 400
     except Exception as e:
         logger.error(f"Error in delete_subject: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
-def save_json(data):
-    temp_file = f"{JSON_FILE}.tmp"
-    try:
-        with open(temp_file, 'w') as f:
-            lock = FileLock(f)
-            if lock.acquire():
-                try:
-                    json.dump(data, f, indent=4)
-                    f.flush()
-                    os.fsync(f.fileno())
-                finally:
-                    lock.release()
-        os.rename(temp_file, JSON_FILE)
-    except Exception as e:
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
-        raise e
+### CLI Commands ###
+@app.cli.command('migrate-json')
+@click.argument('json_file', default=config.DATA_FILE)
+@click.option('--sqlite-path', default=config.SQLITE_PATH, help='Target SQLite database.')
+def migrate_json(json_file, sqlite_path):
+    """Import an existing subjects.json (and its journal) into SQLite."""
+    # The configured data file may already have been split into shards
+    shard_dir = (config.SHARD_DIR or None) if json_file == config.DATA_FILE else None
+    store = JsonFileStorage(json_file, blob_dir=config.BLOB_DIR or None, shard_dir=shard_dir).load()
+    SqliteStorage(sqlite_path).import_data(store.to_dict())
+    click.echo(
+        f"Imported {len(store.subjects)} subjects, {len(store.section_by_id)} sections "
+        f"and {len(store.topic_by_id)} topics into {sqlite_path}"
+    )
+
+@app.cli.command('split-json')
+@click.argument('json_file', default=config.DATA_FILE)
+@click.option('--shard-dir', default=config.SHARD_DIR or os.path.join(config.DATA_DIR, 'subjects'),
+              show_default=True, help='Directory for the per-subject shards.')
+def split_json(json_file, shard_dir):
+    """Split a single-file subjects.json into per-subject shards. Stop the app first."""
+    storage = JsonFileStorage(json_file, blob_dir=config.BLOB_DIR or None, shard_dir=shard_dir)
+    count = storage.split()
+    if count is None:
+        raise click.ClickException(f"Nothing split: {storage.snapshot_path} exists or {json_file} is unreadable")
+    click.echo(f"Split {count} subjects into {shard_dir}; the original is kept as {json_file}.migrated")
+    click.echo(f"Set SHARD_DIR={shard_dir} before starting the app, and commit {shard_dir} with the rest of the data")
+
+@app.cli.command('import-ndjson')
+@click.argument('ndjson_file', type=click.File('rb'))
+@click.option('--chunk-size', default=IMPORT_CHUNK_SIZE, show_default=True, help='Records per write batch.')
+def import_ndjson_command(ndjson_file, chunk_size):
+    """Bulk-add subjects, sections and topics from an NDJSON file ('-' for stdin)."""
+    summary = import_ndjson(ndjson_file, chunk_size)
+    for error in summary['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f"Imported {summary['imported']} records, {summary['failed']} failed")
+
+@app.cli.command('export')
+@click.argument('output', type=click.File('w'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(['json', 'ndjson']), default='json', show_default=True)
+def export_command(output, fmt):
+    """Write the whole notebook to OUTPUT (stdout by default)."""
+    for chunk in export_notebook(fmt):
+        output.write(chunk)
+
+@app.cli.command('render-topics')
+def render_topics():
+    """Render every topic that has no pre-rendered fragment in RENDERED_DIR yet and drop unused ones."""
+    if not config.RENDERED_DIR:
+        raise click.ClickException("RENDERED_DIR is not set; fragments are only kept in memory")
+    count = prerender_topics()
+    if count is None:
+        raise click.ClickException(f"Another process is already rendering into {config.RENDERED_DIR}")
+    click.echo(f"{count} topics rendered into {config.RENDERED_DIR}")
+
+@app.cli.command('build-static')
+@click.option('--output', default=config.STATIC_SITE_DIR, show_default=True, help='Output directory.')
+@click.option('--full', is_flag=True, help='Re-render every page, not just the changed subjects.')
+def build_static(output, full):
+    """Render the index and subject pages into a directory nginx can serve."""
+    builder = StaticSiteBuilder(app, output, get_store, TEMPLATES_DIGEST, config.STATIC_SITE_STATE_DIR)
+    result = builder.build(full=full)
+    if result is None:
+        raise click.ClickException(f"Another build of {output} is running")
+    click.echo(
+        f"{result['rendered']} pages rendered, {result['removed']} removed, "
+        f"{result['unchanged']} unchanged in {output}"
+    )
 
 ### Run Application ###
 if __name__ == '__main__':
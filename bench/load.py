@@ -0,0 +1,374 @@
+"""
+Concurrent load and lost-update harness for the admin write API.
+
+    python bench/load.py                                  # 4 workers, 8 clients, 20 s
+    python bench/load.py --workers 8 --clients 32 --duration 60 --topics 10000
+    python bench/load.py --backend sqlite
+
+Runs the real app the way gunicorn does: the app is imported once, then
+--workers processes are forked and all accept() on one shared listening
+socket (werkzeug servers, threaded). --clients client processes drive a
+mixed read/write workload over keep-alive HTTP connections:
+
+    reads   GET /api/subjects?view=summary, GET /api/sections/<id>/topics,
+            GET /subject/<name>
+    writes  PUT /api/topics/<id> on a topic owned by the client,
+            POST /api/sections/<id>/topics into a few shared hot sections,
+            DELETE /api/topics/<id> on seeded topics owned by the client
+
+Every acknowledged write is remembered. After the run the workers are
+stopped and the data is reloaded from disk; a lost update is an
+acknowledged create that is missing, an acknowledged delete that came
+back, or an owned topic whose text is not the last acknowledged version.
+Corruption is a snapshot or journal line that does not parse, or a 2xx
+API response that is not valid JSON.
+
+Only the standard library, werkzeug and the app itself are used; all data
+lives in a temporary directory. A summary is printed and appended to
+bench_output.txt.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from run import ROOT, OUTPUT, generate_notebook  # noqa: E402
+
+HOT_SECTIONS = 3
+OPERATIONS = (
+    # (name, weight)
+    ('read_summary', 30),
+    ('read_topics', 15),
+    ('read_page', 10),
+    ('update_topic', 25),
+    ('create_topic', 15),
+    ('delete_topic', 5),
+)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+### Server ###
+def serve(app, fd):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    # The parent's signal handlers and threads do not apply to the worker
+    signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler, fd=fd)
+    server.serve_forever()
+
+
+### Client ###
+class Client:
+    def __init__(self, index, port, cookie, plan, seed):
+        self.index = index
+        self.port = port
+        self.cookie = cookie
+        self.plan = plan
+        self.rng = random.Random(seed)
+        self.connection = None
+        self.latencies = {name: [] for name, _ in OPERATIONS}
+        self.errors = {}
+        self.bad_json = 0
+        self.created = []  # names of acknowledged creates
+        self.deleted = []  # ids of acknowledged deletes
+        self.versions = {}  # owned topic id -> last acknowledged text
+        self.version = 0
+
+    def request(self, method, path, body=None):
+        headers = {'Cookie': self.cookie, 'Connection': 'keep-alive'}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                payload = response.read()
+                return response.status, payload
+            except (http.client.HTTPException, ConnectionError, socket.timeout):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+    def check_json(self, status, payload):
+        if 200 <= status < 300:
+            try:
+                json.loads(payload)
+            except ValueError:
+                self.bad_json += 1
+
+    def step(self, name):
+        plan = self.plan
+        if name == 'read_summary':
+            status, payload = self.request('GET', '/api/subjects?view=summary')
+            self.check_json(status, payload)
+        elif name == 'read_topics':
+            section_id = self.rng.choice(plan['sections'])
+            status, payload = self.request('GET', f"/api/sections/{section_id}/topics?limit=50&fields=id,name")
+            self.check_json(status, payload)
+        elif name == 'read_page':
+            status, _ = self.request('GET', f"/subject/{quote(self.rng.choice(plan['subject_names']))}")
+        elif name == 'update_topic':
+            topic_id = self.rng.choice(plan['owned'][self.index])
+            self.version += 1
+            text = f"client {self.index} version {self.version}"
+            status, payload = self.request(
+                'PUT', f"/api/topics/{topic_id}",
+                {'name': f"Owned {topic_id}", 'text': text, 'code': ''}
+            )
+            if status == 200:
+                self.versions[topic_id] = text
+        elif name == 'create_topic':
+            self.version += 1
+            topic_name = f"Load {self.index}-{self.version}"
+            section_id = self.rng.choice(plan['hot_sections'])
+            status, payload = self.request(
+                'POST', f"/api/sections/{section_id}/topics",
+                {'name': topic_name, 'text': 'created under load', 'code': ''}
+            )
+            if status == 201:
+                self.created.append(topic_name)
+        else:
+            deletable = plan['deletable'][self.index]
+            if not deletable:
+                return self.step('read_summary')
+            topic_id = deletable.pop()
+            status, payload = self.request('DELETE', f"/api/topics/{topic_id}")
+            if status == 200:
+                self.deleted.append(topic_id)
+        if status >= 400:
+            key = f"{name} {status}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def run(self, deadline):
+        names = [name for name, _ in OPERATIONS]
+        weights = [weight for _, weight in OPERATIONS]
+        while time.monotonic() < deadline:
+            name = self.rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                self.step(name)
+            except Exception as e:
+                key = f"{name} {type(e).__name__}"
+                self.errors[key] = self.errors.get(key, 0) + 1
+                continue
+            self.latencies[name].append(time.perf_counter() - start)
+        return {
+            'latencies': self.latencies,
+            'errors': self.errors,
+            'bad_json': self.bad_json,
+            'created': self.created,
+            'deleted': self.deleted,
+            'versions': self.versions,
+        }
+
+
+def run_client(write_fd, index, port, cookie, plan, deadline, seed):
+    result = Client(index, port, cookie, plan, seed).run(deadline)
+    with os.fdopen(write_fd, 'w') as pipe:
+        json.dump(result, pipe)
+
+
+### Verification ###
+def check_files(data_dir):
+    """Count snapshot/journal content that does not parse."""
+    corrupted = 0
+    snapshot = os.path.join(data_dir, 'subjects.json')
+    if os.path.exists(snapshot):
+        try:
+            with open(snapshot) as f:
+                json.load(f)
+        except ValueError:
+            corrupted += 1
+    for suffix in ('.journal.compacting', '.journal'):
+        path = snapshot + suffix
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    json.loads(line)
+                except ValueError:
+                    corrupted += 1
+    return corrupted
+
+
+def find_lost_updates(store, plan, results):
+    lost = {'create': 0, 'delete': 0, 'update': 0}
+    names = set()
+    for section_id in plan['hot_sections']:
+        names.update(topic['name'] for topic in store.get_section(section_id)['topics'])
+    for result in results:
+        lost['create'] += sum(1 for name in result['created'] if name not in names)
+        lost['delete'] += sum(1 for topic_id in result['deleted'] if store.get_topic(topic_id) is not None)
+        for topic_id, text in result['versions'].items():
+            topic = store.get_topic(int(topic_id))
+            if topic is None or topic['details'].get('text') != text:
+                lost['update'] += 1
+    return lost
+
+
+### Driver ###
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='Forked server processes sharing the socket.')
+    parser.add_argument('--clients', type=int, default=8, help='Client processes.')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds of load.')
+    parser.add_argument('--topics', type=int, default=2000, help='Topics in the seeded notebook.')
+    parser.add_argument('--backend', default='json', choices=['json', 'sqlite'])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=OUTPUT)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='notebook-load-')
+    notebook = generate_notebook(args.topics, seed=args.seed)
+    with open(os.path.join(data_dir, 'subjects.json'), 'w') as f:
+        json.dump(notebook, f, indent=4)
+    # config is read at import time, so point it at the scratch copy first
+    os.environ.update(
+        DATA_DIR=data_dir,
+        DATA_FILE=os.path.join(data_dir, 'subjects.json'),
+        SQLITE_PATH=os.path.join(data_dir, 'subjects.db'),
+        GENERATION_FILE=os.path.join(data_dir, 'subjects.generation'),
+        WRITE_LOCK_FILE=os.path.join(data_dir, 'subjects.lock'),
+        METRICS_DIR=os.path.join(data_dir, 'metrics'),
+        STORAGE_BACKEND=args.backend,
+        LOG_LEVEL=os.environ.get('LOG_LEVEL', 'WARNING'),
+    )
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from app import app
+    import models
+    if args.backend == 'sqlite':
+        from storage import JsonFileStorage, SqliteStorage
+        SqliteStorage(os.environ['SQLITE_PATH']).import_data(
+            JsonFileStorage(os.environ['DATA_FILE']).load().to_dict()
+        )
+
+    # Who touches what: hot sections take every create; each client owns a
+    # few topics to update and a few seeded topics to delete
+    sections = [section for subject in notebook['subjects'] for section in subject['sections']]
+    hot = sections[:HOT_SECTIONS]
+    pool = [topic['id'] for section in sections[HOT_SECTIONS:] for topic in section['topics']]
+    random.Random(args.seed).shuffle(pool)
+    per_client = max(1, min(20, len(pool) // (2 * args.clients)))
+    plan = {
+        'sections': [section['id'] for section in sections],
+        'hot_sections': [section['id'] for section in hot],
+        'subject_names': [subject['name'] for subject in notebook['subjects']],
+        'owned': [pool[i * per_client:(i + 1) * per_client] for i in range(args.clients)],
+        'deletable': [
+            pool[(args.clients + i) * per_client:(args.clients + i + 1) * per_client]
+            for i in range(args.clients)
+        ],
+    }
+    del notebook
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1024)
+    port = listener.getsockname()[1]
+    cookie = 'session=' + app.session_interface.get_signing_serializer(app).dumps({'logged_in': True})
+
+    workers = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            serve(app, listener.fileno())
+            os._exit(0)
+        workers.append(pid)
+    time.sleep(0.5)
+
+    print(f"{args.workers} workers on port {port}, {args.clients} clients for {args.duration:.0f}s "
+          f"({args.backend} backend, {args.topics} topics, data in {data_dir})", file=sys.stderr)
+    deadline = time.monotonic() + args.duration
+    clients = []
+    for index in range(args.clients):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            listener.close()
+            run_client(write_fd, index, port, cookie, plan, deadline, args.seed * 1000 + index)
+            os._exit(0)
+        os.close(write_fd)
+        clients.append((pid, read_fd))
+
+    started = time.monotonic()
+    results = []
+    for pid, read_fd in clients:
+        with os.fdopen(read_fd) as pipe:
+            results.append(json.load(pipe))
+        os.waitpid(pid, 0)
+    elapsed = time.monotonic() - started
+
+    for pid in workers:
+        os.kill(pid, signal.SIGTERM)
+    for pid in workers:
+        os.waitpid(pid, 0)
+    listener.close()
+
+    # Fresh view of what actually reached disk
+    corrupted = check_files(data_dir) if args.backend == 'json' else 0
+    models.invalidate_cache()
+    store = models.get_store()
+    lost = find_lost_updates(store, plan, results)
+
+    latencies = {name: [] for name, _ in OPERATIONS}
+    errors = {}
+    for result in results:
+        for name, values in result['latencies'].items():
+            latencies[name].extend(values)
+        for key, count in result['errors'].items():
+            errors[key] = errors.get(key, 0) + count
+    bad_json = sum(result['bad_json'] for result in results)
+    total = sum(len(values) for values in latencies.values())
+
+    lines = [
+        f"# load {datetime.now(timezone.utc).isoformat(timespec='seconds')} backend={args.backend} "
+        f"workers={args.workers} clients={args.clients} topics={args.topics} duration={elapsed:.1f}s",
+        f"throughput\t{total / elapsed:.1f} req/s\t({total} requests)",
+    ]
+    for name, values in latencies.items():
+        if values:
+            lines.append(
+                f"{name}\tn={len(values)}\tp50_ms={percentile(values, 0.5) * 1000:.2f}"
+                f"\tp99_ms={percentile(values, 0.99) * 1000:.2f}"
+            )
+    lines.append(f"errors\t{json.dumps(errors, sort_keys=True)}")
+    lines.append(f"lost_updates\t{sum(lost.values())}\t{json.dumps(lost, sort_keys=True)}")
+    lines.append(f"corrupted\tfiles={corrupted}\tresponses={bad_json}")
+    report = '\n'.join(lines) + '\n'
+    sys.stdout.write(report)
+    with open(args.output, 'a') as out:
+        out.write(report)
+    return 1 if sum(lost.values()) or corrupted or bad_json else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Benchmarks for the models.py operations and the main Flask routes.
+
+    python bench/run.py                      # 100, 10k and 100k topics
+    python bench/run.py --sizes 100 10000 --iterations 50
+
+Each notebook size runs in its own subprocess against a synthetic
+subjects.json in a temporary data directory (config is read at import
+time, so the storage paths have to be set before models is imported).
+Results are appended to bench_output.txt as tab-separated rows:
+
+    backend  topics  operation  iterations  mean_ms  p50_ms  p99_ms  max_ms
+
+so two runs can be compared with a plain diff or loaded into a sheet.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT = os.path.join(ROOT, 'bench_output.txt')
+COLUMNS = ('backend', 'topics', 'operation', 'iterations', 'mean_ms', 'p50_ms', 'p99_ms', 'max_ms')
+
+TOPICS_PER_SECTION = 50
+SECTIONS_PER_SUBJECT = 10
+
+WORDS = (
+    'python function variable loop list dictionary class object method module package import '
+    'return value string integer float boolean iterate index slice tuple set comprehension '
+    'generator decorator exception context manager thread process file stream buffer query'
+).split()
+
+CODE_SNIPPETS = (
+    "def greet(name):\n    return f'Hello, {name}!'\n\nprint(greet('World'))",
+    "numbers = [1, 2, 3, 4, 5]\nsquares = [n * n for n in numbers]\nprint(sum(squares))",
+    "with open('data.txt') as f:\n    for line in f:\n        print(line.strip())",
+    "class Stack:\n    def __init__(self):\n        self.items = []\n\n    def push(self, item):\n        self.items.append(item)",
+)
+
+
+### Synthetic data ###
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+def _timestamp(rng):
+    return datetime.fromtimestamp(1700000000 + rng.randrange(10 ** 7), timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def _table(rng):
+    headers = ['Name', 'Type', 'Example']
+    rows = [[rng.choice(WORDS), rng.choice(WORDS), str(rng.randrange(1000))] for _ in range(rng.randrange(2, 6))]
+    return {'headers': headers, 'rows': rows}
+
+def generate_notebook(topics, seed=1):
+    """A subjects.json dict with `topics` topics of realistic text, code and tables."""
+    rng = random.Random(seed)
+    subjects = []
+    ids = {'subject': 0, 'section': 0, 'topic': 0}
+    while ids['topic'] < topics:
+        ids['subject'] += 1
+        stamp = _timestamp(rng)
+        subject = {
+            'id': ids['subject'],
+            'name': f"Subject {ids['subject']}",
+            'description': ' '.join(_sentence(rng, 12) for _ in range(3)),
+            'created_at': stamp,
+            'updated_at': stamp,
+            'sections': []
+        }
+        subjects.append(subject)
+        for _ in range(SECTIONS_PER_SUBJECT):
+            if ids['topic'] >= topics:
+                break
+            ids['section'] += 1
+            section = {
+                'id': ids['section'],
+                'subject_id': subject['id'],
+                'name': f"Section {ids['section']}",
+                'created_at': stamp,
+                'updated_at': stamp,
+                'topics': []
+            }
+            subject['sections'].append(section)
+            for _ in range(min(TOPICS_PER_SECTION, topics - ids['topic'])):
+                ids['topic'] += 1
+                topic_id = ids['topic']
+                topic_stamp = _timestamp(rng)
+                section['topics'].append({
+                    'id': topic_id,
+                    'section_id': section['id'],
+                    'name': f"Topic {topic_id}",
+                    'created_at': topic_stamp,
+                    'updated_at': topic_stamp,
+                    'details': {
+                        'id': topic_id,
+                        'topic_id': topic_id,
+                        'text': ' '.join(_sentence(rng, rng.randrange(8, 20)) for _ in range(rng.randrange(2, 6))),
+                        'code': rng.choice(CODE_SNIPPETS),
+                        'table': _table(rng) if rng.random() < 0.3 else None,
+                        'image': None,
+                        'created_at': topic_stamp,
+                        'updated_at': topic_stamp
+                    }
+                })
+    next_ids = {kind: value + 1 for kind, value in ids.items()}
+    return {'subjects': subjects, 'next_ids': next_ids}
+
+
+### Measurement ###
+def measure(results, operation, iterations, func, setup=None):
+    """Time `func` `iterations` times; `setup` (untimed) returns its argument."""
+    if not iterations:
+        return
+    timings = []
+    for i in range(iterations):
+        argument = setup(i) if setup else None
+        start = time.perf_counter()
+        func(argument) if setup else func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    results.append({
+        'operation': operation,
+        'iterations': iterations,
+        'mean_ms': statistics.fmean(timings),
+        'p50_ms': timings[len(timings) // 2],
+        'p99_ms': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        'max_ms': timings[-1]
+    })
+
+def run_size(iterations):
+    """Benchmark body, run inside the per-size subprocess."""
+    import models
+    from app import app
+
+    results = []
+    store = models.get_store()
+    subject = store.subjects[len(store.subjects) // 2]
+    section = subject['sections'][0]
+    subject_name = subject['name']
+    section_id = section['id']
+    topic_ids = [topic['id'] for topic in section['topics']]
+
+    ### models.py ###
+    measure(results, 'cold_load', max(3, iterations // 50),
+            lambda: (models.invalidate_cache(), models.get_store()))
+    measure(results, 'get_subjects', iterations, models.get_subjects)
+    measure(results, 'section_has_topics', iterations, lambda: models.section_has_topics(section_id))
+    measure(results, 'subject_has_sections', iterations, lambda: models.subject_has_sections(subject['id']))
+    measure(results, 'search', iterations, lambda: models.search('python loop', limit=20))
+
+    measure(results, 'add_subject', iterations,
+            lambda i: models.add_subject(f"Bench subject {i}", 'Benchmark subject'), setup=lambda i: i)
+    measure(results, 'add_section_to_subject', iterations,
+            lambda i: models.add_section_to_subject(subject['id'], f"Bench section {i}"), setup=lambda i: i)
+    measure(results, 'add_topic_to_section', iterations,
+            lambda i: models.add_topic_to_section(section_id, f"Bench topic {i}", 'Some text', 'x = 1'),
+            setup=lambda i: i)
+    measure(results, 'update_topic_details', iterations,
+            lambda i: models.update_topic_details(topic_ids[i % len(topic_ids)], f"Renamed topic {i}", 'New text', 'y = 2'),
+            setup=lambda i: i)
+    measure(results, 'update_section_details', iterations,
+            lambda i: models.update_section_details(section_id, f"Renamed section {i}"), setup=lambda i: i)
+    measure(results, 'update_subject_details', iterations,
+            lambda i: models.update_subject_details(subject['id'], f"{subject_name} {i}", 'Updated'), setup=lambda i: i)
+
+    store = models.get_store()
+    bench_topics = [t['id'] for t in store.get_section(section_id)['topics'] if t['name'].startswith('Bench topic')]
+    measure(results, 'delete_topic_from_section', len(bench_topics),
+            lambda topic_id: models.delete_topic_from_section(topic_id), setup=lambda i: bench_topics[i])
+    bench_sections = [s['id'] for s in store.get_subject(subject['id'])['sections'] if s['name'].startswith('Bench section')]
+    measure(results, 'delete_section_from_subject', len(bench_sections),
+            lambda section: models.delete_section_from_subject(section), setup=lambda i: bench_sections[i])
+    bench_subjects = [s['id'] for s in store.subjects if s['name'].startswith('Bench subject')]
+    measure(results, 'delete_subject_from_data', len(bench_subjects),
+            lambda subject_id: models.delete_subject_from_data(subject_id), setup=lambda i: bench_subjects[i])
+
+    ### Routes ###
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    subject_name = models.get_store().get_subject(subject['id'])['name']
+
+    def get(url, **kwargs):
+        response = client.get(url, **kwargs)
+        assert response.status_code in (200, 304), (url, response.status_code)
+
+    measure(results, 'GET /', iterations, lambda: get('/'))
+    measure(results, 'GET /subject/<name>', iterations, lambda: get(f"/subject/{subject_name}"))
+    measure(results, 'GET /api/subjects', max(3, iterations // 10), lambda: get('/api/subjects'))
+    measure(results, 'GET /api/subjects?view=summary', iterations, lambda: get('/api/subjects?view=summary'))
+    measure(results, 'GET /api/sections/<id>/topics', iterations, lambda: get(f"/api/sections/{section_id}/topics"))
+    measure(results, 'GET /api/search', iterations, lambda: get('/api/search?q=python+loop'))
+    measure(results, 'POST /api/sections/<id>/topics', iterations,
+            lambda i: client.post(f"/api/sections/{section_id}/topics", json={'name': f"Route topic {i}", 'text': 't', 'code': 'c'}),
+            setup=lambda i: i)
+    route_topics = [t['id'] for t in models.get_store().get_section(section_id)['topics'] if t['name'].startswith('Route topic')]
+    measure(results, 'PUT /api/topics/<id>', len(route_topics),
+            lambda topic_id: client.put(f"/api/topics/{topic_id}", json={'name': f"Route topic {topic_id} v2", 'text': 't2', 'code': 'c2'}),
+            setup=lambda i: route_topics[i])
+    measure(results, 'DELETE /api/topics/<id>', len(route_topics),
+            lambda topic_id: client.delete(f"/api/topics/{topic_id}"), setup=lambda i: route_topics[i])
+    return results
+
+
+### Driver ###
+def run_in_subprocess(topics, backend, iterations):
+    with tempfile.TemporaryDirectory(prefix='notebook-bench-') as data_dir:
+        with open(os.path.join(data_dir, 'subjects.json'), 'w') as f:
+            json.dump(generate_notebook(topics), f, indent=4)
+        env = dict(
+            os.environ,
+            DATA_DIR=data_dir,
+            DATA_FILE=os.path.join(data_dir, 'subjects.json'),
+            SQLITE_PATH=os.path.join(data_dir, 'subjects.db'),
+            GENERATION_FILE=os.path.join(data_dir, 'subjects.generation'),
+            WRITE_LOCK_FILE=os.path.join(data_dir, 'subjects.lock'),
+            METRICS_DIR=os.path.join(data_dir, 'metrics'),
+            STORAGE_BACKEND=backend,
+            LOG_LEVEL='WARNING',
+            PYTHONPATH=ROOT
+        )
+        if backend == 'sqlite':
+            subprocess.run(
+                [sys.executable, '-m', 'flask', '--app', 'app', 'migrate-json'],
+                cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL
+            )
+        output = subprocess.run(
+            [sys.executable, __file__, '--worker', '--iterations', str(iterations)],
+            cwd=ROOT, env=env, check=True, stdout=subprocess.PIPE, text=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 100000], help='Topic counts to benchmark.')
+    parser.add_argument('--backends', nargs='+', default=['json'], choices=['json', 'sqlite'])
+    parser.add_argument('--iterations', type=int, default=100, help='Iterations per operation.')
+    parser.add_argument('--output', default=OUTPUT)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_size(args.iterations)))
+        return
+
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    with open(args.output, 'a') as out:
+        out.write(f"# run {datetime.now(timezone.utc).isoformat(timespec='seconds')} commit={commit or 'unknown'} "
+                  f"python={sys.version.split()[0]}\n")
+        out.write('\t'.join(COLUMNS) + '\n')
+        for backend in args.backends:
+            for topics in args.sizes:
+                print(f"Benchmarking {backend} backend with {topics} topics...", file=sys.stderr)
+                for row in run_in_subprocess(topics, backend, args.iterations):
+                    line = '\t'.join([backend, str(topics), row['operation'], str(row['iterations'])] +
+                                     [f"{row[column]:.3f}" for column in COLUMNS[4:]])
+                    out.write(line + '\n')
+                    print(line)
+                out.flush()
+    print(f"Results appended to {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Storage settings, overridable through the environment or .env
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')  # 'json' or 'sqlite'
+DATA_FILE = os.getenv('DATA_FILE', os.path.join(DATA_DIR, 'subjects.json'))
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(DATA_DIR, 'subjects.db'))
+
+# Shared counter bumped on every commit so other workers know to catch up
+GENERATION_FILE = os.getenv('GENERATION_FILE', os.path.join(DATA_DIR, 'subjects.generation'))
+
+# Fold the JSON journal into a new snapshot once it passes either limit and
+# has grown to at least this fraction of the snapshot's size
+JOURNAL_COMPACT_BYTES = int(os.getenv('JOURNAL_COMPACT_BYTES', 1024 * 1024))
+JOURNAL_COMPACT_RECORDS = int(os.getenv('JOURNAL_COMPACT_RECORDS', 1000))
+JOURNAL_COMPACT_RATIO = float(os.getenv('JOURNAL_COMPACT_RATIO', 0.25))
+
+# Content-addressed files for topic text/code/table/image (JSON backend; set
+# BLOB_DIR empty to keep details inline), how many decoded payloads each
+# worker caches, and how long (seconds) unreferenced blobs are kept
+BLOB_DIR = os.getenv('BLOB_DIR', os.path.join(DATA_DIR, 'blobs'))
+BLOB_CACHE_SIZE = int(os.getenv('BLOB_CACHE_SIZE', 1024))
+BLOB_GC_GRACE = int(os.getenv('BLOB_GC_GRACE', 3600))
+
+# Keep a pickled copy of subjects.json (subjects.json.bin) that workers load
+# instead of parsing the JSON while it is current; set to 0 to disable
+BINARY_SNAPSHOT = os.getenv('BINARY_SNAPSHOT', '1') == '1'
+
+# Split the JSON snapshot into one file per subject under SHARD_DIR, listed
+# in order by a manifest there, so compaction only rewrites the subjects that
+# changed. Off by default; split an existing DATA_FILE with `flask split-json`
+# while the app is stopped, then set SHARD_DIR to the directory it wrote
+SHARD_DIR = os.getenv('SHARD_DIR', '')
+
+# Highest mutation seq any worker has handed out, so the seqs of a rolled back
+# or failed write (seen by readers, and part of ETags) are never reused
+SEQ_MARK_FILE = os.getenv('SEQ_MARK_FILE', os.path.join(DATA_DIR, 'subjects.seq'))
+
+# Inter-process write lock and group-commit window (seconds) for admin writes
+WRITE_LOCK_FILE = os.getenv('WRITE_LOCK_FILE', os.path.join(DATA_DIR, 'subjects.lock'))
+WRITE_BATCH_WINDOW = float(os.getenv('WRITE_BATCH_WINDOW', 0.002))
+
+# How many recent changes each worker remembers for /api/changes; clients
+# further behind are told to refetch everything
+CHANGE_HISTORY_SIZE = int(os.getenv('CHANGE_HISTORY_SIZE', 10000))
+
+# /api/events: how often (seconds) an open stream checks for other workers'
+# commits, sends a keep-alive comment, and how long it lasts before the
+# browser reconnects and resumes. Each open stream holds a request thread
+# all that time, so serve the app with a threaded or async worker class
+# (gunicorn -k gthread --threads 16, or -k gevent); a sync worker is lost
+# to one admin tab per stream. Keep EVENTS_STREAM_SECONDS under the
+# worker timeout (gunicorn: 30 s). 0 turns the stream off (204, which
+# tells EventSource not to reconnect); admin pages then only catch up
+# when reloaded
+EVENTS_POLL_INTERVAL = float(os.getenv('EVENTS_POLL_INTERVAL', 0.5))
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', 10))
+EVENTS_STREAM_SECONDS = float(os.getenv('EVENTS_STREAM_SECONDS', 25))
+
+# Cache-Control max-age (seconds) for public pages and the subjects API;
+# 0 makes browsers and proxies revalidate with ETag/Last-Modified each time
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', 0))
+
+# Pre-rendered topic text/code/table HTML, one file per distinct content
+# (a cache, safe to delete; set RENDERED_DIR empty to keep them in memory
+# only), and how many each worker keeps in memory. Topics without one are
+# rendered in the background after a load; `flask render-topics` does it
+# ahead of a deploy. Both also remove fragments no topic uses any more once
+# they are RENDERED_GC_GRACE seconds old. Code is highlighted as CODE_LANGUAGE (a Pygments lexer
+# name) unless a snippet clearly is not
+RENDERED_DIR = os.getenv('RENDERED_DIR', os.path.join(DATA_DIR, 'rendered'))
+RENDERED_CACHE_SIZE = int(os.getenv('RENDERED_CACHE_SIZE', 4096))
+RENDERED_GC_GRACE = int(os.getenv('RENDERED_GC_GRACE', 3600))
+CODE_LANGUAGE = os.getenv('CODE_LANGUAGE', 'python')
+# The only lexers a snippet is scored against to see if it clearly is
+# another language. Scoring all of Pygments' ~500 takes ten times as long
+# as highlighting itself
+CODE_GUESS_LANGUAGES = [name.strip() for name in os.getenv(
+    'CODE_GUESS_LANGUAGES',
+    'python,javascript,typescript,java,c,cpp,csharp,go,rust,ruby,php,bash,sql,html,xml,css,json,yaml'
+).split(',') if name.strip()]
+
+# Static copy of the public pages for nginx or a CDN (flask build-static).
+# With STATIC_SITE_AUTO=1, one worker per host checks every
+# STATIC_SITE_DELAY seconds for changes and re-renders only the subjects
+# that changed. What was built, and the locks, are kept in
+# STATIC_SITE_STATE_DIR, outside the served directory
+STATIC_SITE_DIR = os.getenv('STATIC_SITE_DIR', 'site')
+STATIC_SITE_STATE_DIR = os.getenv('STATIC_SITE_STATE_DIR', os.path.join(DATA_DIR, 'static-site'))
+STATIC_SITE_AUTO = os.getenv('STATIC_SITE_AUTO', '0') == '1'
+STATIC_SITE_DELAY = float(os.getenv('STATIC_SITE_DELAY', 2))
+
+# Upper bound, in bytes, for cached rendered subject pages per worker
+RENDER_CACHE_BYTES = int(os.getenv('RENDER_CACHE_BYTES', 32 * 1024 * 1024))
+
+# Logging: the debug, error and access logs go to LOGS_DIR; records below
+# LOG_LEVEL are dropped before formatting; up to LOG_QUEUE_SIZE records wait
+# for the background writer before new ones are dropped;
+# ACCESS_LOG_SAMPLE_RATE of successful requests get an access line
+LOGS_DIR = os.getenv('LOGS_DIR', os.path.join(DATA_DIR, 'logs'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv('ACCESS_LOG_SAMPLE_RATE', 1.0))
+
+# Per-process metric files, summed by /metrics, and how often (seconds) each
+# worker rewrites its own
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(DATA_DIR, 'metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
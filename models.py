@@ -1,198 +1,365 @@
+import base64
 import datetime
+import gc
 from utils.logger_config import setup_logger
-import json
-from functools import lru_cache
+import threading
 import time
+import config
+from storage import create_storage, iter_export, ChangeLog, GenerationCounter, GroupCommitWriter
+from utils.search_index import SearchIndex, make_snippet
+from utils.topic_render import TopicFragments
+from utils.metrics import STORAGE_SECONDS, STORE_LOOKUPS, STORE_INVALIDATIONS
 
 # Set up logger for models
 logger = setup_logger('models')
 
-def load_json(file_name):
-    """Helper function to load data from a JSON file."""
-    try:
-        logger.debug(f"Attempting to load JSON file: {file_name}")
-        with open(file_name, 'r') as f:
-            data = json.load(f)
-            logger.info(f"Successfully loaded JSON file: {file_name}")
-            return data
-    except FileNotFoundError:
-        logger.error(f"File not found: {file_name}")
-        return []
-    except json.JSONDecodeError:
-        logger.error(f"JSON decoding error in file: {file_name}")
-        return []
-    except Exception as e:
-        logger.exception("Unexpected error occurred while loading JSON")
-        return []
+def _create_storage():
+    """Build the storage backend selected by config.STORAGE_BACKEND."""
+    if config.STORAGE_BACKEND == 'sqlite':
+        return create_storage('sqlite', config.SQLITE_PATH)
+    return create_storage(
+        'json',
+        config.DATA_FILE,
+        compact_bytes=config.JOURNAL_COMPACT_BYTES,
+        compact_records=config.JOURNAL_COMPACT_RECORDS,
+        compact_ratio=config.JOURNAL_COMPACT_RATIO,
+        blob_dir=config.BLOB_DIR or None,
+        blob_cache_size=config.BLOB_CACHE_SIZE,
+        blob_gc_grace=config.BLOB_GC_GRACE,
+        binary_snapshot=config.BINARY_SNAPSHOT,
+        shard_dir=config.SHARD_DIR or None
+    )
 
-def save_json(file_name, data):
-    """Helper function to save data to a JSON file."""
+_storage = _create_storage()
+_generation = GenerationCounter(config.GENERATION_FILE)
+_seq_mark = GenerationCounter(config.SEQ_MARK_FILE)
+_store = None
+_store_lock = threading.Lock()
+_listeners = []
+
+def add_change_listener(listener):
+    """
+    Call listener(store, record, subject_id) after every mutation applied to
+    the resident store, whether committed here or replayed from another
+    worker. Records of a rolled back batch are passed again, newest first,
+    as {'op': 'undo', 'seq', 'kind', 'id'} once they are undone. After a
+    full reload it is called as listener(store, None, None): anything may
+    have changed. Listeners run under the store's locks and must not call
+    get_store().
+    """
+    _listeners.append(listener)
+
+def _load_store():
+    # Every object a load builds survives it, so collecting while it runs
+    # only rescans the growing tree; pausing gc takes about half off a
+    # binary-snapshot load
+    enabled = gc.isenabled()
+    gc.disable()
     try:
-        logger.debug(f"Attempting to save JSON file: {file_name}")
-        with open(file_name, 'w') as f:
-            json.dump(data, f, indent=4)
-            logger.info(f"Successfully saved JSON file: {file_name}")
-            return True
-    except Exception as e:
-        logger.error(f"Error saving JSON file: {str(e)}")
-        return False
+        return _storage.load()
+    finally:
+        if enabled:
+            gc.enable()
+
+def get_store():
+    """
+    Return the resident store, loading it from the backend on first use.
+    If another worker committed since this copy was built (the shared
+    generation moved), catch up with its writes first.
+    """
+    global _store
+    store = _store
+    generation = _generation.value()
+    if store is not None and store.generation == generation:
+        STORE_LOOKUPS.inc(result='hit')
+    else:
+        with _store_lock:
+            store = _store
+            if store is None:
+                STORE_LOOKUPS.inc(result='load')
+                with STORAGE_SECONDS.time(op='load', backend=_storage.name):
+                    store = _load_store()
+            elif store.generation != generation:
+                STORE_LOOKUPS.inc(result='refresh')
+                with store.lock, STORAGE_SECONDS.time(op='refresh', backend=_storage.name):
+                    store = _storage.refresh(store)
+            store.generation = generation
+            if store is not _store:
+                store.listeners = _listeners
+                for listener in _listeners:
+                    listener(store, None, None)
+            _store = store
+    return store
 
-@lru_cache(maxsize=32)
 def get_subjects():
-    """Get all subjects with caching."""
-    return load_json('data/subjects.json').get('subjects', [])
+    """Get all subjects from the resident store."""
+    return get_store().subjects
 
 def invalidate_cache():
-    """Clear the cache when data changes."""
-    get_subjects.cache_clear()
+    """Drop the resident store so the next access reloads it from disk."""
+    global _store
+    STORE_INVALIDATIONS.inc()
+    with _store_lock:
+        _store = None
 
-def add_subject(name, description):
-    """Add a new subject if it doesn't already exist."""
-    try:
+_search_index = SearchIndex()
+add_change_listener(_search_index.on_change)
+
+_change_log = ChangeLog(config.CHANGE_HISTORY_SIZE)
+add_change_listener(_change_log.on_change)
+
+_topic_fragments = TopicFragments(
+    config.RENDERED_DIR or None, config.RENDERED_CACHE_SIZE, config.CODE_LANGUAGE,
+    config.CODE_GUESS_LANGUAGES, config.RENDERED_GC_GRACE
+)
+
+# Pay for highlighting when a topic is written rather than when it is viewed
+add_change_listener(_topic_fragments.on_change)
+
+def topic_fragment(details):
+    """Rendered HTML for a topic's text, code and table (see utils.topic_render)."""
+    return _topic_fragments.get(details)
+
+def prerender_topics():
+    """
+    Render every topic that has no fragment in RENDERED_DIR yet, from a
+    copy loaded for the purpose, and remove the fragments none of them
+    uses. Returns how many were rendered, or None if another process is
+    already doing it.
+    """
+    return _topic_fragments.backfill(_load_store())
+
+def _record(op, kind, entity_id, fields=None, parent=None, details=None):
+    """Build one mutation record."""
+    record = {'op': op, 'kind': kind, 'id': entity_id, 'ts': time.time()}
+    if parent is not None:
+        record['parent'] = parent
+    if fields is not None:
+        record['fields'] = fields
+    if details is not None:
+        record['details'] = details
+    return record
+
+_writer = GroupCommitWriter(
+    _storage,
+    get_store,
+    invalidate_cache,
+    _generation,
+    _seq_mark,
+    config.WRITE_LOCK_FILE,
+    window=config.WRITE_BATCH_WINDOW
+)
+
+def _write(plan, error_message, extra=()):
+    """
+    Run a mutation plan through the group-commit writer.
+    `plan(store)` validates against the up-to-date store and returns
+    ((success, message, *extra), records) without changing anything itself.
+    """
+    result = _writer.submit(plan)
+    if result is None:
+        return (False, error_message) + extra
+    return result
+
+### Entity versions ###
+VERSION_CONFLICT = "Version conflict: it was changed since you loaded it"
+
+def entity_version(entity):
+    """An entity's version: 1 when created, bumped by every update to it."""
+    return entity.get('version', 1)
+
+def _conflicts(entity, expected_versions):
+    """True if an If-Match style precondition rules out changing `entity`."""
+    return expected_versions is not None and entity_version(entity) not in expected_versions
+
+def get_entity(kind, entity_id):
+    """
+    The subject, section or topic with this id without its children, as a
+    dict that always carries 'version', or None.
+    """
+    store = get_store()
+    entity = getattr(store, f"get_{kind}")(entity_id)
+    if entity is None:
+        return None
+    return _without_children(entity)
+
+def _without_children(entity):
+    summary = {k: v for k, v in entity.items() if k not in ('sections', 'topics')}
+    summary['version'] = entity_version(entity)
+    return summary
+
+def get_changes(since):
+    """
+    What changed after seq `since`, for clients patching a copy of the tree:
+    {'seq', 'resync_required', 'changes': [{'op', 'kind', 'id', 'seq', 'entity'}]}
+    Each entity changed since then is listed once, in the order it first
+    changed, with its current state (without children; none for deletes).
+    'op' is 'add' if it was created in that span. When the span is older
+    than the change history, resync_required is set and the client should
+    refetch /api/subjects.
+    """
+    store = get_store()
+    # Held by the writer while records go in, so this sees whole commits
+    with store.lock:
+        entries = _change_log.since(since)
+        if entries is None:
+            return {'seq': store.seq, 'resync_required': True, 'changes': []}
+        changes = {}
+        for seq, op, kind, entity_id in entries:
+            change = changes.get((kind, entity_id))
+            if change is None:
+                changes[(kind, entity_id)] = {'op': op, 'kind': kind, 'id': entity_id, 'seq': seq}
+            else:
+                change['seq'] = seq
+                if op == 'delete' or change['op'] != 'add':
+                    change['op'] = op
+        for change in changes.values():
+            if change['op'] != 'delete':
+                entity = getattr(store, f"get_{change['kind']}")(change['id'])
+                change['entity'] = _without_children(entity)
+        return {'seq': store.seq, 'resync_required': False, 'changes': list(changes.values())}
+
+def change_events(since):
+    """
+    (events, seq) for every record after seq `since`, one small dict each:
+    {'seq', 'op', 'kind', 'id', 'version'} ('version' is the entity's
+    current one, absent once it is deleted). events is None when the
+    change history no longer reaches back to `since`.
+    """
+    store = get_store()
+    with store.lock:
+        entries = _change_log.since(since)
+        if entries is None:
+            return None, store.seq
+        events = []
+        for seq, op, kind, entity_id in entries:
+            event = {'seq': seq, 'op': op, 'kind': kind, 'id': entity_id}
+            entity = None if op == 'delete' else getattr(store, f"get_{kind}")(entity_id)
+            if entity is not None:
+                event['version'] = entity_version(entity)
+            events.append(event)
+        return events, store.seq
+
+def wait_for_changes(since, timeout):
+    """
+    change_events(since), waiting up to `timeout` seconds for there to be
+    any. Commits in this worker wake the wait at once; other workers' are
+    seen through the shared generation, which get_store() checks every
+    EVENTS_POLL_INTERVAL and then replays from the journal or database.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        events, seq = change_events(since)
+        remaining = deadline - time.monotonic()
+        if events is None or events or remaining <= 0:
+            return events, seq
+        _change_log.wait(since, min(remaining, config.EVENTS_POLL_INTERVAL))
+
+def _timestamp():
+    return datetime.datetime.utcnow().isoformat() + "Z"
+
+def _add_subject_plan(name, description):
+    def plan(store):
         # Validate inputs
         if not isinstance(name, str) or not isinstance(description, str):
-            return False, "Invalid input types"
+            return (False, "Invalid input types"), []
         
         if not name.strip() or len(name) > 100:  # Add reasonable limits
-            return False, "Invalid name length"
+            return (False, "Invalid name length"), []
             
         if len(description) > 1000:  # Add reasonable limits
-            return False, "Description too long"
+            return (False, "Description too long"), []
             
-        # Load current data
-        data = load_json('data/subjects.json')
-        subjects = data.get('subjects', [])
-        
         # Check for duplicate name (case-insensitive)
-        if any(s['name'].lower() == name.lower() for s in subjects):
-            return False, "A subject with this name already exists"
+        if store.subject_name_taken(name):
+            return (False, "A subject with this name already exists"), []
             
-        # Generate new ID
-        new_id = max([s['id'] for s in subjects], default=0) + 1
-        
         # Create new subject with timestamps
-        from datetime import datetime
-        timestamp = datetime.utcnow().isoformat() + "Z"
-        
+        subject_id = store.allocate_id('subject')
+        timestamp = _timestamp()
         new_subject = {
-            'id': new_id,
+            'id': subject_id,
             'name': name,
             'description': description,
             'sections': [],
             'created_at': timestamp,
-            'updated_at': timestamp
+            'updated_at': timestamp,
+            'version': 1
         }
-        
-        # Add to subjects list
-        subjects.append(new_subject)
-        data['subjects'] = subjects
-        
-        # Save to file
-        if save_json('data/subjects.json', data):
-            invalidate_cache()
-            return True, "Subject added successfully"
-        return False, "Error saving subject"
+        return (True, "Subject added successfully"), [
+            _record('add', 'subject', subject_id, new_subject)
+        ]
+    return plan
+
+def add_subject(name, description):
+    """Add a new subject if it doesn't already exist."""
+    try:
+        return _write(_add_subject_plan(name, description), "Error saving subject")
         
     except Exception as e:
         logger.error(f"Error adding subject: {str(e)}")
         return False, "Internal server error"
 
-def add_section_to_subject(subject_id, name):
-    """
-    Add a new section to a subject.
-    Returns (success, message) tuple.
-    """
-    try:
-        data = load_json('data/subjects.json')
-        subjects = data.get('subjects', [])
-        
-        # Find the subject
-        subject = next((s for s in subjects if s['id'] == subject_id), None)
-        if not subject:
-            return False, "Subject not found"
+def _add_section_plan(subject_id, name):
+    def plan(store):
+        if not store.get_subject(subject_id):
+            return (False, "Subject not found"), []
         
         # Check for duplicate section name in this subject
-        if any(s['name'].lower() == name.lower() for s in subject.get('sections', [])):
-            return False, "A section with this name already exists in this subject"
-        
-        # Get next section ID (across all subjects)
-        all_sections = [s for subj in subjects for s in subj.get('sections', [])]
-        next_id = max([s['id'] for s in all_sections], default=0) + 1
-        
-        # Create new section
-        from datetime import datetime
-        timestamp = datetime.utcnow().isoformat() + "Z"
+        if store.section_name_taken(subject_id, name):
+            return (False, "A section with this name already exists in this subject"), []
         
+        # Section IDs are unique across all subjects
+        section_id = store.allocate_id('section')
+        timestamp = _timestamp()
         new_section = {
-            'id': next_id,
+            'id': section_id,
             'subject_id': subject_id,
             'name': name,
             'topics': [],
             'created_at': timestamp,
-            'updated_at': timestamp
+            'updated_at': timestamp,
+            'version': 1
         }
-        
-        # Add to subject's sections
-        if 'sections' not in subject:
-            subject['sections'] = []
-        subject['sections'].append(new_section)
-        
-        # Save updated data
-        if save_json('data/subjects.json', data):
-            invalidate_cache()
-            return True, "Section added successfully"
-        return False, "Error saving section"
-        
-    except Exception as e:
-        logger.error(f"Error adding section: {str(e)}")
-        return False, "Internal server error"
+        return (True, "Section added successfully"), [
+            _record('add', 'section', section_id, new_section, parent=subject_id)
+        ]
+    return plan
 
-def add_topic_to_section(section_id, name, text, code, table=None, image=None):
+def add_section_to_subject(subject_id, name):
     """
-    Add a new topic to a section.
+    Add a new section to a subject.
     Returns (success, message) tuple.
     """
     try:
-        data = load_json('data/subjects.json')
-        subjects = data.get('subjects', [])
+        return _write(_add_section_plan(subject_id, name), "Error saving section")
         
-        # Find the section
-        section = None
-        for subject in subjects:
-            for s in subject.get('sections', []):
-                if s['id'] == section_id:
-                    section = s
-                    break
-            if section:
-                break
-                
-        if not section:
-            return False, "Section not found"
+    except Exception as e:
+        logger.error(f"Error adding section: {str(e)}")
+        return False, "Internal server error"
+
+def _add_topic_plan(section_id, name, text, code, table=None, image=None):
+    def plan(store):
+        if not store.get_section(section_id):
+            return (False, "Section not found"), []
         
         # Check for duplicate topic name in this section
-        if any(t['name'].lower() == name.lower() for t in section.get('topics', [])):
-            return False, "A topic with this name already exists in this section"
-        
-        # Get next topic ID (across all sections)
-        all_topics = []
-        for subject in subjects:
-            for s in subject.get('sections', []):
-                all_topics.extend(s.get('topics', []))
-        next_topic_id = max([t['id'] for t in all_topics], default=0) + 1
-        
-        # Create new topic
-        from datetime import datetime
-        timestamp = datetime.utcnow().isoformat() + "Z"
+        if store.topic_name_taken(section_id, name):
+            return (False, "A topic with this name already exists in this section"), []
         
+        # Topic IDs are unique across all sections
+        topic_id = store.allocate_id('topic')
+        timestamp = _timestamp()
         new_topic = {
-            'id': next_topic_id,
+            'id': topic_id,
             'section_id': section_id,
             'name': name,
             'created_at': timestamp,
             'updated_at': timestamp,
+            'version': 1,
             'details': {
-                'id': next_topic_id,
-                'topic_id': next_topic_id,
+                'id': topic_id,
+                'topic_id': topic_id,
                 'text': text,
                 'code': code,
                 'table': table,
@@ -201,222 +368,509 @@ def add_topic_to_section(section_id, name, text, code, table=None, image=None):
                 'updated_at': timestamp
             }
         }
-        
-        # Add to section's topics
-        if 'topics' not in section:
-            section['topics'] = []
-        section['topics'].append(new_topic)
-        
-        # Save updated data
-        if save_json('data/subjects.json', data):
-            invalidate_cache()
-            return True, "Topic added successfully"
-        return False, "Error saving topic"
+        return (True, "Topic added successfully"), [
+            _record('add', 'topic', topic_id, new_topic, parent=section_id)
+        ]
+    return plan
+
+def add_topic_to_section(section_id, name, text, code, table=None, image=None):
+    """
+    Add a new topic to a section.
+    Returns (success, message) tuple.
+    """
+    try:
+        return _write(_add_topic_plan(section_id, name, text, code, table, image), "Error saving topic")
         
     except Exception as e:
         logger.error(f"Error adding topic: {str(e)}")
         return False, "Internal server error"
 
+### Bulk import ###
+class _FailedParent:
+    """Stands in the import context for a subject or section that failed to import."""
+
+    __slots__ = ('kind', 'line')
+
+    def __init__(self, kind, line):
+        self.kind = kind
+        self.line = line
+
+    def message(self):
+        where = f" on line {self.line}" if self.line is not None else ""
+        return f"Parent {self.kind}{where} failed"
+
+def _import_plan(record, context):
+    """
+    Plan for one import record. Parents are resolved when the plan runs, so
+    a record can refer to entities added earlier in the same import.
+    """
+    kind = record['type']
+
+    def resolve_subject(store):
+        if record.get('subject_id') is not None:
+            return record['subject_id']
+        if record.get('subject') is not None:
+            subject = store.find_subject(record['subject'])
+            return subject['id'] if subject else None
+        return context['subject']
+
+    def resolve_section(store):
+        if record.get('section_id') is not None:
+            return record['section_id']
+        if record.get('section') is not None:
+            section = store.find_section(resolve_subject(store), record['section'])
+            return section['id'] if section else None
+        if record.get('subject_id') is not None or record.get('subject') is not None:
+            return None
+        return context['section']
+
+    def failed_parent():
+        # A parent that would come from the context but failed itself
+        if kind == 'subject' or record.get('subject_id') is not None or record.get('subject') is not None:
+            return None
+        if kind == 'topic' and record.get('section_id') is not None:
+            return None
+        parent = context['section' if kind == 'topic' and record.get('section') is None else 'subject']
+        return parent if isinstance(parent, _FailedParent) else None
+
+    def plan(store):
+        failed = failed_parent()
+        if record.get('error') is not None:
+            result, records = (False, record['error']), []
+        elif failed is not None:
+            result, records = (False, failed.message()), []
+        elif kind == 'subject':
+            result, records = _add_subject_plan(record['name'], record.get('description', ''))(store)
+        elif kind == 'section':
+            result, records = _add_section_plan(resolve_subject(store), record['name'])(store)
+        else:
+            result, records = _add_topic_plan(
+                resolve_section(store), record['name'], record.get('text', ''),
+                record.get('code', ''), record.get('table'), record.get('image')
+            )(store)
+        if not records:
+            # Lines after it that rely on it as their parent fail as well
+            context[kind] = _FailedParent(kind, record.get('line'))
+            if kind == 'subject':
+                context['section'] = context['subject']
+            return result + (None,), records
+        context[kind] = records[0]['id']
+        if kind == 'subject':
+            context['section'] = None
+        return result + (records[0]['id'],), records
+    return plan
+
+def new_import_context():
+    """Parents remembered between import_records() calls of one import."""
+    return {'subject': None, 'section': None}
+
+def import_records(records, context):
+    """
+    Add a chunk of validated import records in order through the
+    group-commit writer, so the whole chunk costs a handful of commits.
+
+    Each record is a dict with 'type' (subject, section or topic) and the
+    fields add_subject/add_section_to_subject/add_topic_to_section take.
+    Sections and topics name their parent by id ('subject_id',
+    'section_id') or by name ('subject', plus 'section' for topics); with
+    neither they go under the subject or section most recently added by
+    this import, and fail if that one failed. A record may carry the
+    'line' it came from for those messages, and an 'error' if it failed
+    validation (it then only marks its place). Returns one (success,
+    message, id) per record.
+    """
+    try:
+        plans = [_import_plan(record, context) for record in records]
+        return [
+            result if result is not None else (False, "Error saving import", None)
+            for result in _writer.submit_many(plans)
+        ]
+        
+    except Exception as e:
+        logger.error(f"Error importing records: {str(e)}")
+        return [(False, "Internal server error", None)] * len(records)
+
 def section_has_topics(section_id):
     """Check if a section has any topics."""
-    data = load_json('data/subjects.json')
-    for subject in data.get('subjects', []):
-        for section in subject.get('sections', []):
-            if section['id'] == section_id:
-                return len(section.get('topics', [])) > 0
-    return False
+    section = get_store().get_section(section_id)
+    return bool(section and section.get('topics'))
 
 def subject_has_sections(subject_id):
     """Check if a subject has any sections."""
-    data = load_json('data/subjects.json')
-    for subject in data.get('subjects', []):
-        if subject['id'] == subject_id:
-            return len(subject.get('sections', [])) > 0
-    return False
-
-def delete_topic_from_section(topic_id):
-    """Delete a topic."""
+    subject = get_store().get_subject(subject_id)
+    return bool(subject and subject.get('sections'))
+
+def export_notebook(fmt='json'):
+    """
+    Stream the whole notebook as 'json' or 'ndjson' text chunks without
+    building it in memory. See storage.iter_export for the formats.
+    """
+    return iter_export(get_store(), fmt)
+
+def get_version():
+    """(seq, last modified epoch) of the whole notebook."""
+    store = get_store()
+    return store.seq, store.modified
+
+def get_subject_by_name(name):
+    """
+    Return (subject, version, last modified epoch) for the subject with this
+    exact name, or (None, None, None). The version covers the subject and
+    everything inside it, and is read from the same store as the subject.
+    """
+    store = get_store()
+    subject = next((s for s in store.subjects if s['name'] == name), None)
+    if subject is None:
+        return None, None, None
+    return (
+        subject,
+        store.subject_versions.get(subject['id'], store.seq),
+        store.subject_modified.get(subject['id'], 0.0)
+    )
+
+def get_subject_summaries():
+    """Subjects without their children, with section and topic counts."""
+    summaries = []
+    for subject in get_subjects():
+        summary = {k: v for k, v in subject.items() if k != 'sections'}
+        summary['section_count'] = len(subject['sections'])
+        summary['topic_count'] = sum(len(s['topics']) for s in subject['sections'])
+        summaries.append(summary)
+    return summaries
+
+def _encode_cursor(offset, last_id):
+    return base64.urlsafe_b64encode(f"{offset}:{last_id}".encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    """Return (offset, last_id); raises ValueError for a malformed cursor."""
     try:
-        data = load_json('data/subjects.json')
-        found = False
-        
-        for subject in data.get('subjects', []):
-            for section in subject.get('sections', []):
-                original_length = len(section.get('topics', []))
-                section['topics'] = [t for t in section.get('topics', []) if t['id'] != topic_id]
-                if len(section['topics']) < original_length:
-                    found = True
-                    break
-            if found:
-                break
-        
-        if not found:
-            return False, "Topic not found"
-            
-        if save_json('data/subjects.json', data):
-            invalidate_cache()
-            return True, "Topic deleted successfully"
-        return False, "Error saving changes"
+        padded = cursor + '=' * (-len(cursor) % 4)
+        offset, last_id = base64.urlsafe_b64decode(padded).decode().split(':')
+        return int(offset), int(last_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _paginate(items, cursor, limit):
+    """
+    Slice `items` after the position a cursor points at.
+    The cursor remembers both the offset and the id of the last item seen,
+    so inserts or deletes before it do not shift the page.
+    """
+    start = 0
+    if cursor:
+        offset, last_id = _decode_cursor(cursor)
+        if 0 < offset <= len(items) and items[offset - 1]['id'] == last_id:
+            start = offset
+        else:
+            start = next(
+                (i + 1 for i, item in enumerate(items) if item['id'] == last_id),
+                min(offset, len(items))
+            )
+    page = items[start:start + limit]
+    end = start + len(page)
+    next_cursor = _encode_cursor(end, page[-1]['id']) if page and end < len(items) else None
+    return page, next_cursor
+
+def list_sections(subject_id, cursor=None, limit=50):
+    """
+    One page of a subject's sections, each with a topic count instead of
+    its topics. Returns (sections, next_cursor), or None if not found.
+    """
+    subject = get_store().get_subject(subject_id)
+    if subject is None:
+        return None
+    page, next_cursor = _paginate(subject['sections'], cursor, limit)
+    sections = []
+    for section in page:
+        summary = {k: v for k, v in section.items() if k != 'topics'}
+        summary['topic_count'] = len(section['topics'])
+        sections.append(summary)
+    return sections, next_cursor
+
+def list_topics(section_id, cursor=None, limit=50):
+    """One page of a section's topics. Returns (topics, next_cursor), or None."""
+    section = get_store().get_section(section_id)
+    if section is None:
+        return None
+    return _paginate(section['topics'], cursor, limit)
+
+def search(query, limit=20, offset=0, kinds=None):
+    """
+    Full-text search over names, descriptions and topic details.
+    Returns (total, results) where each result carries its type, id, name,
+    BM25 score, owning subject and a snippet around the first match.
+    """
+    store = get_store()
+    total, hits = _search_index.search(query, limit, offset, kinds)
+    results = []
+    for score, (kind, entity_id) in hits:
+        entity = getattr(store, f"get_{kind}")(entity_id)
+        if entity is None:
+            continue
+        if kind == 'subject':
+            subject, text = entity, entity.get('description')
+        elif kind == 'section':
+            subject, text = store.subject_of_section(entity_id), entity.get('name')
+        else:
+            details = entity.get('details') or {}
+            subject = store.subject_of_section(store.topic_parent.get(entity_id))
+            text = details.get('text') or details.get('code') or entity.get('name')
+        results.append({
+            'type': kind,
+            'id': entity_id,
+            'name': entity['name'],
+            'score': round(score, 4),
+            'subject_id': subject['id'] if subject else None,
+            'subject_name': subject['name'] if subject else None,
+            'snippet': make_snippet(text, query)
+        })
+    return total, results
+
+def _delete_topic_plan(topic_id, expected_versions=None):
+    def plan(store):
+        topic = store.get_topic(topic_id)
+        if not topic:
+            return (False, "Topic not found"), []
+        if _conflicts(topic, expected_versions):
+            return (False, VERSION_CONFLICT), []
+        return (True, "Topic deleted successfully"), [
+            _record('delete', 'topic', topic_id)
+        ]
+    return plan
+
+def delete_topic_from_section(topic_id, expected_versions=None):
+    """Delete a topic (with `expected_versions`, only if it is at one of them)."""
+    try:
+        return _write(_delete_topic_plan(topic_id, expected_versions), "Error saving changes")
         
     except Exception as e:
         logger.error(f"Error deleting topic: {str(e)}")
         return False, "Internal server error"
 
-def delete_section_from_subject(section_id):
-    """Delete a section if it's empty."""
-    try:
-        if section_has_topics(section_id):
-            return False, "Cannot delete section with topics"
+def _delete_section_plan(section_id, expected_versions=None):
+    def plan(store):
+        section = store.get_section(section_id)
+        if section and section.get('topics'):
+            return (False, "Cannot delete section with topics"), []
             
-        data = load_json('data/subjects.json')
-        found = False
-        
-        for subject in data.get('subjects', []):
-            original_length = len(subject.get('sections', []))
-            subject['sections'] = [s for s in subject.get('sections', []) if s['id'] != section_id]
-            if len(subject['sections']) < original_length:
-                found = True
-                break
-        
-        if not found:
-            return False, "Section not found"
+        if not section:
+            return (False, "Section not found"), []
+
+        if _conflicts(section, expected_versions):
+            return (False, VERSION_CONFLICT), []
             
-        if save_json('data/subjects.json', data):
-            invalidate_cache()
-            return True, "Section deleted successfully"
-        return False, "Error saving changes"
+        return (True, "Section deleted successfully"), [
+            _record('delete', 'section', section_id)
+        ]
+    return plan
+
+def delete_section_from_subject(section_id, expected_versions=None):
+    """Delete a section if it's empty (with `expected_versions`, only if it is at one of them)."""
+    try:
+        return _write(_delete_section_plan(section_id, expected_versions), "Error saving changes")
         
     except Exception as e:
         logger.error(f"Error deleting section: {str(e)}")
         return False, "Internal server error"
 
-def delete_subject_from_data(subject_id):
-    """Delete a subject if it's empty."""
-    try:
-        if subject_has_sections(subject_id):
-            return False, "Cannot delete subject with sections"
+def _delete_subject_plan(subject_id, expected_versions=None):
+    def plan(store):
+        subject = store.get_subject(subject_id)
+        if subject and subject.get('sections'):
+            return (False, "Cannot delete subject with sections"), []
             
-        data = load_json('data/subjects.json')
-        data['subjects'] = [s for s in data.get('subjects', []) if s['id'] != subject_id]
-        
-        if save_json('data/subjects.json', data):
-            invalidate_cache()
-            return True, "Subject deleted successfully"
-        return False, "Error saving changes"
+        if not subject:
+            return (True, "Subject deleted successfully"), []
+
+        if _conflicts(subject, expected_versions):
+            return (False, VERSION_CONFLICT), []
+            
+        return (True, "Subject deleted successfully"), [
+            _record('delete', 'subject', subject_id)
+        ]
+    return plan
+
+def delete_subject_from_data(subject_id, expected_versions=None):
+    """Delete a subject if it's empty (with `expected_versions`, only if it is at one of them)."""
+    try:
+        return _write(_delete_subject_plan(subject_id, expected_versions), "Error saving changes")
         
     except Exception as e:
         logger.error(f"Error deleting subject: {str(e)}")
         return False, "Internal server error"
 
-def update_topic_details(topic_id, name, text, code, table=None, image=None):
-    """Update topic details."""
-    try:
-        data = load_json('data/subjects.json')
-        found = False
-        
-        # Get current timestamp
-        timestamp = datetime.datetime.utcnow().isoformat() + "Z"
-        
-        # Find and update the topic
-        for subject in data.get('subjects', []):
-            for section in subject.get('sections', []):
-                for topic in section.get('topics', []):
-                    if topic['id'] == topic_id:
-                        topic['name'] = name
-                        topic['updated_at'] = timestamp
-                        topic['details']['text'] = text
-                        topic['details']['code'] = code
-                        topic['details']['table'] = table
-                        topic['details']['image'] = image
-                        topic['details']['updated_at'] = timestamp
-                        found = True
-                        break
-                if found:
-                    break
-            if found:
-                break
-                
-        if not found:
-            return False, "Topic not found"
+def _update_topic_plan(topic_id, name, text, code, table=None, image=None, expected_versions=None):
+    def plan(store):
+        topic = store.get_topic(topic_id)
+        if not topic:
+            return (False, "Topic not found", None), []
+
+        version = entity_version(topic)
+        if _conflicts(topic, expected_versions):
+            return (False, VERSION_CONFLICT, version), []
             
-        if save_json('data/subjects.json', data):
-            invalidate_cache()
-            return True, "Topic updated successfully"
-        return False, "Error saving changes"
+        timestamp = _timestamp()
+        fields = {'name': name, 'updated_at': timestamp, 'version': version + 1}
+        details = {
+            'text': text,
+            'code': code,
+            'table': table,
+            'image': image,
+            'updated_at': timestamp
+        }
+        return (True, "Topic updated successfully", version + 1), [
+            _record('update', 'topic', topic_id, fields, details=details)
+        ]
+    return plan
+
+def update_topic_details(topic_id, name, text, code, table=None, image=None, expected_versions=None):
+    """
+    Update topic details. With `expected_versions`, only if the topic is
+    still at one of those versions. Returns (success, message, version):
+    the version the update produced, or the current one if it was refused.
+    """
+    try:
+        plan = _update_topic_plan(topic_id, name, text, code, table, image, expected_versions)
+        return _write(plan, "Error saving changes", (None,))
         
     except Exception as e:
         logger.error(f"Error updating topic: {str(e)}")
-        return False, "Internal server error"
+        return False, "Internal server error", None
 
-def update_section_details(section_id, name):
-    """Update section details."""
-    try:
-        data = load_json('data/subjects.json')
-        found = False
-        
-        # Get current timestamp
-        timestamp = datetime.datetime.utcnow().isoformat() + "Z"
-        
-        # Find and update the section
-        for subject in data.get('subjects', []):
-            # Check for duplicate name in the same subject
-            if any(s['name'].lower() == name.lower() and s['id'] != section_id 
-                  for s in subject.get('sections', [])):
-                return False, "A section with this name already exists in this subject"
-                
-            for section in subject.get('sections', []):
-                if section['id'] == section_id:
-                    section['name'] = name
-                    section['updated_at'] = timestamp
-                    found = True
-                    break
-            if found:
-                break
-                
-        if not found:
-            return False, "Section not found"
+def _update_section_plan(section_id, name, expected_versions=None):
+    def plan(store):
+        section = store.get_section(section_id)
+        if not section:
+            return (False, "Section not found", None), []
+
+        version = entity_version(section)
+        if _conflicts(section, expected_versions):
+            return (False, VERSION_CONFLICT, version), []
             
-        if save_json('data/subjects.json', data):
-            invalidate_cache()
-            return True, "Section updated successfully"
-        return False, "Error saving changes"
+        # Check for duplicate name in the same subject
+        subject_id = store.section_parent[section_id]
+        if store.section_name_taken(subject_id, name, exclude_id=section_id):
+            return (False, "A section with this name already exists in this subject", version), []
+            
+        fields = {'name': name, 'updated_at': _timestamp(), 'version': version + 1}
+        return (True, "Section updated successfully", version + 1), [
+            _record('update', 'section', section_id, fields)
+        ]
+    return plan
+
+def update_section_details(section_id, name, expected_versions=None):
+    """
+    Update section details. With `expected_versions`, only if the section
+    is still at one of those versions. Returns (success, message, version)
+    like update_topic_details.
+    """
+    try:
+        return _write(_update_section_plan(section_id, name, expected_versions), "Error saving changes", (None,))
         
     except Exception as e:
         logger.error(f"Error updating section: {str(e)}")
-        return False, "Internal server error"
+        return False, "Internal server error", None
 
-def update_subject_details(subject_id, name, description):
-    """Update subject details."""
-    try:
-        data = load_json('data/subjects.json')
-        
+def _update_subject_plan(subject_id, name, description, expected_versions=None):
+    def plan(store):
         # Check for duplicate subject name
-        if any(s['name'].lower() == name.lower() and s['id'] != subject_id 
-              for s in data.get('subjects', [])):
-            return False, "A subject with this name already exists"
-        
-        # Find and update the subject
-        found = False
-        from datetime import datetime
-        timestamp = datetime.utcnow().isoformat() + "Z"
+        if store.subject_name_taken(name, exclude_id=subject_id):
+            return (False, "A subject with this name already exists", None), []
         
-        for subject in data.get('subjects', []):
-            if subject['id'] == subject_id:
-                subject['name'] = name
-                subject['description'] = description
-                subject['updated_at'] = timestamp
-                found = True
-                break
-        
-        if not found:
-            return False, "Subject not found"
+        subject = store.get_subject(subject_id)
+        if not subject:
+            return (False, "Subject not found", None), []
+
+        version = entity_version(subject)
+        if _conflicts(subject, expected_versions):
+            return (False, VERSION_CONFLICT, version), []
             
-        if save_json('data/subjects.json', data):
-            invalidate_cache()
-            return True, "Subject updated successfully"
-        return False, "Error saving changes"
+        fields = {
+            'name': name,
+            'description': description,
+            'updated_at': _timestamp(),
+            'version': version + 1
+        }
+        return (True, "Subject updated successfully", version + 1), [
+            _record('update', 'subject', subject_id, fields)
+        ]
+    return plan
+
+def update_subject_details(subject_id, name, description, expected_versions=None):
+    """
+    Update subject details. With `expected_versions`, only if the subject
+    is still at one of those versions. Returns (success, message, version)
+    like update_topic_details.
+    """
+    try:
+        plan = _update_subject_plan(subject_id, name, description, expected_versions)
+        return _write(plan, "Error saving changes", (None,))
         
     except Exception as e:
         logger.error(f"Error updating subject: {str(e)}")
-        return False, "Internal server error"
+        return False, "Internal server error", None
+
+### Batches ###
+def _batch_plan(operation, context):
+    """
+    Plan for one batch operation. Updates may leave fields out to keep
+    their current values. Results are (success, message, value).
+    """
+    op, kind = operation['op'], operation['type']
+    if op == 'add':
+        return _import_plan(operation, context)
+
+    entity_id = operation['id']
+    expected = {operation['version']} if operation.get('version') is not None else None
 
+    def plan(store):
+        # Deleting what is already gone succeeds on its own, but in a
+        # batch it means the client's picture is stale: fail it
+        entity = getattr(store, f"get_{kind}")(entity_id)
+        if entity is None:
+            return (False, f"{kind.capitalize()} not found", None), []
+        if op == 'delete':
+            inner = {
+                'subject': _delete_subject_plan, 'section': _delete_section_plan, 'topic': _delete_topic_plan
+            }[kind](entity_id, expected)
+            result, records = inner(store)
+            return result + (None,), records
+        name = operation.get('name', entity['name'])
+        if kind == 'subject':
+            description = operation.get('description', entity.get('description', ''))
+            inner = _update_subject_plan(entity_id, name, description, expected)
+        elif kind == 'section':
+            inner = _update_section_plan(entity_id, name, expected)
+        else:
+            details = entity.get('details') or {}
+            payload = [operation[key] if key in operation else details.get(key)
+                       for key in ('text', 'code', 'table', 'image')]
+            inner = _update_topic_plan(entity_id, name, *payload, expected_versions=expected)
+        return inner(store)
+    return plan
+
+def apply_batch(operations):
+    """
+    Apply a list of validated operations in order, all or nothing, with a
+    single write. Each is a dict with 'op' (add, update or delete), 'type'
+    (subject, section or topic) and:
+      add     the fields import_records takes (parents by id or name, or
+              the subject/section most recently added by this batch)
+      update  'id', any of the fields the update_*_details functions take
+      delete  'id'
+    Updates and deletes may carry the 'version' they expect (see
+    entity_version). Returns (committed, results): one (success, message,
+    value) per operation that ran, value being the new id of an add or
+    the new version of an update. When an operation fails, the batch is
+    rolled back and its results end with that failure.
+    """
+    try:
+        context = new_import_context()
+        outcome = _writer.submit_atomic([_batch_plan(operation, context) for operation in operations])
+        if outcome is None:
+            return False, [(False, "Error saving changes", None)]
+        return outcome
+        
+    except Exception as e:
+        logger.error(f"Error applying batch: {str(e)}")
+        return False, [(False, "Internal server error", None)]
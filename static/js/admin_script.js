@@ -8,6 +8,9 @@ class SubjectViewer {
         this.container = document.getElementById('subjectsContainer');
         this.searchInput = document.querySelector('.search-box input');
         this.subjects = [];
+        this.seq = 0;  // last change seen, for /api/changes
+        this.sections = new Map();  // section id -> section
+        this.topics = new Map();  // topic id -> topic
         console.log('SubjectViewer initialized');
         this.showLoading();
     }
@@ -27,19 +30,140 @@ class SubjectViewer {
     async initialize() {
         try {
             this.showLoading();
-            this.subjects = await loadSubjectsData();
+            this.load(await loadSubjectsData());
             if (this.subjects.length === 0) {
                 this.showError('No subjects found');
                 return;
             }
             this.render();
             this.setupEventListeners();
+            this.listen();
         } catch (error) {
             console.error('Failed to initialize:', error);
             this.showError('Failed to load subjects. Please try again later.');
         }
     }
 
+    load(data) {
+        this.subjects = data.subjects;
+        this.seq = data.seq || 0;
+        this.sections.clear();
+        this.topics.clear();
+        this.subjects.forEach(subject => subject.sections.forEach(section => {
+            this.sections.set(section.id, section);
+            section.topics.forEach(topic => this.topics.set(topic.id, topic));
+        }));
+    }
+
+    // Follow edits from other admins and workers pushed over /api/events
+    listen() {
+        if (!window.EventSource) {
+            return;
+        }
+        const source = new EventSource(`/api/events?since=${this.seq}`);
+        const onEvent = (event) => {
+            // Our own edits are usually caught up with already
+            if (Number(event.lastEventId) > this.seq) {
+                clearTimeout(this.refreshTimer);
+                this.refreshTimer = setTimeout(() => refreshSubjectsList(), 100);
+            }
+        };
+        source.addEventListener('change', onEvent);
+        source.addEventListener('resync', onEvent);
+    }
+
+    // One catch-up at a time, so an older answer never lands after a newer one
+    refresh() {
+        this.pending = (this.pending || Promise.resolve())
+            .catch(() => {})
+            .then(() => this.catchUp());
+        return this.pending;
+    }
+
+    // Catch up with /api/changes and re-render only the subjects they touch
+    async catchUp() {
+        const response = await fetch(`/api/changes?since=${this.seq}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! Status: ${response.status}`);
+        }
+        const feed = await response.json();
+        if (feed.resync_required) {
+            console.log('Change history expired, reloading all subjects');
+            this.load(await loadSubjectsData());
+            this.render();
+            return;
+        }
+
+        const hadSubjects = this.subjects.length > 0;
+        const touched = new Set();
+        feed.changes.forEach(change => this.applyChange(change, touched));
+        this.seq = feed.seq;
+        if (!hadSubjects) {
+            this.render();
+            return;
+        }
+        touched.forEach(subjectId => this.renderSubject(subjectId));
+        if (this.searchInput && this.searchInput.value) {
+            this.handleSearch(this.searchInput.value);
+        }
+    }
+
+    applyChange(change, touched) {
+        const { op, kind, id, entity } = change;
+        if (kind === 'subject') {
+            const index = this.subjects.findIndex(subject => subject.id === id);
+            if (op === 'delete') {
+                if (index !== -1) this.subjects.splice(index, 1);
+            } else if (index === -1) {
+                this.subjects.push({ ...entity, sections: [] });
+            } else {
+                Object.assign(this.subjects[index], entity);
+            }
+            touched.add(id);
+        } else if (kind === 'section') {
+            const current = this.sections.get(id);
+            const subjectId = entity ? entity.subject_id : current && current.subject_id;
+            const subject = this.subjects.find(s => s.id === subjectId);
+            if (op === 'delete') {
+                if (current && subject) subject.sections = subject.sections.filter(s => s.id !== id);
+                this.sections.delete(id);
+            } else if (current) {
+                Object.assign(current, entity);
+            } else if (subject) {
+                const section = { ...entity, topics: [] };
+                subject.sections.push(section);
+                this.sections.set(id, section);
+            }
+            touched.add(subjectId);
+        } else if (kind === 'topic') {
+            const current = this.topics.get(id);
+            const section = this.sections.get(entity ? entity.section_id : current && current.section_id);
+            if (op === 'delete') {
+                if (current && section) section.topics = section.topics.filter(t => t.id !== id);
+                this.topics.delete(id);
+            } else if (current) {
+                Object.assign(current, entity);
+            } else if (section) {
+                const topic = { ...entity };
+                section.topics.push(topic);
+                this.topics.set(id, topic);
+            }
+            if (section) touched.add(section.subject_id);
+        }
+    }
+
+    renderSubject(subjectId) {
+        const card = this.container.querySelector(`.subject-card[data-subject-id="${subjectId}"]`);
+        const subject = this.subjects.find(s => s.id === subjectId);
+        if (!subject) {
+            if (card) card.remove();
+        } else if (card) {
+            card.outerHTML = templates.subjectCard(subject);
+        } else {
+            this.container.insertAdjacentHTML('beforeend', templates.subjectCard(subject));
+        }
+    }
+
     render() {
         console.log('Rendering subjects...');
         if (!this.container) {
@@ -81,10 +205,26 @@ class SubjectViewer {
     }
 }
 
+let viewer = null;
+
+// Patch the page with whatever changed since it was loaded
+async function refreshSubjectsList() {
+    if (!viewer) {
+        location.reload();
+        return;
+    }
+    try {
+        await viewer.refresh();
+    } catch (error) {
+        console.error('Failed to refresh subjects:', error);
+        location.reload();
+    }
+}
+
 // Initialize the application
 document.addEventListener('DOMContentLoaded', () => {
     console.log('DOM fully loaded and parsed. Initializing SubjectViewer...');
-    const viewer = new SubjectViewer();
+    viewer = new SubjectViewer();
     viewer.initialize();  // Initialize SubjectViewer
 
     setupLogoutButton();  // Set up the logout button functionality
@@ -245,7 +385,7 @@ window.deleteTopic = async (topicId) => {
                 throw new Error(data.error || 'Failed to delete topic');
             }
 
-            location.reload();
+            await refreshSubjectsList();
         } catch (error) {
             console.error('Failed to delete topic:', error);
             alert(error.message);
@@ -329,7 +469,7 @@ window.deleteSection = async (sectionId) => {
                     throw new Error(deleteData.error || 'Failed to delete section');
                 }
 
-                location.reload();
+                await refreshSubjectsList();
             } catch (error) {
                 console.error('Failed to delete section:', error);
                 showWarningModal(error.message);
@@ -400,7 +540,7 @@ async function loadSubjectsData() {
         const data = JSON.parse(text);
         console.log('Parsed data:', data);
         
-        return data.subjects || [];
+        return { subjects: data.subjects || [], seq: data.seq || 0 };
     } catch (error) {
         console.error('Detailed error:', error);
         throw error;
@@ -804,9 +944,9 @@ window.submitNewSection = async (subjectId) => {
             return;
         }
 
-        // Close modal and refresh page
+        // Close modal and patch in the new section
         bootstrap.Modal.getInstance(document.getElementById('addSectionModal')).hide();
-        location.reload();
+        await refreshSubjectsList();
     } catch (error) {
         console.error('Failed to add section:', error);
         errorDiv.textContent = 'Failed to add section. Please try again.';
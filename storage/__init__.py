@@ -0,0 +1,31 @@
+from .store import SubjectStore, fold_name
+from .journal import Journal
+from .base import StorageBackend
+from .generation import GenerationCounter
+from .json_file import JsonFileStorage, load_json, save_json
+from .sqlite import SqliteStorage
+from .writer import GroupCommitWriter
+from .export import iter_export
+from .blobs import BlobStore, LazyDetails, json_default
+from .entities import Entity, Subject, Section, Topic
+from .changes import ChangeLog
+
+BACKENDS = {
+    JsonFileStorage.name: JsonFileStorage,
+    SqliteStorage.name: SqliteStorage,
+}
+
+def create_storage(backend, *args, **kwargs):
+    """Instantiate a storage backend by its config name ('json' or 'sqlite')."""
+    try:
+        cls = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return cls(*args, **kwargs)
+
+# Storage layer used by models.py
+__all__ = [
+    'SubjectStore', 'fold_name', 'Journal', 'StorageBackend', 'GenerationCounter', 'JsonFileStorage',
+    'SqliteStorage', 'GroupCommitWriter', 'iter_export', 'BlobStore', 'LazyDetails', 'json_default',
+    'Entity', 'Subject', 'Section', 'Topic', 'ChangeLog', 'BACKENDS', 'create_storage', 'load_json', 'save_json'
+]
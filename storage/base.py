@@ -0,0 +1,38 @@
+class StorageBackend:
+    """
+    Persistence interface behind models.py.
+
+    A backend reads the whole tree into a SubjectStore (`load`) and persists
+    batches of mutation records (`write`). Records have the shape used by
+    SubjectStore.apply:
+    {'seq', 'ts', 'op': add|update|delete, 'kind': subject|section|topic,
+     'id', 'parent', 'fields', 'details'}
+    so every add/update/delete models.py exposes maps onto one record.
+    """
+
+    name = None
+
+    def load(self):
+        """Read the full tree and return a SubjectStore."""
+        raise NotImplementedError
+
+    def refresh(self, store):
+        """
+        Bring `store` up to date with writes committed by other processes
+        and return it (or a freshly loaded store).
+        """
+        return self.load()
+
+    def write(self, records):
+        """Durably persist a batch of mutation records, all or nothing."""
+        raise NotImplementedError
+
+    def import_data(self, data):
+        """
+        Replace the stored tree with `data` (subjects.json layout). Only
+        backends that are migrated into implement it (see migrate-json).
+        """
+        raise NotImplementedError
+
+    def after_commit(self, store):
+        """Hook run, under the write lock, after a batch was written."""
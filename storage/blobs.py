@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import time
+from collections.abc import Mapping
+from functools import lru_cache
+from .entities import Entity
+from utils.logger_config import setup_logger
+from utils.metrics import STORAGE_BYTES_READ, STORAGE_BYTES_WRITTEN
+
+logger = setup_logger('storage')
+
+# The heavy part of a topic's details; id, topic_id and timestamps stay inline
+PAYLOAD_KEYS = ('text', 'code', 'table', 'image')
+
+
+class BlobStore:
+    """
+    Content-addressed files holding topic detail payloads, one JSON file per
+    distinct payload under `directory`/<first two hex digits>/<sha256>.json.
+    Identical payloads share a file. Reads go through an LRU of
+    `cache_size` decoded payloads.
+    """
+
+    def __init__(self, directory, cache_size=1024):
+        self.directory = directory
+        self._cached = lru_cache(maxsize=cache_size)(self._read)
+
+    @staticmethod
+    def encode(payload):
+        return json.dumps(
+            {key: payload.get(key) for key in PAYLOAD_KEYS},
+            sort_keys=True, separators=(',', ':')
+        ).encode('utf-8')
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
+
+    def put(self, payload):
+        """Store a payload (a details mapping) and return its digest."""
+        data = self.encode(payload)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_file = f"{path}.{os.getpid()}.tmp"
+            with open(temp_file, 'wb') as f:
+                f.write(data)
+            os.replace(temp_file, path)
+            STORAGE_BYTES_WRITTEN.inc(len(data), file='blob')
+        return digest
+
+    def _read(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            data = f.read()
+        STORAGE_BYTES_READ.inc(len(data), file='blob')
+        return json.loads(data)
+
+    def get(self, digest):
+        """The decoded payload for `digest` ({} if the blob is missing or unreadable)."""
+        try:
+            return self._cached(digest)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading blob {digest}: {str(e)}")
+            return {}
+
+    def collect_garbage(self, referenced, grace=3600):
+        """
+        Delete blobs no longer in `referenced` that are older than `grace`
+        seconds, so a worker still reading an older snapshot is not cut off.
+        """
+        removed = 0
+        cutoff = time.time() - grace
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                digest, ext = os.path.splitext(name)
+                if ext != '.json' or digest in referenced:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        if removed:
+            logger.info("Removed %d unreferenced blobs", removed)
+        return removed
+
+
+class LazyDetails(Mapping):
+    """
+    Read-only stand-in for a topic's details dict whose payload lives in a
+    BlobStore and is only loaded when one of its keys is read. Templates
+    and .get() work on it as on the dict it replaces.
+    """
+
+    __slots__ = ('blobs', 'meta', 'digest')
+
+    def __init__(self, blobs, meta, digest):
+        self.blobs = blobs
+        self.meta = meta
+        self.digest = digest
+
+    def __getitem__(self, key):
+        if key in PAYLOAD_KEYS:
+            return self.blobs.get(self.digest).get(key)
+        return self.meta[key]
+
+    def __iter__(self):
+        yield from self.meta
+        yield from PAYLOAD_KEYS
+
+    def __len__(self):
+        return len(self.meta) + len(PAYLOAD_KEYS)
+
+    def __repr__(self):
+        return f"LazyDetails({self.digest[:12]})"
+
+    def __reduce__(self):
+        # Pickled without its BlobStore; the storage that loads it attaches its own
+        return LazyDetails, (None, self.meta, self.digest)
+
+    def updated(self, changes):
+        """A plain dict of these details with `changes` applied."""
+        if all(key in changes for key in PAYLOAD_KEYS):
+            details = dict(self.meta)
+        else:
+            details = dict(self)
+        details.update(changes)
+        return details
+
+    def reference(self):
+        """The snapshot form: inline metadata plus the blob digest."""
+        return dict(self.meta, blob=self.digest)
+
+
+def json_default(value):
+    """json.dumps `default=` hook for entities, and LazyDetails written out in full."""
+    if isinstance(value, (Entity, LazyDetails)):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
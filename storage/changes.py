@@ -0,0 +1,64 @@
+import threading
+from collections import deque
+
+
+class ChangeLog:
+    """
+    The last `size` mutation records applied to the resident store, as
+    (seq, op, kind, id), kept by a change listener. Every worker sees every
+    record (its own commits and the ones it replays from others), so any
+    worker can tell a client what changed after the seq it last saw.
+    """
+
+    def __init__(self, size=10000):
+        self._entries = deque(maxlen=size)
+        self._floor = None  # seq before the oldest entry still held
+        self._store = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def on_change(self, store, record, subject_id):
+        """Change listener: remember one record, or cope with a rollback or reload."""
+        with self._lock:
+            if record is not None and record['op'] == 'undo':
+                # Rolled back newest first, so it is the last one held
+                if self._entries and self._entries[-1][0] == record['seq']:
+                    self._entries.pop()
+                return
+            if record is not None:
+                if len(self._entries) == self._entries.maxlen:
+                    self._floor = self._entries[0][0]
+                self._entries.append((record['seq'], record['op'], record['kind'], record['id']))
+                self._changed.notify_all()
+                return
+            if self._store is None or store.seq != self._last_seq():
+                # A full load; whatever happened in between is unknown
+                self._entries.clear()
+                self._floor = store.seq
+            self._store = store
+            self._changed.notify_all()
+
+    def _last_seq(self):
+        return self._entries[-1][0] if self._entries else self._floor
+
+    def since(self, seq):
+        """
+        The entries after `seq`, oldest first, or None when some of them
+        are no longer held (or `seq` is ahead of this history).
+        """
+        with self._lock:
+            if self._floor is None or seq < self._floor or seq > self._last_seq():
+                return None
+            # Newest first, so the walk is as long as the answer
+            entries = []
+            for entry in reversed(self._entries):
+                if entry[0] <= seq:
+                    break
+                entries.append(entry)
+            entries.reverse()
+            return entries
+
+    def wait(self, seq, timeout):
+        """Wait up to `timeout` seconds for the history to move on from `seq`."""
+        with self._changed:
+            self._changed.wait_for(lambda: self._last_seq() != seq, timeout)
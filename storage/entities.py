@@ -0,0 +1,188 @@
+import sys
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def pack_time(value):
+    """
+    Compact form of a timestamp field. Timestamps the way the app writes
+    them ('2024-03-14T10:30:00Z', with microseconds when non-zero) become
+    int microseconds since the epoch; any other string is kept as is, and
+    other values are wrapped in a 1-tuple so they are not mistaken for
+    packed ones.
+    """
+    if type(value) is str:
+        return _pack_string(value)
+    if value is None:
+        return None
+    return (value,)
+
+
+# An entity's timestamps, and its details', are usually the same string
+@lru_cache(maxsize=4096)
+def _pack_string(value):
+    if value[-1:] == 'Z':
+        try:
+            moment = datetime.fromisoformat(value[:-1])
+        except ValueError:
+            return value
+        # Only forms that render back to exactly the same string
+        if moment.tzinfo is None and moment.isoformat() + 'Z' == value:
+            return (moment - _EPOCH) // _MICROSECOND
+    return value
+
+
+def unpack_time(value):
+    """The original field value for a `pack_time` result."""
+    if type(value) is int:
+        return (_EPOCH + timedelta(microseconds=value)).isoformat() + 'Z'
+    if type(value) is tuple:
+        return value[0]
+    return value
+
+
+class Entity(MutableMapping):
+    """
+    A subject, section or topic held in fixed slots instead of a dict.
+
+    Entities behave as the dicts of the subjects.json layout they are
+    built from: item access, .get(), .items(), .update() and membership
+    work on the JSON keys, and so does attribute access in templates
+    (subject.name, topic.details, subject.created_at). Timestamps are kept
+    packed (see pack_time), names are interned, and keys outside the
+    schema land in `extra`, so converting back with dict() is lossless.
+    """
+
+    __slots__ = ('extra',)
+
+    KEYS = ()  # JSON keys held in slots, in snapshot order
+    CHILDREN = None  # key of the child list, if any
+    TIME_KEYS = ('created_at', 'updated_at')
+    _SLOTS = {}  # JSON key -> slot name, built per subclass
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._SLOTS = {key: '_' + key if key in cls.TIME_KEYS else key for key in cls.KEYS}
+
+    def __init__(self, data=()):
+        # Inlined __setitem__: this runs for every entity of a JSON load
+        self.extra = None
+        slots = self._SLOTS
+        for key, value in (data if type(data) is dict else dict(data)).items():
+            slot = slots.get(key)
+            if slot is None:
+                self[key] = value
+            elif slot[0] == '_':
+                setattr(self, slot, pack_time(value))
+            else:
+                setattr(self, slot, value)
+        name = getattr(self, 'name', None)
+        if type(name) is str:
+            self.name = sys.intern(name)
+
+    @classmethod
+    def coerce(cls, data):
+        """Return `data` as an instance of this class (entities pass through)."""
+        return data if type(data) is cls else cls(data)
+
+    def __getitem__(self, key):
+        slot = self._SLOTS.get(key)
+        if slot is None:
+            if self.extra is not None and key in self.extra:
+                return self.extra[key]
+            raise KeyError(key)
+        try:
+            value = getattr(self, slot)
+        except AttributeError:
+            raise KeyError(key) from None
+        return unpack_time(value) if slot[0] == '_' else value
+
+    def __setitem__(self, key, value):
+        slot = self._SLOTS.get(key)
+        if slot is None:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        elif slot[0] == '_':
+            setattr(self, slot, pack_time(value))
+        elif key == 'name' and type(value) is str:
+            self.name = sys.intern(value)
+        else:
+            setattr(self, slot, value)
+
+    def __delitem__(self, key):
+        slot = self._SLOTS.get(key)
+        if slot is None:
+            if self.extra is None or key not in self.extra:
+                raise KeyError(key)
+            del self.extra[key]
+            return
+        try:
+            delattr(self, slot)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        for key, slot in self._SLOTS.items():
+            if hasattr(self, slot):
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({getattr(self, 'id', None)!r}, {getattr(self, 'name', None)!r})"
+
+    # Mutable records, not values: compare and hash by identity
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    @property
+    def created_at(self):
+        return self.get('created_at')
+
+    @property
+    def updated_at(self):
+        return self.get('updated_at')
+
+    @property
+    def updated_epoch(self):
+        """Epoch seconds of updated_at, or None if it is not a packed timestamp."""
+        value = getattr(self, '_updated_at', None)
+        return value / 1_000_000 if type(value) is int else None
+
+    def to_dict(self):
+        """The subjects.json form, children included."""
+        data = dict(self)
+        if self.CHILDREN in data:
+            data[self.CHILDREN] = [child.to_dict() for child in data[self.CHILDREN]]
+        return data
+
+
+class Subject(Entity):
+    __slots__ = ('id', 'name', 'description', '_created_at', '_updated_at', 'version', 'sections')
+    KEYS = ('id', 'name', 'description', 'created_at', 'updated_at', 'version', 'sections')
+    CHILDREN = 'sections'
+
+
+class Section(Entity):
+    __slots__ = ('id', 'subject_id', 'name', '_created_at', '_updated_at', 'version', 'topics')
+    KEYS = ('id', 'subject_id', 'name', 'created_at', 'updated_at', 'version', 'topics')
+    CHILDREN = 'topics'
+
+
+class Topic(Entity):
+    __slots__ = ('id', 'section_id', 'name', '_created_at', '_updated_at', 'version', 'details')
+    KEYS = ('id', 'section_id', 'name', 'created_at', 'updated_at', 'version', 'details')
+
+
+class DetailsMeta(Entity):
+    """The inline part of a topic's details when its payload lives in a blob."""
+    __slots__ = ('id', 'topic_id', '_created_at', '_updated_at')
+    KEYS = ('id', 'topic_id', 'created_at', 'updated_at')
@@ -0,0 +1,93 @@
+import json
+from .blobs import json_default
+
+CHUNK_BYTES = 64 * 1024
+
+FORMATS = ('json', 'ndjson')
+
+
+def _open_object(entity, child_key):
+    """`entity` as JSON, left open inside its (empty) child list."""
+    fields = {key: value for key, value in entity.items() if key != child_key}
+    head = json.dumps(fields)[:-1]
+    return head + (', ' if fields else '') + json.dumps(child_key) + ': ['
+
+
+def _json_pieces(store):
+    yield '{"subjects": ['
+    with store.lock:
+        subjects = list(store.subjects)
+    for i, subject in enumerate(subjects):
+        with store.lock:
+            head = _open_object(subject, 'sections')
+            sections = list(subject['sections'])
+        yield (', ' if i else '') + head
+        for j, section in enumerate(sections):
+            with store.lock:
+                head = _open_object(section, 'topics')
+                topics = list(section['topics'])
+            yield (', ' if j else '') + head
+            for k, topic in enumerate(topics):
+                with store.lock:
+                    encoded = json.dumps(topic, default=json_default)
+                yield (', ' if k else '') + encoded
+            yield ']}'
+        yield ']}'
+    yield ']}\n'
+
+
+def _ndjson_pieces(store):
+    with store.lock:
+        subjects = list(store.subjects)
+    for subject in subjects:
+        with store.lock:
+            fields = {key: value for key, value in subject.items() if key != 'sections'}
+            sections = list(subject['sections'])
+        yield json.dumps(dict(fields, type='subject')) + '\n'
+        for section in sections:
+            with store.lock:
+                fields = {key: value for key, value in section.items()
+                          if key not in ('topics', 'subject_id')}
+                topics = list(section['topics'])
+            yield json.dumps(dict(fields, type='section')) + '\n'
+            for topic in topics:
+                with store.lock:
+                    fields = {key: value for key, value in topic.items()
+                              if key not in ('details', 'section_id')}
+                    details = topic.get('details') or {}
+                    for key in ('text', 'code', 'table', 'image'):
+                        fields[key] = details.get(key)
+                    encoded = json.dumps(dict(fields, type='topic'))
+                yield encoded + '\n'
+
+
+def iter_export(store, fmt='json', chunk_bytes=CHUNK_BYTES):
+    """
+    Serialise the store incrementally, yielding strings of roughly
+    `chunk_bytes`.
+
+    'json' produces the {"subjects": [...]} document GET /api/subjects
+    returns. 'ndjson' produces one subject, section or topic object per
+    line, in tree order, in the format POST /api/import reads back: parent
+    ids are left out, since order already places each entity, and topic
+    details are flattened into text/code/table/image.
+
+    Only one entity is encoded at a time, under the store lock, so writers
+    are never held up for the whole export and memory stays flat however
+    large the notebook is. Entities added or removed while the export runs
+    may or may not be included.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    pieces = _json_pieces(store) if fmt == 'json' else _ndjson_pieces(store)
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_bytes:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
@@ -0,0 +1,48 @@
+import mmap
+import os
+import struct
+from utils.file_lock import FileLock
+
+_COUNTER = struct.Struct('<Q')
+
+
+class GenerationCounter:
+    """
+    A 64-bit counter in a small memory-mapped sidecar file, shared by every
+    process on the host. Writers bump it after each commit; readers compare
+    it with the generation their in-memory copy was built at, which costs a
+    memory read instead of a stat() or a parse.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < _COUNTER.size:
+                os.ftruncate(fd, _COUNTER.size)
+            self._map = mmap.mmap(fd, _COUNTER.size)
+        finally:
+            os.close(fd)
+
+    def value(self):
+        return _COUNTER.unpack_from(self._map)[0]
+
+    def bump(self):
+        """Atomically increment the counter; returns (old, new)."""
+        with open(self.path, 'r+b') as f:
+            lock = FileLock(f)
+            lock.acquire(blocking=True)
+            try:
+                old = self.value()
+                _COUNTER.pack_into(self._map, 0, old + 1)
+            finally:
+                lock.release()
+        return old, old + 1
+
+    def advance(self, value):
+        """
+        Raise the counter to `value` if it is lower. Not locked: callers
+        serialise through a lock of their own (the write lock).
+        """
+        if value > self.value():
+            _COUNTER.pack_into(self._map, 0, value)
@@ -0,0 +1,96 @@
+import json
+import os
+from utils.logger_config import setup_logger
+from utils.metrics import STORAGE_SECONDS, STORAGE_BYTES_READ, STORAGE_BYTES_WRITTEN
+
+logger = setup_logger('storage')
+
+
+class Journal:
+    """
+    Append-only write-ahead log of mutation records, one compact JSON object
+    per line. Every append is flushed and fsynced before it returns, so a
+    record that was acknowledged survives a crash.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        self.count = 0
+
+    def _open(self):
+        if self._file is not None:
+            # Another process may have rotated the file away from under us
+            try:
+                current = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current != os.fstat(self._file.fileno()).st_ino:
+                self.close()
+                self.count = 0
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+            # A torn final line from a crash must not swallow the next record
+            if self._file.tell() > 0:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        self._file.write(b'\n')
+        return self._file
+
+    def append(self, records):
+        """Write records and fsync. Returns the number of bytes written."""
+        payload = b''.join(
+            json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+            for record in records
+        )
+        with STORAGE_SECONDS.time(op='journal_append'):
+            f = self._open()
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.size = f.tell()
+        STORAGE_BYTES_WRITTEN.inc(len(payload), file='journal')
+        self.count += len(records)
+        return len(payload)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def rotate(self, target):
+        """Move the current journal aside to `target` and start an empty one."""
+        self.close()
+        if os.path.exists(self.path):
+            os.replace(self.path, target)
+        self.size = 0
+        self.count = 0
+
+    @staticmethod
+    def read_from(path, offset=0):
+        """
+        Read complete records appended after byte `offset`.
+        Returns (records, end_offset, inode), or None if the file is missing.
+        A trailing line that is still being written is left for next time.
+        """
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            inode = os.fstat(f.fileno()).st_ino
+            f.seek(offset)
+            chunk = f.read()
+        STORAGE_BYTES_READ.inc(len(chunk), file='journal')
+        end = chunk.rfind(b'\n') + 1
+        records = []
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Skipping unreadable journal line in {path}")
+        return records, offset + end, inode
@@ -0,0 +1,511 @@
+import json
+import os
+import threading
+from utils.file_lock import FileLock
+from utils.logger_config import setup_logger
+from utils.metrics import STORAGE_SECONDS, STORAGE_BYTES_READ, STORAGE_BYTES_WRITTEN
+from .base import StorageBackend
+from .blobs import BlobStore, LazyDetails, PAYLOAD_KEYS, json_default
+from .entities import DetailsMeta
+from .journal import Journal
+from .snapshot import binary_path, encode_snapshot, load_binary_snapshot, save_binary_snapshot, source_stamp
+from .store import SubjectStore
+
+logger = setup_logger('storage')
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def load_json(file_name):
+    """Helper function to load data from a JSON file."""
+    try:
+        logger.debug("Attempting to load JSON file: %s", file_name)
+        with open(file_name, 'r') as f, STORAGE_SECONDS.time(op='load_json'):
+            data = json.load(f)
+            STORAGE_BYTES_READ.inc(os.fstat(f.fileno()).st_size, file='snapshot')
+            logger.info("Successfully loaded JSON file: %s", file_name)
+            return data
+    except FileNotFoundError:
+        logger.error(f"File not found: {file_name}")
+        return {}
+    except json.JSONDecodeError:
+        logger.error(f"JSON decoding error in file: {file_name}")
+        return {}
+    except Exception:
+        logger.exception("Unexpected error occurred while loading JSON")
+        return {}
+
+
+def save_json(file_name, data):
+    """
+    Helper function to save data to a JSON file. `data` may be a dict or an
+    already serialised string. The file is replaced atomically.
+    """
+    temp_file = f"{file_name}.tmp"
+    try:
+        logger.debug("Attempting to save JSON file: %s", file_name)
+        if isinstance(data, str):
+            payload = data
+        else:
+            with STORAGE_SECONDS.time(op='dump_json'):
+                payload = json.dumps(data, indent=4, default=json_default)
+        with STORAGE_SECONDS.time(op='save_json'):
+            with open(temp_file, 'w') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, file_name)
+        STORAGE_BYTES_WRITTEN.inc(len(payload), file='snapshot')
+        logger.info("Successfully saved JSON file: %s", file_name)
+        return True
+    except Exception as e:
+        logger.error(f"Error saving JSON file: {str(e)}")
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        return False
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class JsonFileStorage(StorageBackend):
+    """
+    subjects.json snapshot plus a write-ahead journal next to it.
+
+    Mutations are appended to the journal as single records; the snapshot is
+    only rewritten by a background compaction once the journal grows past
+    `compact_bytes` or `compact_records` and has reached `compact_ratio` of
+    the snapshot's size, so rewriting a large snapshot is paid for by
+    proportionally many records. On load the journal is replayed
+    over the snapshot, skipping records the snapshot already contains.
+
+    With a `blob_dir`, compaction moves each topic's text/code/table/image
+    into a content-addressed BlobStore and the snapshot keeps only a
+    digest; loaded topics get LazyDetails that read the blob on first use.
+
+    With `binary_snapshot`, every snapshot also gets a pickled copy next to
+    it (see storage.snapshot) that loads without parsing JSON. It is only
+    used while it matches the JSON file, which stays the canonical copy.
+
+    With a `shard_dir`, the snapshot is split into one file per subject
+    plus a manifest listing them in order with the id counters (see
+    _load_shards). Compaction then only rewrites the shards of subjects
+    changed since the last manifest. An existing single-file snapshot at
+    `path` is only converted by split(); until then it stays in use as it
+    is. The journal keeps its name either way.
+    """
+
+    name = 'json'
+
+    def __init__(self, path, compact_bytes=1024 * 1024, compact_records=1000,
+                 compact_ratio=0.25, blob_dir=None, blob_cache_size=1024, blob_gc_grace=3600,
+                 binary_snapshot=True, shard_dir=None):
+        self.path = path
+        self.shard_dir = shard_dir
+        # The file the binary copy mirrors: the manifest when sharded
+        self.snapshot_path = os.path.join(shard_dir, MANIFEST_NAME) if shard_dir else path
+        self.journal_path = f"{path}.journal"
+        self.pending_path = f"{path}.journal.compacting"
+        self.compact_bytes = compact_bytes
+        self.compact_records = compact_records
+        self.compact_ratio = compact_ratio
+        self.compact_lock_path = f"{path}.compact.lock"
+        self.journal = Journal(self.journal_path)
+        self.blobs = BlobStore(blob_dir, blob_cache_size) if blob_dir else None
+        self.blob_gc_grace = blob_gc_grace
+        self.binary_snapshot = binary_snapshot
+
+    def load(self):
+        """Build a SubjectStore from the snapshot and replay the journal."""
+        if self.shard_dir and not os.path.exists(self.snapshot_path) and os.path.exists(self.path):
+            logger.warning(f"{self.path} has not been split into {self.shard_dir} "
+                           f"(see `flask split-json`); using it as a single file")
+            self.shard_dir = None
+            self.snapshot_path = self.path
+        store = self._load_snapshot(backfill=True)
+        replayed = 0
+        for path in (self.pending_path, self.journal_path):
+            result = Journal.read_from(path)
+            if result is None:
+                continue
+            records, offset, inode = result
+            replayed += self._replay(store, records)
+            if path == self.journal_path:
+                store.sync_state = (inode, offset)
+        if store.sync_state is None:
+            store.sync_state = self._journal_start()
+        self.journal.count = replayed
+        if replayed:
+            logger.info("Replayed %d journal records over %s", replayed, self.path)
+        return store
+
+    def _load_snapshot(self, backfill=False):
+        """A SubjectStore holding the snapshot alone, without the journal."""
+        data = load_binary_snapshot(self.snapshot_path) if self.binary_snapshot else None
+        from_binary = data is not None
+        if from_binary:
+            store = SubjectStore(data)
+        else:
+            stamp = source_stamp(self.snapshot_path)
+            data = self._load_shards() if self.shard_dir else load_json(self.path)
+            store = SubjectStore(data if isinstance(data, dict) else {})
+        self._attach_blobs(store)
+        if backfill and data and not from_binary and self.binary_snapshot and stamp is not None:
+            # First load since the JSON was written without its binary copy
+            self._backfill_binary(store, stamp)
+        return store
+
+    @staticmethod
+    def _replay(store, records):
+        """Apply the records `store` does not have yet; returns how many were applied."""
+        replayed = 0
+        for record in records:
+            if record.get('seq', 0) <= store.seq:
+                continue
+            try:
+                store.apply(record)
+                replayed += 1
+            except Exception as e:
+                logger.error(f"Skipping journal record {record.get('seq')}: {str(e)}")
+        return replayed
+
+    def refresh(self, store):
+        """
+        Apply the records other processes appended since `store` last read
+        the journal. Falls back to a full load when records were compacted
+        away before this process saw them.
+        """
+        position = store.sync_state
+        try:
+            current = os.stat(self.journal_path).st_ino
+        except FileNotFoundError:
+            current = None
+
+        records = []
+        if position and position[0] == current:
+            result = Journal.read_from(self.journal_path, position[1])
+            if result is None:
+                return self.load()
+            records, offset, inode = result
+        else:
+            if position:
+                # Our journal was rotated aside; finish it before the new one
+                try:
+                    pending = os.stat(self.pending_path).st_ino
+                except FileNotFoundError:
+                    pending = None
+                if pending != position[0]:
+                    return self.load()
+                records = Journal.read_from(self.pending_path, position[1])[0]
+            result = Journal.read_from(self.journal_path) if current else None
+            if result:
+                records.extend(result[0])
+                offset, inode = result[1], result[2]
+            else:
+                inode, offset = self._journal_start()
+
+        for record in records:
+            # Seqs of rolled back batches are skipped, so gaps are expected
+            if record['seq'] <= store.seq:
+                continue
+            store.apply(record)
+        store.sync_state = (inode, offset)
+        return store
+
+    def _journal_start(self):
+        """
+        Bookmark the start of the journal, creating an empty one if there
+        is none. Without a bookmark, refresh() could not tell that records
+        written after it were compacted away before it read them.
+        """
+        with open(self.journal_path, 'ab') as f:
+            return (os.fstat(f.fileno()).st_ino, 0)
+
+    def write(self, records):
+        self.journal.append(records)
+
+    def after_commit(self, store):
+        self.maybe_compact(store)
+
+    def maybe_compact(self, store):
+        """
+        Fold the journal into a new snapshot once it passes a threshold.
+        Only the journal is rotated here, under the write lock; everything
+        up to store.seq is then in the snapshot and the rotated file, and a
+        background thread builds the new snapshot from those two (see
+        _compact), leaving the live store to the writers.
+        """
+        if (self.journal.size < self.compact_bytes
+                and self.journal.count < self.compact_records):
+            return
+        # Held until the snapshot lands, so only one process compacts at a
+        # time and the manifest read below is the one being replaced
+        lock_file = open(self.compact_lock_path, 'a+b')
+        lock = FileLock(lock_file)
+        if not lock.acquire():
+            lock_file.close()
+            return
+        try:
+            manifest = self._read_manifest() if self.shard_dir else None
+            if self.journal.size < self._rewrite_size(store, manifest) * self.compact_ratio:
+                lock.release()
+                lock_file.close()
+                return
+            # A leftover pending file from a failed compaction is still
+            # needed until a snapshot lands; keep appending to the journal.
+            if not os.path.exists(self.pending_path):
+                self.journal.rotate(self.pending_path)
+        except Exception as e:
+            lock.release()
+            lock_file.close()
+            logger.error(f"Error starting journal compaction: {str(e)}")
+            return
+        # Not a daemon: interpreter exit waits for the snapshot to land
+        threading.Thread(target=self._compact, args=(manifest, lock, lock_file)).start()
+
+    def _compact(self, manifest, lock, lock_file):
+        """
+        Write the snapshot with the pending journal replayed over it. The
+        tree is read back from disk rather than copied from the live store,
+        so it is exactly the state at the rotation, and externalising,
+        serialising and writing it never hold up a writer.
+        """
+        try:
+            store = self._load_snapshot()
+            result = Journal.read_from(self.pending_path)
+            if result is not None:
+                self._replay(store, result[0])
+            referenced = self._externalize_details(store)
+            shards = None
+            with STORAGE_SECONDS.time(op='dump_json'):
+                if manifest is None:
+                    payload = json.dumps(store.to_dict(), indent=4, default=self._snapshot_default)
+                else:
+                    entries, shards = self._dump_changed_shards(store, manifest)
+                    payload = self._manifest_payload(entries, store.next_ids, store.seq)
+                    keep = self._listed(manifest.get('subjects', [])) | self._listed(entries)
+            binary = encode_snapshot(store) if self.binary_snapshot else None
+            del store
+            if referenced is not None and hasattr(os, 'sync'):
+                # Blobs the new snapshot points at must hit the disk first
+                os.sync()
+            if shards is not None and not self._write_shard_files(shards):
+                return
+            if save_json(self.snapshot_path, payload):
+                if binary is not None:
+                    save_binary_snapshot(self.snapshot_path, binary, source_stamp(self.snapshot_path))
+                if os.path.exists(self.pending_path):
+                    os.remove(self.pending_path)
+                if referenced is not None:
+                    self.blobs.collect_garbage(referenced, self.blob_gc_grace)
+                if shards is not None:
+                    self._collect_shards(keep)
+        except Exception as e:
+            logger.error(f"Error compacting journal: {str(e)}")
+        finally:
+            lock.release()
+            lock_file.close()
+
+    def _backfill_binary(self, store, stamp):
+        """Write the binary copy of a snapshot that was just loaded from JSON."""
+        lock_file = open(self.compact_lock_path, 'a+b')
+        lock = FileLock(lock_file)
+        # A compaction in progress is about to replace both files anyway
+        if not lock.acquire():
+            lock_file.close()
+            return
+        try:
+            if source_stamp(self.snapshot_path) == stamp:
+                save_binary_snapshot(self.snapshot_path, encode_snapshot(store), stamp)
+        except Exception as e:
+            logger.error(f"Error writing binary snapshot: {str(e)}")
+        finally:
+            lock.release()
+            lock_file.close()
+
+    ### Subject shards ###
+    def _read_manifest(self):
+        """
+        The shard manifest, or {} before the first one is written:
+        {"subjects": [{"id", "file", "bytes"}, ...], "next_ids", "journal_seq"}
+        with the subjects in snapshot order.
+        """
+        if not os.path.exists(self.snapshot_path):
+            return {}
+        manifest = load_json(self.snapshot_path)
+        return manifest if isinstance(manifest, dict) else {}
+
+    def _load_shards(self):
+        """The subjects.json layout assembled from the manifest and its shards."""
+        manifest = self._read_manifest()
+        subjects = []
+        with STORAGE_SECONDS.time(op='load_shards'):
+            for entry in manifest.get('subjects', []):
+                try:
+                    with open(os.path.join(self.shard_dir, entry['file']), 'rb') as f:
+                        data = f.read()
+                    STORAGE_BYTES_READ.inc(len(data), file='shard')
+                    subjects.append(json.loads(data))
+                except (OSError, ValueError) as e:
+                    logger.error(f"Error loading shard {entry['file']}: {str(e)}")
+        return dict(manifest, subjects=subjects) if manifest else {}
+
+    @staticmethod
+    def _dump_shard(subject, seq, default):
+        """Serialise one subject; returns its manifest entry and (file name, text)."""
+        name = f"subject-{subject['id']}-{seq}.json"
+        text = json.dumps(subject, indent=4, default=default)
+        return {'id': subject['id'], 'file': name, 'bytes': len(text)}, (name, text)
+
+    @staticmethod
+    def _manifest_payload(entries, next_ids, seq):
+        return json.dumps({'subjects': entries, 'next_ids': dict(next_ids), 'journal_seq': seq}, indent=4)
+
+    @staticmethod
+    def _listed(entries):
+        return {entry['file'] for entry in entries}
+
+    @staticmethod
+    def _changed_subjects(store, manifest):
+        """Subjects without a shard in `manifest` or changed by a record it does not cover."""
+        listed = {entry['id'] for entry in manifest.get('subjects', [])}
+        covered = manifest.get('journal_seq', 0)
+        return [
+            subject for subject in store.subjects
+            if subject.id not in listed or store.subject_versions.get(subject.id, 0) > covered
+        ]
+
+    def _rewrite_size(self, store, manifest):
+        """
+        Bytes a compaction would rewrite: the whole snapshot, or with
+        shards just the changed ones plus the binary copy.
+        """
+        if manifest is None:
+            return _file_size(self.path)
+        sizes = {entry['id']: entry.get('bytes', 0) for entry in manifest.get('subjects', [])}
+        size = sum(sizes.get(subject.id, 0) for subject in self._changed_subjects(store, manifest))
+        if self.binary_snapshot:
+            size += _file_size(binary_path(self.snapshot_path))
+        return size
+
+    def _dump_changed_shards(self, store, manifest):
+        """Manifest entries for the store's subjects, and the shards that need writing."""
+        previous = {entry['id']: entry for entry in manifest.get('subjects', [])}
+        changed = {subject.id for subject in self._changed_subjects(store, manifest)}
+        entries, shards = [], []
+        for subject in store.subjects:
+            if subject.id in changed:
+                entry, shard = self._dump_shard(subject, store.seq, self._snapshot_default)
+                shards.append(shard)
+            else:
+                entry = previous[subject.id]
+            entries.append(entry)
+        return entries, shards
+
+    def _write_shard_files(self, shards):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        return all(save_json(os.path.join(self.shard_dir, name), text) for name, text in shards)
+
+    def _collect_shards(self, keep):
+        """
+        Delete shard files not in `keep`. Callers keep the shards of the
+        manifest being replaced as well, so a load that read it just before
+        still finds them.
+        """
+        for name in os.listdir(self.shard_dir):
+            if name.startswith('subject-') and name.endswith('.json') and name not in keep:
+                try:
+                    os.remove(os.path.join(self.shard_dir, name))
+                except OSError:
+                    continue
+
+    def _save_shards(self, data):
+        """Write `data` (subjects.json layout) as a full set of shards and their manifest."""
+        previous = self._read_manifest()
+        seq = data.get('journal_seq', 0)
+        entries, shards = [], []
+        for subject in data.get('subjects', []):
+            entry, shard = self._dump_shard(subject, seq, json_default)
+            entries.append(entry)
+            shards.append(shard)
+        payload = self._manifest_payload(entries, data.get('next_ids') or {}, seq)
+        if not self._write_shard_files(shards) or not save_json(self.snapshot_path, payload):
+            return False
+        self._collect_shards(self._listed(previous.get('subjects', [])) | self._listed(entries))
+        return True
+
+    def split(self):
+        """
+        One-time split of the single-file snapshot at `path` into shards
+        under `shard_dir`. The original is kept as `path`.migrated; the
+        journal carries on. Returns the number of subjects split, or None
+        if there was nothing to split or it failed. Run it while no worker
+        is using `path`.
+        """
+        lock_file = open(self.compact_lock_path, 'a+b')
+        lock = FileLock(lock_file)
+        lock.acquire(blocking=True)
+        try:
+            if os.path.exists(self.snapshot_path) or not os.path.exists(self.path):
+                return None
+            data = load_json(self.path)
+            if not isinstance(data, dict) or 'subjects' not in data:
+                logger.error(f"Not splitting {self.path}: no subjects found in it")
+                return None
+            if not self._save_shards(data):
+                logger.error(f"Could not split {self.path} into shards")
+                return None
+            os.replace(self.path, f"{self.path}.migrated")
+            if os.path.exists(binary_path(self.path)):
+                os.remove(binary_path(self.path))
+            logger.info("Split %s into %d subject shards under %s",
+                        self.path, len(data['subjects']), self.shard_dir)
+            return len(data['subjects'])
+        except Exception as e:
+            logger.error(f"Error splitting {self.path} into shards: {str(e)}")
+            return None
+        finally:
+            lock.release()
+            lock_file.close()
+
+    ### Topic detail blobs ###
+    def _attach_blobs(self, store):
+        """Swap the snapshot's blob references for LazyDetails reading our BlobStore."""
+        if self.blobs is None:
+            return
+        for topic in store.topic_by_id.values():
+            details = topic.get('details')
+            if isinstance(details, LazyDetails):
+                # Unpickled from the binary snapshot
+                details.blobs = self.blobs
+            elif isinstance(details, dict) and 'blob' in details:
+                meta = DetailsMeta((key, value) for key, value in details.items() if key != 'blob')
+                topic['details'] = LazyDetails(self.blobs, meta, details['blob'])
+
+    def _externalize_details(self, store):
+        """
+        Move every inline details payload into the blob store (the store's
+        copy becomes LazyDetails) and return the set of digests in use, or
+        None without a blob store.
+        """
+        if self.blobs is None:
+            return None
+        referenced = set()
+        for topic in store.topic_by_id.values():
+            details = topic.get('details')
+            if isinstance(details, dict):
+                meta = DetailsMeta((key, value) for key, value in details.items() if key not in PAYLOAD_KEYS)
+                details = topic['details'] = LazyDetails(self.blobs, meta, self.blobs.put(details))
+            if isinstance(details, LazyDetails):
+                referenced.add(details.digest)
+        return referenced
+
+    @staticmethod
+    def _snapshot_default(value):
+        if isinstance(value, LazyDetails):
+            return value.reference()
+        return json_default(value)
@@ -0,0 +1,101 @@
+import os
+import pickle
+import struct
+import zlib
+from utils.logger_config import setup_logger
+from utils.metrics import STORAGE_SECONDS, STORAGE_BYTES_READ, STORAGE_BYTES_WRITTEN
+
+logger = setup_logger('storage')
+
+MAGIC = b'NBSNAP\r\n'
+FORMAT_VERSION = 2  # bump when the pickled classes change shape
+# magic, format version, size / mtime_ns / inode of the JSON snapshot it
+# mirrors, payload length, CRC-32 of the payload
+_HEADER = struct.Struct('<8sHQqQQI')
+
+
+def binary_path(path):
+    """Where the binary copy of the JSON snapshot at `path` lives."""
+    return f"{path}.bin"
+
+
+def source_stamp(path):
+    """Identity of the JSON snapshot a binary copy was made from, or None if it is missing."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def encode_snapshot(store):
+    """
+    Pickle (protocol 5) the store's tree in the subjects.json layout. The
+    entities go in as they are, so loading it skips the timestamp parsing
+    and name interning a JSON load does.
+    """
+    with STORAGE_SECONDS.time(op='dump_binary'):
+        return pickle.dumps({
+            'subjects': store.subjects,
+            'next_ids': dict(store.next_ids),
+            'journal_seq': store.seq
+        }, protocol=5)
+
+
+def save_binary_snapshot(path, payload, stamp):
+    """
+    Atomically write `payload` as the binary copy of the JSON snapshot at
+    `path`, whose current identity is `stamp`. Returns True on success.
+    """
+    target = binary_path(path)
+    temp_file = f"{target}.{os.getpid()}.tmp"
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, stamp[0], stamp[1], stamp[2],
+                          len(payload), zlib.crc32(payload))
+    try:
+        with STORAGE_SECONDS.time(op='save_binary'):
+            with open(temp_file, 'wb') as f:
+                f.write(header)
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, target)
+        STORAGE_BYTES_WRITTEN.inc(len(header) + len(payload), file='binary_snapshot')
+        return True
+    except OSError as e:
+        logger.error(f"Error saving binary snapshot: {str(e)}")
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        return False
+
+
+def load_binary_snapshot(path):
+    """
+    The snapshot data from the binary copy of the JSON snapshot at `path`,
+    or None when there is no copy, it was made from a different JSON file,
+    or its version or checksum do not match.
+    """
+    stamp = source_stamp(path)
+    if stamp is None:
+        return None
+    try:
+        with open(binary_path(path), 'rb') as f, STORAGE_SECONDS.time(op='load_binary'):
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return None
+            magic, version, size, mtime_ns, inode, length, checksum = _HEADER.unpack(header)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                logger.info("Ignoring binary snapshot of another format: %s", binary_path(path))
+                return None
+            if (size, mtime_ns, inode) != stamp:
+                return None
+            payload = f.read(length)
+            STORAGE_BYTES_READ.inc(len(header) + len(payload), file='binary_snapshot')
+            if len(payload) != length or zlib.crc32(payload) != checksum:
+                logger.error(f"Checksum mismatch in binary snapshot: {binary_path(path)}")
+                return None
+            return pickle.loads(payload)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.exception("Unexpected error occurred while loading binary snapshot")
+        return None
@@ -0,0 +1,264 @@
+import json
+import os
+import sqlite3
+import threading
+from utils.logger_config import setup_logger
+from .base import StorageBackend
+from .blobs import json_default
+from .store import SubjectStore
+
+logger = setup_logger('storage')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subjects (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    subject_id INTEGER NOT NULL REFERENCES subjects(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sections_subject ON sections(subject_id, position);
+CREATE TABLE IF NOT EXISTS topics (
+    id INTEGER PRIMARY KEY,
+    section_id INTEGER NOT NULL REFERENCES sections(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_topics_section ON topics(section_id, position);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY,
+    record TEXT NOT NULL
+);
+"""
+
+# kind -> (table, parent column, child list key stripped from the row data)
+TABLES = {
+    'subject': ('subjects', None, 'sections'),
+    'section': ('sections', 'subject_id', 'topics'),
+    'topic': ('topics', 'section_id', None),
+}
+
+
+class SqliteStorage(StorageBackend):
+    """
+    Embedded SQLite database in WAL mode.
+
+    Each entity is one row holding its id, parent id, position and name as
+    indexed columns plus the rest of its fields as JSON, so a mutation only
+    touches the rows it changes. A batch of records is written in a single
+    transaction together with a copy in the `changes` table, which other
+    gunicorn workers replay to catch up; WAL lets them keep reading meanwhile.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, keep_changes=10000):
+        self.path = path
+        self.keep_changes = keep_changes
+        self._local = threading.local()
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connection(self):
+        """One connection per thread, never shared with a forked worker."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    ### Reads ###
+    def load(self):
+        conn = self._connection()
+        conn.execute('BEGIN')
+        try:
+            subjects = [
+                json.loads(data)
+                for (data,) in conn.execute('SELECT data FROM subjects ORDER BY position')
+            ]
+            sections = conn.execute(
+                'SELECT subject_id, data FROM sections ORDER BY subject_id, position'
+            ).fetchall()
+            topics = conn.execute(
+                'SELECT section_id, data FROM topics ORDER BY section_id, position'
+            ).fetchall()
+            meta = dict(conn.execute('SELECT key, value FROM meta'))
+        finally:
+            conn.execute('COMMIT')
+
+        section_lists = {}
+        for subject_id, data in sections:
+            section_lists.setdefault(subject_id, []).append(json.loads(data))
+        topic_lists = {}
+        for section_id, data in topics:
+            topic_lists.setdefault(section_id, []).append(json.loads(data))
+        for subject in subjects:
+            subject['sections'] = section_lists.get(subject['id'], [])
+            for section in subject['sections']:
+                section['topics'] = topic_lists.get(section['id'], [])
+
+        return SubjectStore({
+            'subjects': subjects,
+            'next_ids': json.loads(meta.get('next_ids', '{}')),
+            'journal_seq': int(meta.get('seq', 0))
+        })
+
+    def refresh(self, store):
+        """Replay rows of the changes table committed after store.seq."""
+        conn = self._connection()
+        conn.execute('BEGIN')
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()
+            rows = conn.execute(
+                'SELECT seq, record FROM changes WHERE seq > ? ORDER BY seq', (store.seq,)
+            ).fetchall()
+        finally:
+            conn.execute('COMMIT')
+        latest = int(row[0]) if row else 0
+        # Changes trimmed (or the database re-imported) since this copy was
+        # built. Seqs of rolled back batches are skipped, so a gap before
+        # the first row proves nothing; how far behind this copy is does
+        if latest != (rows[-1][0] if rows else store.seq) or store.seq < latest - self.keep_changes:
+            return self.load()
+        for seq, record in rows:
+            store.apply(json.loads(record))
+        return store
+
+    ### Writes ###
+    def write(self, records):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for record in records:
+                getattr(self, f"_{record['op']}")(conn, record)
+            conn.executemany(
+                'INSERT INTO changes (seq, record) VALUES (?, ?)',
+                [(record['seq'], json.dumps(record)) for record in records]
+            )
+            conn.execute(
+                'DELETE FROM changes WHERE seq <= ?',
+                (records[-1]['seq'] - self.keep_changes,)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('seq', ?)",
+                (str(records[-1]['seq']),)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _add(self, conn, record):
+        kind = record['kind']
+        table, parent_column, children = TABLES[kind]
+        data = {k: v for k, v in record['fields'].items() if k != children}
+        if parent_column:
+            (position,) = conn.execute(
+                f'SELECT COALESCE(MAX(position), -1) + 1 FROM {table} WHERE {parent_column} = ?',
+                (record['parent'],)
+            ).fetchone()
+            conn.execute(
+                f'INSERT INTO {table} (id, {parent_column}, position, name, data) VALUES (?, ?, ?, ?, ?)',
+                (record['id'], record['parent'], position, data['name'], json.dumps(data))
+            )
+        else:
+            (position,) = conn.execute(
+                f'SELECT COALESCE(MAX(position), -1) + 1 FROM {table}'
+            ).fetchone()
+            conn.execute(
+                f'INSERT INTO {table} (id, position, name, data) VALUES (?, ?, ?, ?)',
+                (record['id'], position, data['name'], json.dumps(data))
+            )
+        self._bump_next_id(conn, kind, record['id'])
+
+    def _update(self, conn, record):
+        table = TABLES[record['kind']][0]
+        row = conn.execute(f'SELECT data FROM {table} WHERE id = ?', (record['id'],)).fetchone()
+        if row is None:
+            raise KeyError(f"{record['kind']} {record['id']} not found")
+        data = json.loads(row[0])
+        data.update(record.get('fields') or {})
+        if record.get('details'):
+            data.setdefault('details', {}).update(record['details'])
+        conn.execute(
+            f'UPDATE {table} SET name = ?, data = ? WHERE id = ?',
+            (data['name'], json.dumps(data), record['id'])
+        )
+
+    def _delete(self, conn, record):
+        kind, entity_id = record['kind'], record['id']
+        if kind == 'subject':
+            conn.execute(
+                'DELETE FROM topics WHERE section_id IN (SELECT id FROM sections WHERE subject_id = ?)',
+                (entity_id,)
+            )
+            conn.execute('DELETE FROM sections WHERE subject_id = ?', (entity_id,))
+        elif kind == 'section':
+            conn.execute('DELETE FROM topics WHERE section_id = ?', (entity_id,))
+        conn.execute(f'DELETE FROM {TABLES[kind][0]} WHERE id = ?', (entity_id,))
+
+    def _bump_next_id(self, conn, kind, entity_id):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'next_ids'").fetchone()
+        next_ids = json.loads(row[0]) if row else {}
+        if entity_id >= next_ids.get(kind, 1):
+            next_ids[kind] = entity_id + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('next_ids', ?)",
+                (json.dumps(next_ids),)
+            )
+
+    def import_data(self, data):
+        """Replace every row with the contents of a subjects.json document."""
+        store = SubjectStore(data)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table in ('changes', 'topics', 'sections', 'subjects'):
+                conn.execute(f'DELETE FROM {table}')
+            for s_pos, subject in enumerate(store.subjects):
+                conn.execute(
+                    'INSERT INTO subjects (id, position, name, data) VALUES (?, ?, ?, ?)',
+                    (subject['id'], s_pos, subject['name'],
+                     json.dumps({k: v for k, v in subject.items() if k != 'sections'}))
+                )
+                for c_pos, section in enumerate(subject['sections']):
+                    conn.execute(
+                        'INSERT INTO sections (id, subject_id, position, name, data) VALUES (?, ?, ?, ?, ?)',
+                        (section['id'], subject['id'], c_pos, section['name'],
+                         json.dumps({k: v for k, v in section.items() if k != 'topics'}))
+                    )
+                    conn.executemany(
+                        'INSERT INTO topics (id, section_id, position, name, data) VALUES (?, ?, ?, ?, ?)',
+                        [(topic['id'], section['id'], t_pos, topic['name'], json.dumps(topic, default=json_default))
+                         for t_pos, topic in enumerate(section['topics'])]
+                    )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('next_ids', ?)",
+                (json.dumps(store.next_ids),)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('seq', ?)",
+                (str(store.seq),)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        logger.info("Imported %d topics into %s", len(store.topic_by_id), self.path)
@@ -0,0 +1,437 @@
+import copy
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from utils.logger_config import setup_logger
+from .entities import Subject, Section, Topic
+
+logger = setup_logger('storage')
+
+
+def fold_name(name):
+    """Normalise a name for case-insensitive duplicate checks."""
+    return name.casefold()
+
+
+def parse_timestamp(value):
+    """Epoch seconds for an ISO-8601 timestamp like '2024-03-14T10:30:00Z' (0 if unset)."""
+    if not value:
+        return 0.0
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _modified_at(entity):
+    when = entity.updated_epoch
+    return parse_timestamp(entity.get('updated_at')) if when is None else when
+
+
+class SubjectStore:
+    """
+    Resident, indexed copy of the subjects tree.
+
+    The nested subjects -> sections -> topics are held as Subject, Section
+    and Topic entities (see storage.entities), which read like the dicts of
+    subjects.json, so get_subjects() can hand them straight to the templates
+    and jsonify. On top of them the store keeps id indexes, parent
+    back-references, per-parent name counters and the next id for each kind,
+    so lookups, duplicate checks and inserts never walk the whole tree.
+    """
+
+    KINDS = ('subject', 'section', 'topic')
+
+    def __init__(self, data=None):
+        self.lock = threading.RLock()
+        self.subjects = []
+        self.subject_by_id = {}
+        self.section_by_id = {}
+        self.topic_by_id = {}
+        self.section_parent = {}  # section id -> subject id
+        self.topic_parent = {}  # topic id -> section id
+        self.subject_names = Counter()
+        self.section_names = {}  # subject id -> Counter of folded names
+        self.topic_names = {}  # section id -> Counter of folded names
+        self.next_ids = {kind: 1 for kind in self.KINDS}
+        self.seq = 0  # sequence number of the last applied mutation record
+        self.sync_state = None  # backend bookmark used by refresh()
+        self.generation = None  # shared generation this copy is current with
+        self.subject_versions = {}  # subject id -> seq of the last change inside it
+        self.subject_modified = {}  # subject id -> epoch seconds of that change
+        self.modified = 0.0  # epoch seconds of the last change anywhere
+        self.listeners = []  # called as listener(store, record, subject_id) after apply
+        self._undo = None  # (record, subject id, undo step) since savepoint(), newest last
+        self._saved = None  # seq and versions as they were at savepoint()
+
+        if data:
+            for subject in data.get('subjects', []):
+                self.insert_subject(subject)
+            for kind, value in (data.get('next_ids') or {}).items():
+                if kind in self.next_ids:
+                    self.next_ids[kind] = max(self.next_ids[kind], int(value))
+            self.seq = int(data.get('journal_seq', 0))
+        for subject_id in self.subject_by_id:
+            self.subject_versions[subject_id] = self.seq
+
+    ### Lookups ###
+    def get_subject(self, subject_id):
+        return self.subject_by_id.get(subject_id)
+
+    def get_section(self, section_id):
+        return self.section_by_id.get(section_id)
+
+    def get_topic(self, topic_id):
+        return self.topic_by_id.get(topic_id)
+
+    def subject_of_section(self, section_id):
+        """Return the subject dict owning a section, or None."""
+        return self.subject_by_id.get(self.section_parent.get(section_id))
+
+    def section_of_topic(self, topic_id):
+        """Return the section dict owning a topic, or None."""
+        return self.section_by_id.get(self.topic_parent.get(topic_id))
+
+    def find_subject(self, name):
+        """Return the subject with this name (case-insensitive), or None."""
+        if not self.subject_names.get(fold_name(name)):
+            return None
+        folded = fold_name(name)
+        return next((s for s in self.subjects if fold_name(s['name']) == folded), None)
+
+    def find_section(self, subject_id, name):
+        """Return the subject's section with this name (case-insensitive), or None."""
+        subject = self.subject_by_id.get(subject_id)
+        if subject is None or not self.section_names[subject_id].get(fold_name(name)):
+            return None
+        folded = fold_name(name)
+        return next((s for s in subject['sections'] if fold_name(s['name']) == folded), None)
+
+    ### Duplicate checks ###
+    @staticmethod
+    def _taken(names, name, current=None):
+        folded = fold_name(name)
+        count = names.get(folded, 0)
+        if current is not None and fold_name(current['name']) == folded:
+            count -= 1
+        return count > 0
+
+    def subject_name_taken(self, name, exclude_id=None):
+        """True if another subject already uses this name (case-insensitive)."""
+        return self._taken(self.subject_names, name, self.subject_by_id.get(exclude_id))
+
+    def section_name_taken(self, subject_id, name, exclude_id=None):
+        """True if another section of the subject already uses this name."""
+        names = self.section_names.get(subject_id, {})
+        return self._taken(names, name, self.section_by_id.get(exclude_id))
+
+    def topic_name_taken(self, section_id, name, exclude_id=None):
+        """True if another topic of the section already uses this name."""
+        names = self.topic_names.get(section_id, {})
+        return self._taken(names, name, self.topic_by_id.get(exclude_id))
+
+    ### ID counters ###
+    def allocate_id(self, kind):
+        """Reserve and return the next id for a subject, section or topic."""
+        new_id = self.next_ids[kind]
+        self.next_ids[kind] = new_id + 1
+        return new_id
+
+    def _seen_id(self, kind, entity_id):
+        if entity_id >= self.next_ids[kind]:
+            self.next_ids[kind] = entity_id + 1
+
+    ### Inserts ###
+    def insert_subject(self, subject):
+        """Index a subject (dict or Subject) and any sections it already carries."""
+        subject = Subject.coerce(subject)
+        sections = subject.get('sections') or []
+        subject.sections = []
+        self.subjects.append(subject)
+        self.subject_by_id[subject.id] = subject
+        self.subject_names[fold_name(subject.name)] += 1
+        self.section_names[subject.id] = Counter()
+        self._seen_id('subject', subject.id)
+        self._stamp(subject.id, _modified_at(subject))
+        for section in sections:
+            self.insert_section(subject.id, section)
+        return subject
+
+    def insert_section(self, subject_id, section):
+        """Index a section (dict or Section) under a subject, with any topics it carries."""
+        subject = self.subject_by_id[subject_id]
+        section = Section.coerce(section)
+        topics = section.get('topics') or []
+        section.topics = []
+        subject.sections.append(section)
+        self.section_by_id[section.id] = section
+        self.section_parent[section.id] = subject_id
+        self.section_names[subject_id][fold_name(section.name)] += 1
+        self.topic_names[section.id] = Counter()
+        self._seen_id('section', section.id)
+        self._stamp(subject_id, _modified_at(section))
+        for topic in topics:
+            self.insert_topic(section.id, topic)
+        return section
+
+    def insert_topic(self, section_id, topic):
+        """Index a topic (dict or Topic) under a section."""
+        section = self.section_by_id[section_id]
+        topic = Topic.coerce(topic)
+        section.topics.append(topic)
+        self.topic_by_id[topic.id] = topic
+        self.topic_parent[topic.id] = section_id
+        self.topic_names[section_id][fold_name(topic.name)] += 1
+        self._seen_id('topic', topic.id)
+        self._stamp(self.section_parent[section_id], _modified_at(topic))
+        return topic
+
+    ### Updates ###
+    @staticmethod
+    def _rename(names, entity, name):
+        old = fold_name(entity['name'])
+        names[old] -= 1
+        if names[old] <= 0:
+            del names[old]
+        names[fold_name(name)] += 1
+
+    def update_subject(self, subject_id, fields):
+        subject = self.subject_by_id[subject_id]
+        if 'name' in fields:
+            self._rename(self.subject_names, subject, fields['name'])
+        subject.update(fields)
+        return subject
+
+    def update_section(self, section_id, fields):
+        section = self.section_by_id[section_id]
+        if 'name' in fields:
+            names = self.section_names[self.section_parent[section_id]]
+            self._rename(names, section, fields['name'])
+        section.update(fields)
+        return section
+
+    def update_topic(self, topic_id, fields, details=None):
+        topic = self.topic_by_id[topic_id]
+        if 'name' in fields:
+            names = self.topic_names[self.topic_parent[topic_id]]
+            self._rename(names, topic, fields['name'])
+        topic.update(fields)
+        if details:
+            current = topic.get('details')
+            if current is None or isinstance(current, dict):
+                topic.setdefault('details', {}).update(details)
+            else:
+                # Read-only details (see storage.blobs.LazyDetails)
+                topic['details'] = current.updated(details)
+        return topic
+
+    ### Removals ###
+    @staticmethod
+    def _unlink(items, entity):
+        for index, item in enumerate(items):
+            if item is entity:
+                del items[index]
+                return
+
+    @staticmethod
+    def _forget_name(names, entity):
+        folded = fold_name(entity['name'])
+        names[folded] -= 1
+        if names[folded] <= 0:
+            del names[folded]
+
+    def remove_topic(self, topic_id):
+        topic = self.topic_by_id.pop(topic_id)
+        section_id = self.topic_parent.pop(topic_id)
+        self._unlink(self.section_by_id[section_id]['topics'], topic)
+        self._forget_name(self.topic_names[section_id], topic)
+        return topic
+
+    def remove_section(self, section_id):
+        section = self.section_by_id[section_id]
+        for topic in list(section['topics']):
+            self.remove_topic(topic['id'])
+        del self.section_by_id[section_id]
+        subject_id = self.section_parent.pop(section_id)
+        del self.topic_names[section_id]
+        self._unlink(self.subject_by_id[subject_id]['sections'], section)
+        self._forget_name(self.section_names[subject_id], section)
+        return section
+
+    def remove_subject(self, subject_id):
+        subject = self.subject_by_id[subject_id]
+        for section in list(subject['sections']):
+            self.remove_section(section['id'])
+        del self.subject_by_id[subject_id]
+        del self.section_names[subject_id]
+        self.subject_versions.pop(subject_id, None)
+        self.subject_modified.pop(subject_id, None)
+        self._unlink(self.subjects, subject)
+        self._forget_name(self.subject_names, subject)
+        return subject
+
+    ### Versions ###
+    def _stamp(self, subject_id, when):
+        if when > self.subject_modified.get(subject_id, 0.0):
+            self.subject_modified[subject_id] = when
+        if when > self.modified:
+            self.modified = when
+
+    def affected_subject(self, record):
+        """Id of the subject a mutation record touches; call before applying it."""
+        kind, op = record['kind'], record['op']
+        if kind == 'subject':
+            return record['id']
+        if kind == 'section':
+            return record['parent'] if op == 'add' else self.section_parent.get(record['id'])
+        section_id = record['parent'] if op == 'add' else self.topic_parent.get(record['id'])
+        return self.section_parent.get(section_id)
+
+    ### Mutation records ###
+    def apply(self, record):
+        """
+        Apply one mutation record, as written to the journal:
+        {'seq', 'ts', 'op': add|update|delete, 'kind', 'id', 'parent', 'fields', 'details'}
+        """
+        op, kind = record['op'], record['kind']
+        subject_id = self.affected_subject(record)
+        if self._undo is not None:
+            self._undo.append((record, subject_id, self._inverse(record)))
+        if op == 'add':
+            entity = copy.deepcopy(record['fields'])
+            if kind == 'subject':
+                self.insert_subject(entity)
+            elif kind == 'section':
+                self.insert_section(record['parent'], entity)
+            else:
+                self.insert_topic(record['parent'], entity)
+        elif op == 'update':
+            fields = dict(record.get('fields') or {})
+            if kind == 'subject':
+                self.update_subject(record['id'], fields)
+            elif kind == 'section':
+                self.update_section(record['id'], fields)
+            else:
+                self.update_topic(record['id'], fields, dict(record.get('details') or {}))
+        elif op == 'delete':
+            getattr(self, f"remove_{kind}")(record['id'])
+        else:
+            raise ValueError(f"Unknown mutation op: {op}")
+        self.seq = record['seq']
+        when = record.get('ts') or time.time()
+        if when > self.modified:
+            self.modified = when
+        if subject_id in self.subject_by_id:
+            self.subject_versions[subject_id] = self.seq
+            self._stamp(subject_id, when)
+        self._notify(record, subject_id)
+
+    def _notify(self, record, subject_id):
+        for listener in self.listeners:
+            try:
+                listener(self, record, subject_id)
+            except Exception as e:
+                logger.error(f"Change listener failed: {str(e)}")
+
+    ### Savepoints ###
+    def savepoint(self):
+        """
+        Start recording how to undo the records given to apply(), so they
+        can be taken back together with rollback() or kept with release().
+        Savepoints do not nest.
+        """
+        self._undo = []
+        self._saved = (self.seq, dict(self.subject_versions), dict(self.subject_modified), self.modified)
+
+    def release(self):
+        """Keep everything applied since savepoint()."""
+        self._undo = self._saved = None
+
+    def rollback(self):
+        """
+        Undo every record applied since savepoint(), newest first. Listeners
+        saw each of them go in, so each is passed to them again as
+        {'op': 'undo', 'seq', 'kind', 'id'} once the store is back where it
+        was, with the subject it touched. Id counters stay where they are:
+        the ids handed out were reported back to callers and are not reused.
+        """
+        undo, self._undo = self._undo, None
+        for _, _, step in reversed(undo):
+            step()
+        self.seq, self.subject_versions, self.subject_modified, self.modified = self._saved
+        self._saved = None
+        for record, subject_id, _ in reversed(undo):
+            undone = {'op': 'undo', 'seq': record['seq'], 'kind': record['kind'], 'id': record['id']}
+            self._notify(undone, subject_id)
+
+    @staticmethod
+    def _restore_position(items, index):
+        # Re-inserted entities are appended; put the last one back at `index`
+        items.insert(index, items.pop())
+
+    def _inverse(self, record):
+        """A function that undoes `record`; call before applying it."""
+        op, kind, entity_id = record['op'], record['kind'], record['id']
+        if op == 'add':
+            return lambda: getattr(self, f"remove_{kind}")(entity_id)
+
+        entity = getattr(self, f"{kind}_by_id")[entity_id]
+        if op == 'update':
+            fields = record.get('fields') or {}
+            before = {key: entity[key] for key in fields if key in entity}
+            missing = [key for key in fields if key not in entity]
+            details = entity.get('details')
+            if isinstance(details, dict):
+                # update_topic changes a plain details dict in place
+                details = dict(details)
+
+            def undo_update():
+                getattr(self, f"update_{kind}")(entity_id, before)
+                for key in missing:
+                    del entity[key]
+                if kind == 'topic' and record.get('details'):
+                    if details is None:
+                        entity.pop('details', None)
+                    else:
+                        entity['details'] = details
+            return undo_update
+
+        # Looked up again when undoing: re-inserting a parent gives it new child lists
+        if kind == 'topic':
+            parent = self.topic_parent[entity_id]
+            siblings = lambda: self.section_by_id[parent].topics
+            children = None
+        elif kind == 'section':
+            parent = self.section_parent[entity_id]
+            siblings = lambda: self.subject_by_id[parent].sections
+            children = list(entity.topics)
+        else:
+            parent = None
+            siblings = lambda: self.subjects
+            children = [(section, list(section.topics)) for section in entity.sections]
+        index = next(i for i, item in enumerate(siblings()) if item is entity)
+
+        def undo_delete():
+            # remove_* emptied the child lists; insert_* re-indexes what they hold
+            if kind == 'topic':
+                self.insert_topic(parent, entity)
+            elif kind == 'section':
+                entity.topics = children
+                self.insert_section(parent, entity)
+            else:
+                for section, topics in children:
+                    section.topics = topics
+                entity.sections = [section for section, _ in children]
+                self.insert_subject(entity)
+            self._restore_position(siblings(), index)
+        return undo_delete
+
+    ### Serialisation ###
+    def to_dict(self):
+        """Return the tree in the subjects.json layout, id counters included."""
+        return {
+            'subjects': self.subjects,
+            'next_ids': dict(self.next_ids),
+            'journal_seq': self.seq
+        }
@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+from utils.file_lock import FileLock
+from utils.logger_config import setup_logger
+from utils.metrics import STORAGE_SECONDS, WRITE_BATCH_SIZE
+
+logger = setup_logger('storage')
+
+
+class _Pending:
+    """One queued mutation waiting for a group commit."""
+
+    __slots__ = ('plan', 'atomic', 'result', 'error', 'leader', 'finished', 'wakeup')
+
+    def __init__(self, plan, wakeup, atomic=False):
+        self.plan = plan  # or, when atomic, a list of plans
+        self.atomic = atomic
+        self.result = None
+        self.error = None
+        self.leader = False
+        self.finished = False
+        self.wakeup = wakeup
+
+
+class GroupCommitWriter:
+    """
+    The single write path for models.py.
+
+    Callers submit a plan: a function that takes the up-to-date store and
+    returns (result, records) without changing anything. The first caller
+    to arrive becomes the leader; it waits `window` seconds for others to
+    queue up, then takes the inter-process write lock, catches the store up
+    with other workers, runs every queued plan in order (applying each
+    plan's records so the next one sees them) and persists the whole batch
+    with one backend write, i.e. one journal fsync or one SQLite
+    transaction. Each caller gets its own plan's result back.
+
+    Records are numbered past `seq_mark`, a counter shared by every
+    process that remembers the highest seq handed out. Readers can see
+    records before they are persisted, and seqs name versions in ETags and
+    cache keys, so the seqs of a rolled back or failed batch are skipped
+    rather than reused.
+    """
+
+    def __init__(self, storage, get_store, invalidate, generation, seq_mark, lock_path,
+                 window=0.002, max_batch=500):
+        self.storage = storage
+        self.get_store = get_store
+        self.invalidate = invalidate
+        self.generation = generation
+        self.seq_mark = seq_mark
+        self.lock_path = lock_path
+        self.window = window
+        self.max_batch = max_batch
+        self._mutex = threading.Lock()
+        self._queue = []
+        self._leading = False
+        self._lock_file = None
+        self._lock_pid = None
+
+    def submit(self, plan):
+        """
+        Run `plan` in the next group commit and return its result, or None
+        if the batch could not be persisted.
+        """
+        return self.submit_many([plan])[0]
+
+    def submit_many(self, plans):
+        """
+        Queue several plans back to back and return their results in order.
+        They run in that order, each seeing the records of the ones before
+        it, and are committed in as few batches as `max_batch` allows.
+        """
+        wakeup = threading.Event()
+        return self._run([_Pending(plan, wakeup) for plan in plans], wakeup)
+
+    def submit_atomic(self, plans):
+        """
+        Run `plans` in order as one all-or-nothing unit of the next group
+        commit and return (committed, results). Each plan sees the records
+        of the ones before it. The first plan whose result is unsuccessful
+        (its first item is false) ends the run: the store is rolled back to
+        where it was before the first plan, nothing is written, and
+        `results` stops at that plan. Returns None if the batch could not
+        be persisted.
+        """
+        wakeup = threading.Event()
+        return self._run([_Pending(list(plans), wakeup, atomic=True)], wakeup)[0]
+
+    def _run(self, pendings, wakeup):
+        """Queue `pendings`, which share the `wakeup` event, and wait until all have run."""
+        with self._mutex:
+            self._queue.extend(pendings)
+            if not self._leading and pendings:
+                self._leading = True
+                pendings[0].leader = True
+        while True:
+            # Clear first: a wakeup that lands after the checks is not lost
+            wakeup.clear()
+            leader = next((p for p in pendings if p.leader and not p.finished), None)
+            if leader is not None:
+                self._lead(leader)
+            elif all(p.finished for p in pendings):
+                break
+            else:
+                wakeup.wait()
+        for pending in pendings:
+            if pending.error is not None:
+                raise pending.error
+        return [pending.result for pending in pendings]
+
+    def _lead(self, own):
+        if self.window:
+            time.sleep(self.window)
+        while not own.finished:
+            with self._mutex:
+                batch = self._queue[:self.max_batch]
+                del self._queue[:self.max_batch]
+            try:
+                self._commit(batch)
+            except Exception as e:
+                logger.error(f"Group commit failed: {str(e)}")
+                for pending in batch:
+                    pending.error = pending.error or e
+            finally:
+                for pending in batch:
+                    pending.finished = True
+                    pending.wakeup.set()
+        # Hand leadership to the next waiting caller, if any
+        with self._mutex:
+            if self._queue:
+                successor = self._queue[0]
+                successor.leader = True
+                successor.wakeup.set()
+            else:
+                self._leading = False
+
+    def _process_lock(self):
+        # Lock files opened before a fork would be shared with the parent
+        if self._lock_file is None or self._lock_pid != os.getpid():
+            self._lock_file = open(self.lock_path, 'a+b')
+            self._lock_pid = os.getpid()
+        return FileLock(self._lock_file)
+
+    def _apply(self, store, records):
+        if not records:
+            return
+        start = max(store.seq, self.seq_mark.value())
+        for offset, record in enumerate(records, 1):
+            record['seq'] = start + offset
+        # Taken before anyone can see them
+        self.seq_mark.advance(records[-1]['seq'])
+        for record in records:
+            store.apply(record)
+
+    def _run_atomic(self, store, plans):
+        results = []
+        records = []
+        store.savepoint()
+        try:
+            for plan in plans:
+                result, plan_records = plan(store)
+                results.append(result)
+                if not result[0]:
+                    store.rollback()
+                    return (False, results), []
+                self._apply(store, plan_records)
+                records.extend(plan_records)
+        except Exception:
+            store.rollback()
+            raise
+        store.release()
+        return (True, results), records
+
+    def _commit(self, batch):
+        lock = self._process_lock()
+        while not lock.acquire(blocking=True):
+            time.sleep(0.01)
+        try:
+            store = self.get_store()
+            with store.lock:
+                records = []
+                planned = []
+                try:
+                    for pending in batch:
+                        try:
+                            if pending.atomic:
+                                result, pending_records = self._run_atomic(store, pending.plan)
+                            else:
+                                result, pending_records = pending.plan(store)
+                                self._apply(store, pending_records)
+                        except Exception as e:
+                            pending.error = e
+                            continue
+                        pending.result = result
+                        if pending_records:
+                            planned.append(pending)
+                            records.extend(pending_records)
+                    if records:
+                        with STORAGE_SECONDS.time(op='backend_write', backend=self.storage.name):
+                            self.storage.write(records)
+                        WRITE_BATCH_SIZE.observe(len(records))
+                except Exception as e:
+                    # The store may hold records that never reached disk
+                    logger.error(f"Error persisting {len(records)} records: {str(e)}")
+                    self.invalidate()
+                    for pending in planned:
+                        pending.result = None
+                    return
+                if not records:
+                    return
+                self.storage.after_commit(store)
+                old, new = self.generation.bump()
+                # Still current: nobody else can commit while we hold the lock
+                if store.generation == old:
+                    store.generation = new
+        finally:
+            lock.release()
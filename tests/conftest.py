@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The app's modules import each other from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config reads the environment on import: keep the data, logs, metrics and
+# site of a test run out of the repository
+_run_dir = tempfile.mkdtemp(prefix='notebook-tests-')
+os.environ['DATA_DIR'] = os.path.join(_run_dir, 'data')
+os.environ['STATIC_SITE_DIR'] = os.path.join(_run_dir, 'site')
+os.makedirs(os.environ['DATA_DIR'])
+
+
+@pytest.fixture
+def client():
+    """Test client for the app, not logged in."""
+    from app import app
+    return app.test_client()
+
+
+@pytest.fixture
+def admin(client):
+    """Test client with an admin session."""
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    return client
@@ -0,0 +1,79 @@
+"""Summary view of /api/subjects and the paginated section and topic lists."""
+import uuid
+
+
+def add_subject(admin, sections=0, topics=0):
+    """A new subject with `sections` sections, the first holding `topics` topics; returns its id."""
+    operations = [{'op': 'add', 'type': 'subject', 'name': f"Paged {uuid.uuid4().hex[:8]}", 'description': 'd'}]
+    for n in range(sections):
+        operations.append({'op': 'add', 'type': 'section', 'name': f"Section {n}"})
+        if n == 0:
+            operations.extend(
+                {'op': 'add', 'type': 'topic', 'name': f"Topic {t}", 'text': f"text {t}"} for t in range(topics)
+            )
+    payload = admin.post('/api/batch', json={'operations': operations}).get_json()
+    assert payload['committed']
+    return payload['results'][0]['id'], [r['id'] for r, o in zip(payload['results'], operations)
+                                          if o['type'] == 'section']
+
+
+def pages(client, url, key):
+    items, cursor = [], None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ''))
+        assert response.status_code == 200
+        payload = response.get_json()
+        items.append([item['id'] for item in payload[key]])
+        cursor = payload['next_cursor']
+        if cursor is None:
+            return items
+
+
+def test_summary_view_counts_children_instead_of_listing_them(admin):
+    subject_id, _ = add_subject(admin, sections=2, topics=3)
+
+    subjects = admin.get('/api/subjects?view=summary').get_json()['subjects']
+
+    summary = next(s for s in subjects if s['id'] == subject_id)
+    assert 'sections' not in summary
+    assert summary['section_count'] == 2 and summary['topic_count'] == 3
+
+
+def test_sections_are_paged_with_cursors(admin):
+    subject_id, section_ids = add_subject(admin, sections=5, topics=1)
+
+    assert pages(admin, f'/api/subjects/{subject_id}/sections?limit=2', 'sections') == [
+        section_ids[0:2], section_ids[2:4], section_ids[4:5]
+    ]
+    first = admin.get(f'/api/subjects/{subject_id}/sections?limit=2&fields=name').get_json()
+    assert first['sections'][0] == {'id': section_ids[0], 'name': 'Section 0'}
+
+
+def test_cursor_survives_deletes_before_it(admin):
+    subject_id, section_ids = add_subject(admin, sections=4)
+    first = admin.get(f'/api/subjects/{subject_id}/sections?limit=2').get_json()
+
+    admin.delete(f'/api/sections/{section_ids[0]}')
+    rest = admin.get(f"/api/subjects/{subject_id}/sections?limit=2&cursor={first['next_cursor']}").get_json()
+
+    assert [section['id'] for section in rest['sections']] == section_ids[2:4]
+    assert rest['next_cursor'] is None
+
+
+def test_topics_can_leave_out_their_details(admin):
+    _, section_ids = add_subject(admin, sections=1, topics=3)
+
+    payload = admin.get(f'/api/sections/{section_ids[0]}/topics?limit=2&fields=name').get_json()
+
+    assert [set(topic) for topic in payload['topics']] == [{'id', 'name'}] * 2
+    assert payload['next_cursor'] is not None
+    full = admin.get(f'/api/sections/{section_ids[0]}/topics').get_json()['topics']
+    assert full[0]['details']['text'] == 'text 0'
+
+
+def test_bad_cursor_and_unknown_parents(admin):
+    subject_id, _ = add_subject(admin, sections=1)
+    response = admin.get(f'/api/subjects/{subject_id}/sections?cursor=not-a-cursor')
+    assert response.status_code == 400 and response.get_json() == {'error': 'Invalid cursor'}
+    assert admin.get(f'/api/subjects/{10 ** 9}/sections').status_code == 404
+    assert admin.get(f'/api/sections/{10 ** 9}/topics').status_code == 404
@@ -0,0 +1,176 @@
+"""Savepoints, atomic group commits and the /api/batch endpoint."""
+import uuid
+from storage import GenerationCounter, GroupCommitWriter, SubjectStore
+from test_storage import add_topic, notebook, record, shape, snapshot, storage_for
+
+
+def unique(prefix):
+    return f"{prefix} {uuid.uuid4().hex[:8]}"
+
+
+def subject_names(client):
+    return {subject['name'] for subject in client.get('/api/subjects').get_json()['subjects']}
+
+
+### Rollback ###
+def test_rollback_restores_order_and_indexes_but_not_id_counters():
+    store = SubjectStore(notebook())
+    before = shape(store)
+    store.seq = 5
+    store.savepoint()
+    store.apply(record(6, 'delete', 'section', 2))
+    store.apply(add_topic(7, 10, section_id=3))
+    store.apply(record(8, 'update', 'section', 1, {'name': 'Renamed'}))
+    store.apply(record(9, 'delete', 'subject', 1))
+
+    store.rollback()
+
+    assert store.seq == 5
+    assert [section.id for section in store.get_subject(1).sections] == [1, 2, 3]
+    assert [subject.id for subject in store.subjects] == [1, 2]
+    assert store.get_topic(10) is None and 10 not in store.topic_parent
+    assert store.topic_parent[2] == 2 and store.section_parent[2] == 1
+    assert store.find_section(1, 'Section 1') is store.get_section(1)
+    assert store.find_section(1, 'Renamed') is None
+    assert not store.topic_name_taken(3, 'Added 10')
+    # Topic 10 was handed out, so it is not handed out again
+    assert store.next_ids == {'subject': 3, 'section': 4, 'topic': 11}
+    store.seq = 0
+    store.next_ids['topic'] = 4
+    assert shape(store) == before
+
+
+def test_rollback_tells_listeners_only_about_undone_records():
+    store = SubjectStore(notebook())
+    calls = []
+    store.listeners = [lambda s, entry, subject_id: calls.append((entry['op'], entry['seq'], subject_id))]
+    store.savepoint()
+    store.apply(add_topic(1, 10, section_id=1))
+    store.apply(record(2, 'update', 'subject', 2, {'description': 'x'}))
+    calls.clear()
+
+    store.rollback()
+
+    assert calls == [('undo', 2, 2), ('undo', 1, 1)]
+    calls.clear()
+    store.savepoint()
+    store.rollback()
+    assert calls == []
+
+
+### Group commit ###
+def test_seqs_and_ids_of_a_rolled_back_batch_are_not_reused(snapshot, tmp_path):
+    storage = storage_for(snapshot)
+    store = storage.load()
+    writer = GroupCommitWriter(
+        storage, lambda: store, lambda: None,
+        GenerationCounter(str(tmp_path / 'generation')), GenerationCounter(str(tmp_path / 'seq')),
+        str(tmp_path / 'write.lock'), window=0
+    )
+
+    def add(ok=True):
+        def plan(current):
+            if not ok:
+                return (False,), []
+            topic_id = current.allocate_id('topic')
+            return (True, topic_id), [add_topic(None, topic_id)]
+        return plan
+
+    committed, results = writer.submit_atomic([add(), add(ok=False)])
+    assert not committed and store.get_topic(results[0][1]) is None and store.seq == 0
+    (_, topic_id), = writer.submit_many([add()])
+
+    assert topic_id == results[0][1] + 1
+    assert store.get_topic(topic_id) is not None
+    assert store.seq == 2
+    assert storage_for(snapshot).load().seq == 2
+
+
+### /api/batch ###
+def test_batch_applies_every_operation(admin):
+    name = unique('Batch')
+    response = admin.post('/api/batch', json={'operations': [
+        {'op': 'add', 'type': 'subject', 'name': name, 'description': 'd'},
+        {'op': 'add', 'type': 'section', 'name': 'Basics'},
+        {'op': 'add', 'type': 'topic', 'name': 'Loops', 'text': 'for'},
+    ]})
+
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload['committed'] is True
+    topic_id = payload['results'][2]['id']
+    topic = admin.get(f'/api/topics/{topic_id}').get_json()
+    assert topic['name'] == 'Loops' and topic['version'] == 1
+
+    response = admin.post('/api/batch', json={'operations': [
+        {'op': 'update', 'type': 'topic', 'id': topic_id, 'version': 1, 'name': 'While loops'},
+        {'op': 'delete', 'type': 'topic', 'id': topic_id, 'version': 2},
+    ]})
+    assert response.status_code == 200
+    assert response.get_json()['results'][0]['version'] == 2
+    assert admin.get(f'/api/topics/{topic_id}').status_code == 404
+
+
+def test_failed_operation_rolls_back_the_whole_batch(admin):
+    name = unique('Rolled back')
+    response = admin.post('/api/batch', json={'operations': [
+        {'op': 'add', 'type': 'subject', 'name': name, 'description': 'd'},
+        {'op': 'add', 'type': 'section', 'name': 'Basics'},
+        {'op': 'update', 'type': 'section', 'id': 10 ** 9, 'name': 'Missing'},
+    ]})
+
+    assert response.status_code == 400
+    payload = response.get_json()
+    assert payload['committed'] is False
+    assert [result['success'] for result in payload['results']] == [True, True, False]
+    assert payload['results'][2]['message'] == 'Section not found'
+    assert name not in subject_names(admin)
+
+    # The ids the failed batch reported belong to it
+    response = admin.post('/api/subjects', json={'name': unique('After'), 'description': ''})
+    assert response.status_code == 201
+    ids = {subject['id'] for subject in admin.get('/api/subjects').get_json()['subjects']}
+    assert payload['results'][0]['id'] not in ids
+
+
+def test_deleting_a_missing_entity_fails_the_batch(admin):
+    for kind in ('subject', 'section', 'topic'):
+        name = unique('Kept out')
+        response = admin.post('/api/batch', json={'operations': [
+            {'op': 'add', 'type': 'subject', 'name': name, 'description': 'd'},
+            {'op': 'delete', 'type': kind, 'id': 10 ** 9},
+        ]})
+
+        assert response.status_code == 400
+        payload = response.get_json()
+        assert payload['committed'] is False
+        assert payload['results'][1] == {
+            'index': 1, 'success': False, 'message': f"{kind.capitalize()} not found"
+        }
+        assert name not in subject_names(admin)
+
+
+def test_stale_version_fails_the_batch_with_412(admin):
+    name = unique('Versioned')
+    admin.post('/api/subjects', json={'name': name, 'description': 'd'})
+    subject = next(s for s in admin.get('/api/subjects').get_json()['subjects'] if s['name'] == name)
+
+    response = admin.post('/api/batch', json={'operations': [
+        {'op': 'update', 'type': 'subject', 'id': subject['id'], 'description': 'new'},
+        {'op': 'update', 'type': 'subject', 'id': subject['id'], 'version': 1, 'description': 'stale'},
+    ]})
+
+    assert response.status_code == 412
+    assert response.get_json()['committed'] is False
+    assert admin.get(f"/api/subjects/{subject['id']}").get_json()['description'] == 'd'
+
+
+def test_batch_requires_login(client):
+    assert client.post('/api/batch', json={'operations': []}).status_code == 401
+
+
+def test_batch_validates_before_running(admin):
+    assert admin.post('/api/batch', json={'operations': []}).status_code == 400
+    response = admin.post('/api/batch', json={'operations': [{'op': 'delete', 'type': 'topic'}]})
+    assert response.status_code == 400
+    assert response.get_json()['errors'][0]['index'] == 0
@@ -0,0 +1,47 @@
+"""Binary copy of the JSON snapshot."""
+import json
+import os
+from storage.snapshot import binary_path
+from test_storage import add_topic, notebook, shape, snapshot, storage_for
+
+
+def test_first_load_writes_the_binary_copy_and_later_loads_use_it(snapshot):
+    expected = shape(storage_for(snapshot, binary_snapshot=False).load())
+
+    storage_for(snapshot, binary_snapshot=True).load()
+
+    assert os.path.exists(binary_path(snapshot))
+    assert shape(storage_for(snapshot, binary_snapshot=True).load()) == expected
+
+
+def test_binary_copy_of_an_older_snapshot_is_ignored(snapshot):
+    storage_for(snapshot, binary_snapshot=True).load()
+    data = notebook()
+    data['subjects'][1]['description'] = 'rewritten'
+    with open(snapshot, 'w') as f:
+        json.dump(data, f)
+
+    store = storage_for(snapshot, binary_snapshot=True).load()
+
+    assert store.get_subject(2)['description'] == 'rewritten'
+
+
+def test_journal_is_replayed_over_the_binary_copy(snapshot):
+    storage = storage_for(snapshot, binary_snapshot=True)
+    storage.load()
+    storage.write([add_topic(1, 10)])
+
+    store = storage_for(snapshot, binary_snapshot=True).load()
+
+    assert store.seq == 1 and store.get_topic(10) is not None
+
+
+def test_corrupt_binary_copy_falls_back_to_the_json(snapshot):
+    storage_for(snapshot, binary_snapshot=True).load()
+    with open(binary_path(snapshot), 'r+b') as f:
+        f.seek(-8, os.SEEK_END)
+        f.write(b'\0' * 8)
+
+    store = storage_for(snapshot, binary_snapshot=True).load()
+
+    assert len(store.subjects) == 2
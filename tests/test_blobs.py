@@ -0,0 +1,52 @@
+"""Content-addressed blobs for topic details."""
+import json
+import os
+import time
+from storage import BlobStore, LazyDetails
+from test_storage import add_topic, record, snapshot, storage_for, wait_for_compaction
+
+
+def test_identical_payloads_share_one_file(tmp_path):
+    blobs = BlobStore(str(tmp_path))
+
+    first = blobs.put({'text': 'same', 'code': 'x', 'updated_at': 'now'})
+    second = blobs.put({'text': 'same', 'code': 'x', 'updated_at': 'later'})
+
+    assert first == second
+    assert blobs.get(first) == {'text': 'same', 'code': 'x', 'table': None, 'image': None}
+    assert blobs.get('0' * 64) == {}
+
+
+def test_compaction_moves_details_into_blobs_loaded_lazily(snapshot, tmp_path):
+    blob_dir = str(tmp_path / 'blobs')
+    storage = storage_for(snapshot, blob_dir=blob_dir, compact_records=1, compact_bytes=0, compact_ratio=0)
+    store = storage.load()
+    records = [add_topic(1, 10), record(2, 'update', 'topic', 1, details={'text': 'edited', 'code': ''})]
+    storage.write(records)
+    for entry in records:
+        store.apply(entry)
+
+    storage.after_commit(store)
+    wait_for_compaction(storage)
+
+    with open(snapshot) as f:
+        topic = json.load(f)['subjects'][0]['sections'][0]['topics'][0]
+    assert 'text' not in topic['details'] and topic['details']['blob']
+    loaded = storage_for(snapshot, blob_dir=blob_dir).load()
+    details = loaded.get_topic(1)['details']
+    assert isinstance(details, LazyDetails)
+    assert details['text'] == 'edited'
+    assert loaded.get_topic(10)['details']['text'] == 'new'
+
+
+def test_garbage_collection_keeps_referenced_and_recent_blobs(tmp_path):
+    blobs = BlobStore(str(tmp_path))
+    kept, old, recent = (blobs.put({'text': text}) for text in ('kept', 'old', 'recent'))
+    stamp = time.time() - 120
+    for digest in (kept, old):
+        os.utime(blobs.path(digest), (stamp, stamp))
+
+    assert blobs.collect_garbage({kept}, grace=60) == 1
+
+    assert os.path.exists(blobs.path(kept)) and os.path.exists(blobs.path(recent))
+    assert not os.path.exists(blobs.path(old))
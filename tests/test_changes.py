@@ -0,0 +1,84 @@
+"""Change history and the /api/changes feed."""
+import uuid
+from storage import ChangeLog, SubjectStore
+
+
+def entry(seq, op='update', kind='topic', entity_id=1):
+    return {'seq': seq, 'op': op, 'kind': kind, 'id': entity_id}
+
+
+def loaded_log(size=10):
+    log = ChangeLog(size)
+    store = SubjectStore({'subjects': []})
+    log.on_change(store, None, None)
+    return log, store
+
+
+def test_history_answers_until_it_no_longer_reaches_back():
+    log, _ = loaded_log(size=3)
+    for seq in range(1, 6):
+        log.on_change(None, entry(seq, entity_id=seq), None)
+
+    assert log.since(3) == [(4, 'update', 'topic', 4), (5, 'update', 'topic', 5)]
+    assert log.since(2) == [(3, 'update', 'topic', 3), (4, 'update', 'topic', 4), (5, 'update', 'topic', 5)]
+    assert log.since(5) == []
+    assert log.since(1) is None
+    assert log.since(6) is None
+
+
+def test_undone_records_leave_the_history():
+    log, _ = loaded_log()
+    log.on_change(None, entry(1), None)
+    log.on_change(None, entry(2), None)
+
+    log.on_change(None, {'op': 'undo', 'seq': 2, 'kind': 'topic', 'id': 1}, None)
+
+    assert log.since(0) == [(1, 'update', 'topic', 1)]
+
+
+def test_a_reload_that_skipped_records_starts_a_new_history():
+    log, store = loaded_log()
+    log.on_change(store, entry(1), None)
+    store.seq = 7
+
+    log.on_change(store, None, None)
+
+    assert log.since(0) is None
+    assert log.since(7) == []
+
+
+def test_changes_endpoint_lists_each_entity_once_with_its_state(admin):
+    seq = admin.get('/api/subjects').get_json()['seq']
+    name = f"Changed {uuid.uuid4().hex[:8]}"
+    results = admin.post('/api/batch', json={'operations': [
+        {'op': 'add', 'type': 'subject', 'name': name, 'description': 'd'},
+        {'op': 'add', 'type': 'section', 'name': 'Gone soon'},
+        {'op': 'add', 'type': 'section', 'name': 'Kept'},
+    ]}).get_json()['results']
+    subject_id, gone_id, kept_id = (result['id'] for result in results)
+    admin.put(f'/api/subjects/{subject_id}', json={'name': name, 'description': 'new'})
+    admin.delete(f'/api/sections/{gone_id}')
+
+    payload = admin.get(f'/api/changes?since={seq}').get_json()
+
+    assert payload['resync_required'] is False
+    assert payload['seq'] == admin.get('/api/subjects').get_json()['seq']
+    changes = {(change['kind'], change['id']): change for change in payload['changes']}
+    assert list(changes) == [('subject', subject_id), ('section', gone_id), ('section', kept_id)]
+    assert changes[('subject', subject_id)]['op'] == 'add'
+    assert changes[('subject', subject_id)]['entity']['description'] == 'new'
+    assert 'sections' not in changes[('subject', subject_id)]['entity']
+    assert changes[('section', gone_id)]['op'] == 'delete' and 'entity' not in changes[('section', gone_id)]
+    assert changes[('section', kept_id)]['entity']['name'] == 'Kept'
+
+    assert admin.get(f"/api/changes?since={payload['seq']}").get_json()['changes'] == []
+
+
+def test_changes_endpoint_asks_for_a_resync_or_a_valid_seq(client):
+    seq = client.get('/api/subjects').get_json()['seq']
+
+    assert client.get(f'/api/changes?since={seq + 1000}').get_json() == {
+        'seq': seq, 'resync_required': True, 'changes': []
+    }
+    assert client.get('/api/changes').status_code == 400
+    assert client.get('/api/changes?since=-1').status_code == 400
@@ -0,0 +1,90 @@
+"""Cross-worker coherence: refreshing a resident store from other workers' writes."""
+import os
+from test_storage import add_topic, record, shape, snapshot, storage_for, wait_for_compaction
+
+
+### Refresh ###
+def test_refresh_applies_other_workers_records(snapshot):
+    store = storage_for(snapshot).load()
+    storage_for(snapshot).write([add_topic(1, 10), record(2, 'delete', 'topic', 2)])
+
+    store = storage_for(snapshot).refresh(store)
+
+    assert store.seq == 2
+    assert store.get_topic(10) is not None and store.get_topic(2) is None
+
+
+def test_refresh_tolerates_seq_gaps(snapshot):
+    store = storage_for(snapshot).load()
+    # Seqs 2 and 3 belonged to a batch that was rolled back
+    storage_for(snapshot).write([add_topic(1, 10), add_topic(4, 11)])
+
+    refreshed = storage_for(snapshot).refresh(store)
+
+    assert refreshed is store
+    assert store.seq == 4
+    assert store.get_topic(11) is not None
+
+
+def test_refresh_reads_the_rotated_journal_before_the_new_one(snapshot):
+    reader = storage_for(snapshot)
+    store = reader.load()
+    writer = storage_for(snapshot)
+    writer.write([add_topic(1, 10)])
+    store = reader.refresh(store)
+    writer.write([add_topic(2, 11)])
+    # A compaction rotated the journal and has not written its snapshot yet
+    writer.journal.rotate(writer.pending_path)
+    writer.write([add_topic(3, 12)])
+
+    refreshed = reader.refresh(store)
+
+    assert refreshed is store
+    assert store.seq == 3
+    assert all(store.get_topic(topic_id) is not None for topic_id in (10, 11, 12))
+    assert shape(store) == shape(storage_for(snapshot).load())
+
+
+def test_refresh_after_a_finished_compaction_matches_a_fresh_load(snapshot):
+    reader = storage_for(snapshot)
+    store = reader.load()
+    writer = storage_for(snapshot, compact_records=1, compact_bytes=0, compact_ratio=0)
+    latest = writer.load()
+    records = [add_topic(1, 10), record(2, 'update', 'topic', 10, {'name': 'Renamed'})]
+    writer.write(records)
+    for entry in records:
+        latest.apply(entry)
+    writer.after_commit(latest)
+    wait_for_compaction(writer)
+    assert not os.path.exists(writer.pending_path)
+    writer.write([add_topic(3, 11)])
+
+    store = reader.refresh(store)
+
+    assert store.seq == 3
+    assert store.get_topic(10)['name'] == 'Renamed'
+    assert store.get_topic(11) is not None
+    assert shape(store) == shape(storage_for(snapshot).load())
+
+
+### Resident store ###
+def test_api_sees_a_commit_made_by_another_worker(client):
+    import config
+    import models
+    store = models.get_store()
+    seq = max(store.seq, models._seq_mark.value()) + 1
+    subject_id = store.next_ids['subject'] + 100
+    subject = {'id': subject_id, 'name': f"From worker {subject_id}", 'description': '', 'sections': []}
+    # What another worker's group commit leaves behind
+    storage_for(config.DATA_FILE, binary_snapshot=config.BINARY_SNAPSHOT).write(
+        [record(seq, 'add', 'subject', subject_id, subject)]
+    )
+    models._seq_mark.advance(seq)
+    models._generation.bump()
+
+    response = client.get(f'/api/subjects/{subject_id}')
+
+    assert response.status_code == 200
+    assert response.get_json()['name'] == subject['name']
+    assert models.get_store() is store
+    assert store.seq == seq
@@ -0,0 +1,56 @@
+"""ETag / Last-Modified revalidation of the public pages and the read API."""
+import uuid
+
+
+def add_subject(admin):
+    name = f"Cached {uuid.uuid4().hex[:8]}"
+    payload = admin.post('/api/batch', json={'operations': [
+        {'op': 'add', 'type': 'subject', 'name': name, 'description': 'd'},
+        {'op': 'add', 'type': 'section', 'name': 'Basics'},
+        {'op': 'add', 'type': 'topic', 'name': 'First', 'text': 'text'},
+    ]}).get_json()
+    return name, payload['results'][0]['id'], payload['results'][2]['id']
+
+
+def test_pages_answer_304_until_something_changes(admin, client):
+    name, subject_id, _ = add_subject(admin)
+    for url in ('/', f'/subject/{name}', '/api/subjects', '/api/subjects?view=summary'):
+        first = client.get(url)
+        assert first.status_code == 200
+        etag = first.headers['ETag']
+        assert first.headers['Last-Modified']
+        assert 'must-revalidate' in first.headers['Cache-Control']
+
+        again = client.get(url, headers={'If-None-Match': etag})
+        assert again.status_code == 304 and again.data == b''
+        assert again.headers['ETag'] == etag
+        since = client.get(url, headers={'If-Modified-Since': first.headers['Last-Modified']})
+        assert since.status_code == 304
+
+    etag = client.get(f'/subject/{name}').headers['ETag']
+    admin.put(f'/api/subjects/{subject_id}', json={'name': name, 'description': 'changed'})
+    response = client.get(f'/subject/{name}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_other_subjects_keep_their_etag(admin, client):
+    name, _, _ = add_subject(admin)
+    etag = client.get(f'/subject/{name}').headers['ETag']
+
+    add_subject(admin)
+
+    assert client.get(f'/subject/{name}', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_entities_revalidate_on_their_version(admin, client):
+    _, _, topic_id = add_subject(admin)
+    response = client.get(f'/api/topics/{topic_id}')
+    assert response.headers['ETag'] == '"v1"'
+
+    assert client.get(f'/api/topics/{topic_id}', headers={'If-None-Match': '"v1"'}).status_code == 304
+    admin.put(f'/api/topics/{topic_id}', json={'name': 'First', 'text': 'new', 'code': ''})
+    response = client.get(f'/api/topics/{topic_id}', headers={'If-None-Match': '"v1"'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"v2"'
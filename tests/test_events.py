@@ -0,0 +1,69 @@
+"""Server-Sent Events at /api/events."""
+import json
+import uuid
+import pytest
+import config
+
+
+@pytest.fixture
+def short_streams(monkeypatch):
+    monkeypatch.setattr(config, 'EVENTS_STREAM_SECONDS', 0.3)
+    monkeypatch.setattr(config, 'EVENTS_HEARTBEAT', 0.1)
+    monkeypatch.setattr(config, 'EVENTS_POLL_INTERVAL', 0.05)
+
+
+def parse(body):
+    """The (event, id, data) of every message in an event stream, plus its comments."""
+    messages, comments = [], []
+    for block in body.split('\n\n'):
+        fields = {}
+        for line in block.splitlines():
+            if line.startswith(':'):
+                comments.append(line[1:].strip())
+            elif ': ' in line:
+                key, value = line.split(': ', 1)
+                fields[key] = value
+        if 'event' in fields:
+            messages.append((fields['event'], int(fields['id']), json.loads(fields['data'])))
+    return messages, comments
+
+
+def test_stream_sends_the_changes_after_last_event_id(admin, short_streams):
+    seq = admin.get('/api/subjects').get_json()['seq']
+    name = f"Streamed {uuid.uuid4().hex[:8]}"
+    subject_id = admin.post('/api/batch', json={'operations': [
+        {'op': 'add', 'type': 'subject', 'name': name, 'description': 'd'}
+    ]}).get_json()['results'][0]['id']
+    admin.put(f'/api/subjects/{subject_id}', json={'name': name, 'description': 'new'})
+
+    response = admin.get('/api/events', headers={'Last-Event-ID': str(seq)})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    body = response.get_data(as_text=True)
+    assert body.startswith('retry: ')
+    messages, comments = parse(body)
+    assert messages == [
+        ('change', seq + 1, {'seq': seq + 1, 'op': 'add', 'kind': 'subject', 'id': subject_id, 'version': 2}),
+        ('change', seq + 2, {'seq': seq + 2, 'op': 'update', 'kind': 'subject', 'id': subject_id, 'version': 2}),
+    ]
+    # The rest of the stream is heartbeats until it closes
+    assert comments and set(comments) == {'keep-alive'}
+
+
+def test_stream_asks_for_a_resync_when_history_is_gone(admin, short_streams):
+    seq = admin.get('/api/subjects').get_json()['seq']
+
+    messages, _ = parse(admin.get(f'/api/events?since={seq + 1000}').get_data(as_text=True))
+
+    assert messages[0] == ('resync', seq, {'seq': seq})
+
+
+def test_stream_is_for_admins_and_can_be_switched_off(client, monkeypatch):
+    assert client.get('/api/events').status_code == 401
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    assert client.get('/api/events', headers={'Last-Event-ID': 'x'}).status_code == 400
+    monkeypatch.setattr(config, 'EVENTS_STREAM_SECONDS', 0)
+    assert client.get('/api/events').status_code == 204
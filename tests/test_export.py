@@ -0,0 +1,87 @@
+"""Streaming export as JSON and as NDJSON that /api/import reads back."""
+import json
+import uuid
+from storage import SubjectStore, iter_export
+
+
+def notebook_store():
+    return SubjectStore({'subjects': [
+        {'id': 1, 'name': 'Python', 'description': 'first', 'sections': [
+            {'id': 1, 'name': 'Basics', 'topics': [
+                {'id': 1, 'name': 'Quotes "and" unicode ✓', 'details': {'text': 'a\nb', 'code': 'x = 1'}},
+                {'id': 2, 'name': 'Tables', 'details': {'text': '', 'code': '',
+                                                        'table': {'headers': ['h'], 'rows': [['c']]}}},
+            ]},
+            {'id': 2, 'name': 'Empty', 'topics': []},
+        ]},
+        {'id': 2, 'name': 'Rust', 'description': 'second', 'sections': []},
+    ]})
+
+
+def without_volatile(subject):
+    """A subject tree without ids, timestamps and versions, which an import assigns afresh."""
+    return {
+        'name': subject['name'], 'description': subject['description'],
+        'sections': [{'name': section['name'], 'topics': [
+            {'name': topic['name'], **{key: topic['details'].get(key) for key in ('text', 'code', 'table', 'image')}}
+            for topic in section['topics']
+        ]} for section in subject['sections']]
+    }
+
+
+def test_json_export_is_the_tree_in_small_chunks():
+    store = notebook_store()
+
+    chunks = list(iter_export(store, 'json', chunk_bytes=64))
+
+    assert len(chunks) > 3
+    exported = json.loads(''.join(chunks))
+    assert exported == json.loads(json.dumps({'subjects': store.to_dict()['subjects']}, default=dict))
+
+
+def test_ndjson_export_lists_entities_in_tree_order():
+    lines = [json.loads(line) for line in ''.join(iter_export(notebook_store(), 'ndjson')).splitlines()]
+
+    assert [(line['type'], line['name']) for line in lines] == [
+        ('subject', 'Python'), ('section', 'Basics'), ('topic', 'Quotes "and" unicode ✓'),
+        ('topic', 'Tables'), ('section', 'Empty'), ('subject', 'Rust'),
+    ]
+    assert lines[2]['text'] == 'a\nb' and lines[2]['code'] == 'x = 1'
+    assert lines[3]['table'] == {'headers': ['h'], 'rows': [['c']]}
+    assert not any('subject_id' in line or 'section_id' in line for line in lines)
+
+
+def test_export_endpoint_matches_the_subjects_api(admin):
+    response = admin.get('/api/export')
+
+    assert response.status_code == 200 and response.mimetype == 'application/json'
+    assert response.get_json()['subjects'] == admin.get('/api/subjects').get_json()['subjects']
+    assert admin.get('/api/export?format=xml').status_code == 400
+
+
+def test_ndjson_export_round_trips_through_import(admin):
+    name = f"Round trip {uuid.uuid4().hex[:8]}"
+    admin.post('/api/batch', json={'operations': [
+        {'op': 'add', 'type': 'subject', 'name': name, 'description': 'both ways'},
+        {'op': 'add', 'type': 'section', 'name': 'One'},
+        {'op': 'add', 'type': 'topic', 'name': 'Text', 'text': 'line 1\n\nline 2', 'code': 'print("hi")'},
+        {'op': 'add', 'type': 'topic', 'name': 'Table', 'table': {'headers': ['a'], 'rows': [['1']]}},
+        {'op': 'add', 'type': 'section', 'name': 'Two'},
+    ]})
+
+    response = admin.get('/api/export?format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    start = next(i for i, line in enumerate(lines) if line['type'] == 'subject' and line['name'] == name)
+    end = next((i for i in range(start + 1, len(lines)) if lines[i]['type'] == 'subject'), len(lines))
+    copy = [dict(line) for line in lines[start:end]]
+    copy[0]['name'] = f"{name} copy"
+    body = ''.join(json.dumps(line) + '\n' for line in copy)
+
+    summary = admin.post('/api/import', data=body, content_type='application/x-ndjson').get_json()
+
+    assert summary == {'imported': 5, 'failed': 0, 'errors': []}
+    subjects = {s['name']: s for s in admin.get('/api/subjects').get_json()['subjects']}
+    original, imported = without_volatile(subjects[name]), without_volatile(subjects[f"{name} copy"])
+    imported['name'] = name
+    assert imported == original
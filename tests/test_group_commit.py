@@ -0,0 +1,89 @@
+"""Group-commit writer: concurrent plans share backend writes."""
+import threading
+from storage import GenerationCounter, GroupCommitWriter
+from test_storage import add_topic, snapshot, storage_for
+
+
+class CountingStorage:
+    """Wraps a backend and records the size of each write."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.name = storage.name
+        self.writes = []
+
+    def write(self, records):
+        self.writes.append(len(records))
+        self.storage.write(records)
+
+    def after_commit(self, store):
+        self.storage.after_commit(store)
+
+
+def writer_for(storage, store, tmp_path, window=0.05):
+    return GroupCommitWriter(
+        storage, lambda: store, lambda: None,
+        GenerationCounter(str(tmp_path / 'generation')), GenerationCounter(str(tmp_path / 'seq')),
+        str(tmp_path / 'write.lock'), window=window
+    )
+
+
+def adding(topic_id):
+    def plan(store):
+        return (True, topic_id), [add_topic(None, topic_id)]
+    return plan
+
+
+def test_concurrent_submits_are_committed_together(snapshot, tmp_path):
+    backend = storage_for(snapshot)
+    store = backend.load()
+    counting = CountingStorage(backend)
+    writer = writer_for(counting, store, tmp_path)
+    results = {}
+
+    def submit(topic_id):
+        results[topic_id] = writer.submit(adding(topic_id))
+
+    threads = [threading.Thread(target=submit, args=(10 + n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {10 + n: (True, 10 + n) for n in range(8)}
+    assert sum(counting.writes) == 8 and len(counting.writes) < 8
+    reloaded = storage_for(snapshot).load()
+    assert reloaded.seq == 8
+    assert all(reloaded.get_topic(10 + n) is not None for n in range(8))
+
+
+def test_each_plan_sees_the_records_of_the_ones_before_it(snapshot, tmp_path):
+    store = storage_for(snapshot).load()
+    writer = writer_for(storage_for(snapshot), store, tmp_path, window=0)
+
+    def only_once(store):
+        if store.topic_name_taken(1, 'Added 10'):
+            return (False, 'taken'), []
+        return (True, 'added'), [add_topic(None, 10)]
+
+    assert writer.submit_many([only_once, only_once]) == [(True, 'added'), (False, 'taken')]
+    assert storage_for(snapshot).load().seq == 1
+
+
+def test_a_failed_write_reports_none_and_drops_the_store(snapshot, tmp_path):
+    store = storage_for(snapshot).load()
+    invalidated = []
+
+    class Failing(CountingStorage):
+        def write(self, records):
+            raise OSError('disk full')
+
+    writer = GroupCommitWriter(
+        Failing(storage_for(snapshot)), lambda: store, lambda: invalidated.append(True),
+        GenerationCounter(str(tmp_path / 'generation')), GenerationCounter(str(tmp_path / 'seq')),
+        str(tmp_path / 'write.lock'), window=0
+    )
+
+    assert writer.submit(adding(10)) is None
+    assert invalidated == [True]
+    assert storage_for(snapshot).load().get_topic(10) is None
@@ -0,0 +1,96 @@
+"""Streaming NDJSON import through /api/import."""
+import json
+import uuid
+
+
+def ndjson(*lines):
+    return '\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines) + '\n'
+
+
+def post_import(admin, body):
+    return admin.post('/api/import', data=body, content_type='application/x-ndjson')
+
+
+def subject_tree(admin, name):
+    return next(s for s in admin.get('/api/subjects').get_json()['subjects'] if s['name'] == name)
+
+
+def test_import_follows_the_most_recent_parents(admin):
+    name = f"Imported {uuid.uuid4().hex[:8]}"
+
+    response = post_import(admin, ndjson(
+        {'type': 'subject', 'name': name, 'description': 'd'},
+        {'type': 'section', 'name': 'One'},
+        {'type': 'topic', 'name': 'A', 'text': 'a'},
+        {'type': 'topic', 'name': 'B', 'code': 'b = 1'},
+        '',
+        {'type': 'section', 'name': 'Two'},
+        {'type': 'topic', 'name': 'C'},
+        {'type': 'topic', 'name': 'D', 'subject': name, 'section': 'One'},
+    ))
+
+    assert response.status_code == 200
+    assert response.get_json() == {'imported': 7, 'failed': 0, 'errors': []}
+    subject = subject_tree(admin, name)
+    assert [(s['name'], [t['name'] for t in s['topics']]) for s in subject['sections']] == [
+        ('One', ['A', 'B', 'D']), ('Two', ['C'])
+    ]
+
+
+def test_errors_are_reported_per_line_and_fail_dependent_lines(admin):
+    name = f"Partly {uuid.uuid4().hex[:8]}"
+
+    summary = post_import(admin, ndjson(
+        {'type': 'subject', 'name': name, 'description': 'd'},
+        '{not json',
+        {'type': 'section'},
+        {'type': 'topic', 'name': 'Orphan'},
+        {'type': 'section', 'name': 'Fine'},
+        {'type': 'topic', 'name': 'Kept'},
+        {'type': 'topic', 'name': 'Kept'},
+        {'type': 'chapter', 'name': 'x'},
+    )).get_json()
+
+    assert summary['imported'] == 3 and summary['failed'] == 5
+    errors = {error['line']: error['error'] for error in summary['errors']}
+    assert sorted(errors) == [2, 3, 4, 7, 8]
+    assert errors[2].startswith('Invalid JSON')
+    assert errors[3] == {'name': ['Missing data for required field.']}
+    assert errors[4] == 'Parent section on line 3 failed'
+    assert 'already exists' in errors[7]
+    assert errors[8] == 'type must be one of subject, section, topic'
+    subject = subject_tree(admin, name)
+    assert [(s['name'], [t['name'] for t in s['topics']]) for s in subject['sections']] == [('Fine', ['Kept'])]
+
+
+def test_a_failed_subject_fails_its_sections_and_topics(admin):
+    name = f"Taken {uuid.uuid4().hex[:8]}"
+    admin.post('/api/subjects', json={'name': name, 'description': ''})
+
+    summary = post_import(admin, ndjson(
+        {'type': 'subject', 'name': name, 'description': 'again'},
+        {'type': 'section', 'name': 'S'},
+        {'type': 'topic', 'name': 'T'},
+    )).get_json()
+
+    assert summary['imported'] == 0
+    assert [error['error'] for error in summary['errors'][1:]] == [
+        'Parent subject on line 1 failed', 'Parent section on line 2 failed'
+    ]
+    assert subject_tree(admin, name)['sections'] == []
+
+
+def test_import_spans_chunks(admin):
+    import app
+    name = f"Chunked {uuid.uuid4().hex[:8]}"
+    lines = [{'type': 'subject', 'name': name, 'description': ''}, {'type': 'section', 'name': 'S'}]
+    lines += [{'type': 'topic', 'name': f"T{n}"} for n in range(5)]
+
+    summary = app.import_ndjson(ndjson(*lines).splitlines(), chunk_size=2)
+
+    assert summary == {'imported': 7, 'failed': 0, 'errors': []}
+    assert len(subject_tree(admin, name)['sections'][0]['topics']) == 5
+
+
+def test_import_requires_login(client):
+    assert post_import(client, ndjson({'type': 'subject', 'name': 'x', 'description': ''})).status_code == 401
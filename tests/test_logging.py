@@ -0,0 +1,81 @@
+"""Queued, multi-process-safe logging."""
+import json
+import logging
+import os
+import signal
+import time
+import uuid
+import pytest
+import config
+from utils.logger_config import DEBUG_LOG, CustomJSONFormatter, ProcessSafeRotatingFileHandler, setup_logger
+
+
+def make_record(message, level=logging.INFO):
+    return logging.LogRecord('test', level, __file__, 1, message, None, None)
+
+
+def wait_for_line(path, text, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if text in line:
+                        return json.loads(line)
+        time.sleep(0.02)
+    return None
+
+
+def test_handler_writes_batches_and_follows_rotation_by_others(tmp_path):
+    path = str(tmp_path / 'app.log')
+    handler = ProcessSafeRotatingFileHandler(path)
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(CustomJSONFormatter())
+
+    handler.emit_many([make_record('one'), make_record('hidden', logging.DEBUG), make_record('two')])
+    # Another process rotated the file away
+    os.rename(path, f"{path}.1")
+    handler.emit_many([make_record('three')])
+    handler.close()
+
+    with open(f"{path}.1") as f:
+        assert [json.loads(line)['message'] for line in f] == ['one', 'two']
+    with open(path) as f:
+        assert [json.loads(line)['message'] for line in f] == ['three']
+
+
+def test_logs_go_to_the_configured_directory():
+    message = f"hello {uuid.uuid4().hex}"
+
+    setup_logger('tests').info("%s from the queue", message)
+
+    assert DEBUG_LOG.startswith(config.LOGS_DIR)
+    line = wait_for_line(DEBUG_LOG, message)
+    assert line['message'] == f"{message} from the queue"
+    assert line['level'] == 'INFO' and line['function'] == 'test_logs_go_to_the_configured_directory'
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_child_logs_without_hanging():
+    logger = setup_logger('tests')
+    for n in range(2000):
+        logger.info("before fork %d", n)
+    message = f"child {uuid.uuid4().hex}"
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            logger.info(message)
+            from utils.logger_config import _pipeline
+            _pipeline.stop()
+        finally:
+            os._exit(0)
+    deadline = time.monotonic() + 10
+    while os.waitpid(pid, os.WNOHANG) == (0, 0):
+        if time.monotonic() > deadline:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            pytest.fail("forked child hung while logging")
+        time.sleep(0.02)
+
+    assert wait_for_line(DEBUG_LOG, message) is not None
@@ -0,0 +1,67 @@
+"""Metrics registry and the /metrics endpoint."""
+import json
+import os
+import subprocess
+import sys
+from utils.metrics import Counter, Histogram, Registry
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def write_values(directory, file_name, entries):
+    with open(os.path.join(directory, file_name), 'w') as f:
+        json.dump(entries, f)
+
+
+def test_expose_sums_every_process_file(tmp_path):
+    registry = Registry(str(tmp_path))
+    requests = Counter('requests_total', 'Requests.', registry=registry)
+    latency = Histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0), registry=registry)
+    requests.inc(route='/')
+    latency.observe(0.05)
+    latency.observe(5)
+    write_values(str(tmp_path), f"{os.getpid()}-other.json", [['requests_total', [['route', '/']], 2.0]])
+
+    text = registry.expose()
+
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{route="/"} 3.0' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert 'latency_seconds_count 2' in text
+
+
+def test_exited_processes_are_folded_into_one_file(tmp_path):
+    directory = str(tmp_path)
+    registry = Registry(directory)
+    Counter('requests_total', 'Requests.', registry=registry)
+    for _ in range(2):
+        dead = f"{exited_pid()}-abcd1234.json"
+        write_values(directory, dead, [['requests_total', [], 5.0]])
+    write_values(directory, f"{exited_pid()}-abcd1234.json.tmp", [])
+
+    assert registry.collect() == {('requests_total', ()): 10.0}
+
+    assert sorted(name for name in os.listdir(directory) if not name.startswith('.')) == ['dead.json']
+    # Folding again must not count them twice
+    write_values(directory, f"{exited_pid()}-abcd1234.json", [['requests_total', [], 1.0]])
+    assert registry.collect() == {('requests_total', ()): 11.0}
+    assert registry.collect() == {('requests_total', ()): 11.0}
+
+
+def test_metrics_endpoint_reports_request_latency(client):
+    client.get('/api/subjects')
+
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/subjects",status="200"}' in text
+    assert 'store_cache_lookups_total{result=' in text
@@ -0,0 +1,57 @@
+"""Rendered subject page cache and its per-subject invalidation."""
+import uuid
+from utils.render_cache import RenderCache
+
+
+def test_entries_are_bounded_by_size_and_evicted_oldest_first():
+    cache = RenderCache(10)
+    cache.put(1, 'v1', b'aaaa')
+    cache.put(2, 'v1', b'bbbb')
+    assert cache.get(1, 'v1') == b'aaaa'  # now the most recent
+
+    cache.put(3, 'v1', b'cccc')
+
+    assert cache.get(2, 'v1') is None
+    assert cache.get(1, 'v1') == b'aaaa' and cache.get(3, 'v1') == b'cccc'
+    assert cache.size == 8
+    cache.put(4, 'v1', b'x' * 11)
+    assert cache.get(4, 'v1') is None
+
+
+def test_stale_versions_miss_and_replacing_keeps_the_size_right():
+    cache = RenderCache(100)
+    cache.put(1, 'v1', b'old')
+
+    assert cache.get(1, 'v2') is None
+    cache.put(1, 'v2', b'newer')
+    assert cache.get(1, 'v2') == b'newer' and cache.size == 5
+    cache.evict(1)
+    assert cache.get(1, 'v2') is None and cache.size == 0
+
+
+def test_subject_page_is_served_from_the_cache_until_the_subject_changes(admin, client):
+    import app
+    name = f"Page {uuid.uuid4().hex[:8]}"
+    payload = admin.post('/api/batch', json={'operations': [
+        {'op': 'add', 'type': 'subject', 'name': name, 'description': 'd'},
+        {'op': 'add', 'type': 'section', 'name': 'Basics'},
+        {'op': 'add', 'type': 'topic', 'name': 'First', 'text': 'before'},
+    ]}).get_json()
+    subject_id, topic_id = payload['results'][0]['id'], payload['results'][2]['id']
+    other = f"Other {uuid.uuid4().hex[:8]}"
+    admin.post('/api/subjects', json={'name': other, 'description': ''})
+    client.get(f'/subject/{other}')
+
+    first = client.get(f'/subject/{name}').data
+    cached = app.subject_page_cache.get(subject_id, app.get_subject_by_name(name)[1])
+    assert cached == first
+    assert client.get(f'/subject/{name}').data == first
+
+    admin.put(f'/api/topics/{topic_id}', json={'name': 'First', 'text': 'after'})
+
+    # Only the changed subject's page is dropped
+    assert app.subject_page_cache.get(subject_id, app.get_subject_by_name(name)[1]) is None
+    other_subject, other_version, _ = app.get_subject_by_name(other)
+    assert app.subject_page_cache.get(other_subject['id'], other_version) is not None
+    page = client.get(f'/subject/{name}').get_data(as_text=True)
+    assert 'after' in page and 'before' not in page
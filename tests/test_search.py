@@ -0,0 +1,108 @@
+"""BM25 search index and /api/search."""
+import uuid
+from storage import SubjectStore
+from utils.search_index import SearchIndex, make_snippet, tokenize
+
+
+def topic(topic_id, name, text='', code=''):
+    return {'id': topic_id, 'name': name, 'details': {'text': text, 'code': code}}
+
+
+def indexed(topics):
+    store = SubjectStore({'subjects': [
+        {'id': 1, 'name': 'Python', 'description': 'a language',
+         'sections': [{'id': 1, 'name': 'Basics', 'topics': topics}]}
+    ]})
+    index = SearchIndex()
+    index.rebuild(store)
+    store.listeners = [index.on_change]
+    return store, index
+
+
+def ids(hits):
+    return [key[1] for _, key in hits]
+
+
+def test_tokenize_splits_snake_case():
+    assert tokenize('Use read_file() NOW') == ['use', 'read_file', 'read', 'file', 'now']
+
+
+def test_name_matches_rank_above_body_matches():
+    _, index = indexed([
+        topic(1, 'Other', text='generators are lazy'),
+        topic(2, 'Generators', text='yield values'),
+        topic(3, 'Unrelated', text='nothing here'),
+    ])
+
+    total, hits = index.search('generators', kinds={'topic'})
+
+    assert total == 2
+    assert ids(hits) == [2, 1]
+
+
+def test_rarer_terms_weigh_more():
+    _, index = indexed([
+        topic(1, 'A', text='loop loop'),
+        topic(2, 'B', text='loop closure'),
+        topic(3, 'C', text='loop'),
+    ])
+
+    _, hits = index.search('loop closure')
+
+    assert ids(hits)[0] == 2
+
+
+def test_pages_match_one_big_page():
+    topics = [topic(n, f"T{n}", text=' '.join(['word'] * (n % 7 + 1) + ['filler'] * n)) for n in range(1, 60)]
+    _, index = indexed(topics)
+
+    total, everything = index.search('word filler', limit=100)
+    paged = []
+    for offset in range(0, total, 7):
+        page_total, hits = index.search('word filler', limit=7, offset=offset)
+        assert page_total == total
+        paged.extend(hits)
+
+    assert total == 59
+    assert ids(paged) == ids(everything)
+    assert [score for score, _ in everything] == sorted((score for score, _ in everything), reverse=True)
+
+
+def test_index_follows_changes():
+    store, index = indexed([topic(1, 'Closures', text='inner functions')])
+    store.apply({'seq': 1, 'op': 'update', 'kind': 'topic', 'id': 1, 'fields': {'name': 'Decorators'}})
+    store.apply({'seq': 2, 'op': 'add', 'kind': 'topic', 'id': 2, 'parent': 1,
+                 'fields': topic(2, 'Closures again')})
+
+    assert ids(index.search('decorators')[1]) == [1]
+    assert ids(index.search('closures')[1]) == [2]
+    store.apply({'seq': 3, 'op': 'delete', 'kind': 'topic', 'id': 2})
+    assert index.search('closures') == (0, [])
+
+
+def test_snippet_centres_on_the_match():
+    text = 'x ' * 200 + 'needle in the haystack' + ' y' * 200
+    snippet = make_snippet(text, 'needle', width=40)
+    assert 'needle' in snippet and len(snippet) < 60
+
+
+def test_search_endpoint_pages_with_next_offset(admin, client):
+    import models
+    word = f"zz{uuid.uuid4().hex[:8]}"
+    operations = [{'op': 'add', 'type': 'subject', 'name': f"Search {word}", 'description': 'd'},
+                  {'op': 'add', 'type': 'section', 'name': 'Basics'}]
+    operations += [{'op': 'add', 'type': 'topic', 'name': f"Topic {n}", 'text': f"{word} " * n} for n in range(1, 6)]
+    admin.post('/api/batch', json={'operations': operations})
+    # The index is built in the background after a load; wait for it here
+    models._search_index.rebuild(models.get_store())
+
+    first = client.get(f'/api/search?q={word}&type=topic&limit=3').get_json()
+    rest = client.get(f"/api/search?q={word}&type=topic&limit=3&offset={first['next_offset']}").get_json()
+
+    assert first['total'] == 5 and first['next_offset'] == 3
+    assert [hit['name'] for hit in first['results'] + rest['results']] == [f"Topic {n}" for n in range(5, 0, -1)]
+    assert rest['next_offset'] is None
+    assert first['results'][0]['subject_name'] == f"Search {word}"
+    assert word in first['results'][0]['snippet']
+    assert client.get(f'/api/search?q={word}').get_json()['total'] == 6
+    assert client.get('/api/search?q=').status_code == 400
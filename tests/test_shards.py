@@ -0,0 +1,68 @@
+"""Per-subject shard files for the JSON snapshot."""
+import json
+import os
+from test_storage import add_topic, record, shape, snapshot, storage_for, wait_for_compaction
+
+
+### Shards ###
+def test_split_keeps_the_data_and_the_journal(snapshot, tmp_path):
+    storage_for(snapshot).write([add_topic(1, 10)])
+    expected = shape(storage_for(snapshot).load())
+    shard_dir = str(tmp_path / 'subjects')
+
+    sharded = storage_for(snapshot, shard_dir=shard_dir)
+    assert sharded.split() == 2
+
+    assert os.path.exists(f"{snapshot}.migrated") and not os.path.exists(snapshot)
+    assert sorted(name for name in os.listdir(shard_dir) if name.startswith('subject-')) == [
+        'subject-1-0.json', 'subject-2-0.json'
+    ]
+    assert shape(storage_for(snapshot, shard_dir=shard_dir).load()) == expected
+    # Only ever done once
+    assert storage_for(snapshot, shard_dir=shard_dir).split() is None
+
+
+def test_shard_dir_without_manifest_keeps_using_the_single_file(snapshot, tmp_path):
+    shard_dir = str(tmp_path / 'subjects')
+    storage = storage_for(snapshot, shard_dir=shard_dir)
+
+    store = storage.load()
+
+    assert len(store.subjects) == 2
+    assert not os.path.exists(shard_dir)
+    assert os.path.exists(snapshot)
+
+
+def test_sharded_compaction_rewrites_only_changed_subjects(snapshot, tmp_path):
+    shard_dir = str(tmp_path / 'subjects')
+    storage_for(snapshot, shard_dir=shard_dir).split()
+    storage = storage_for(snapshot, shard_dir=shard_dir, compact_records=1, compact_bytes=0, compact_ratio=0)
+    store = storage.load()
+    records = [record(1, 'update', 'subject', 2, {'description': 'changed'})]
+    storage.write(records)
+    store.apply(records[0])
+
+    storage.after_commit(store)
+    wait_for_compaction(storage)
+
+    with open(os.path.join(shard_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    assert [entry['file'] for entry in manifest['subjects']] == ['subject-1-0.json', 'subject-2-1.json']
+    assert manifest['journal_seq'] == 1
+    reloaded = storage_for(snapshot, shard_dir=shard_dir).load()
+    assert reloaded.get_subject(2)['description'] == 'changed'
+    assert shape(reloaded) == shape(store)
+
+
+def test_sharded_load_replays_the_journal_and_refresh_follows_it(snapshot, tmp_path):
+    shard_dir = str(tmp_path / 'subjects')
+    storage_for(snapshot, shard_dir=shard_dir).split()
+    reader = storage_for(snapshot, shard_dir=shard_dir)
+    store = reader.load()
+    storage_for(snapshot, shard_dir=shard_dir).write([add_topic(1, 10), record(2, 'delete', 'subject', 2)])
+
+    store = reader.refresh(store)
+
+    assert store.seq == 2
+    assert store.get_topic(10) is not None and store.get_subject(2) is None
+    assert shape(store) == shape(storage_for(snapshot, shard_dir=shard_dir).load())
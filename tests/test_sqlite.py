@@ -0,0 +1,38 @@
+"""SQLite storage backend."""
+from storage import SqliteStorage, create_storage
+from test_storage import add_topic, notebook, record, shape
+
+
+def test_import_then_write_and_load_matches_the_json_tree(tmp_path):
+    path = str(tmp_path / 'subjects.db')
+    storage = create_storage('sqlite', path)
+    assert isinstance(storage, SqliteStorage)
+    storage.import_data(notebook())
+    records = [
+        add_topic(1, 10),
+        record(2, 'update', 'subject', 2, {'description': 'changed'}),
+        record(3, 'delete', 'section', 3),
+    ]
+    storage.write(records)
+
+    store = SqliteStorage(path).load()
+
+    assert store.seq == 3
+    assert store.get_topic(10)['name'] == 'Added 10' and store.topic_parent[10] == 1
+    assert store.get_subject(2)['description'] == 'changed'
+    assert store.get_section(3) is None and store.get_topic(3) is None
+    assert store.next_ids['topic'] == 11
+
+
+def test_refresh_applies_other_workers_rows(tmp_path):
+    path = str(tmp_path / 'subjects.db')
+    SqliteStorage(path).import_data(notebook())
+    reader = SqliteStorage(path)
+    store = reader.load()
+    SqliteStorage(path).write([add_topic(1, 10), record(2, 'delete', 'topic', 2)])
+
+    store = reader.refresh(store)
+
+    assert store.seq == 2
+    assert store.get_topic(10) is not None and store.get_topic(2) is None
+    assert shape(store) == shape(SqliteStorage(path).load())
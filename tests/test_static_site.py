@@ -0,0 +1,68 @@
+"""Static-site build of the public pages."""
+import os
+import uuid
+import pytest
+
+
+@pytest.fixture
+def builder(tmp_path):
+    from app import TEMPLATES_DIGEST, app
+    from models import get_store
+    from utils.static_site import StaticSiteBuilder
+    return StaticSiteBuilder(
+        app, str(tmp_path / 'site'), get_store, TEMPLATES_DIGEST, str(tmp_path / 'state'), delay=0
+    )
+
+
+def add_subject(admin, topic_text):
+    name = f"Static {uuid.uuid4().hex[:8]}"
+    payload = admin.post('/api/batch', json={'operations': [
+        {'op': 'add', 'type': 'subject', 'name': name, 'description': 'about it'},
+        {'op': 'add', 'type': 'section', 'name': 'Basics'},
+        {'op': 'add', 'type': 'topic', 'name': 'First', 'text': topic_text},
+    ]}).get_json()
+    return name, payload['results'][0]['id'], payload['results'][2]['id']
+
+
+def read(builder, *parts):
+    with open(os.path.join(builder.output_dir, *parts), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_build_renders_pages_and_then_only_what_changed(admin, builder):
+    name, subject_id, topic_id = add_subject(admin, 'original text')
+    other, _, _ = add_subject(admin, 'untouched')
+
+    first = builder.build()
+
+    assert first['rendered'] >= 3 and first['removed'] == 0
+    assert 'original text' in read(builder, 'subject', f"{name}.html")
+    index = read(builder, 'index.html')
+    assert name in index and other in index
+    # Pages link to fingerprinted copies of their assets
+    assert os.path.isdir(os.path.join(builder.output_dir, 'static'))
+    # Build state is kept out of what nginx serves
+    assert not any(entry.startswith('.build') for entry in os.listdir(builder.output_dir))
+
+    assert builder.build() == {'rendered': 0, 'removed': 0, 'unchanged': first['rendered'] - 1}
+
+    admin.put(f'/api/topics/{topic_id}', json={'name': 'First', 'text': 'edited text', 'code': ''})
+    second = builder.build()
+    assert second['rendered'] == 1 and second['removed'] == 0
+    assert 'edited text' in read(builder, 'subject', f"{name}.html")
+
+    admin.delete(f'/api/topics/{topic_id}')
+    section_id = admin.get(f'/api/subjects/{subject_id}/sections').get_json()['sections'][0]['id']
+    admin.delete(f'/api/sections/{section_id}')
+    admin.delete(f'/api/subjects/{subject_id}')
+    third = builder.build()
+    assert third['removed'] == 1 and third['rendered'] == 1  # the index
+    assert not os.path.exists(os.path.join(builder.output_dir, 'subject', f"{name}.html"))
+    assert name not in read(builder, 'index.html')
+
+
+def test_full_build_rerenders_every_page(admin, builder):
+    add_subject(admin, 'text')
+    first = builder.build()
+
+    assert builder.build(full=True)['rendered'] == first['rendered'] + first['unchanged']
@@ -0,0 +1,154 @@
+"""Persistence layer: journal replay and compaction."""
+import json
+import os
+import pytest
+from storage import JsonFileStorage
+from utils.file_lock import FileLock
+
+
+def notebook():
+    """Two subjects, the first with three sections holding a topic each."""
+    sections = [
+        {'id': n, 'name': f"Section {n}", 'topics': [
+            {'id': n, 'name': f"Topic {n}", 'details': {'text': f"text {n}", 'code': ''}}
+        ]}
+        for n in (1, 2, 3)
+    ]
+    return {
+        'subjects': [
+            {'id': 1, 'name': 'Python', 'description': 'first', 'sections': sections},
+            {'id': 2, 'name': 'Rust', 'description': 'second', 'sections': []},
+        ],
+        'next_ids': {'subject': 3, 'section': 4, 'topic': 4},
+        'journal_seq': 0,
+    }
+
+
+def record(seq, op, kind, entity_id, fields=None, parent=None, details=None):
+    entry = {'seq': seq, 'ts': 1700000000.0 + (seq or 0), 'op': op, 'kind': kind, 'id': entity_id}
+    if fields is not None:
+        entry['fields'] = fields
+    if parent is not None:
+        entry['parent'] = parent
+    if details is not None:
+        entry['details'] = details
+    return entry
+
+
+def add_topic(seq, topic_id, section_id=1):
+    fields = {'id': topic_id, 'name': f"Added {topic_id}", 'details': {'text': 'new', 'code': ''}}
+    return record(seq, 'add', 'topic', topic_id, fields, parent=section_id)
+
+
+def shape(store):
+    """The parts of a store two equal copies agree on."""
+    return json.loads(json.dumps(store.to_dict(), default=dict))
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = tmp_path / 'subjects.json'
+    path.write_text(json.dumps(notebook()))
+    return str(path)
+
+
+def storage_for(path, **kwargs):
+    kwargs.setdefault('binary_snapshot', False)
+    return JsonFileStorage(path, **kwargs)
+
+
+def wait_for_compaction(storage):
+    # The background compaction holds this lock until the snapshot lands
+    with open(storage.compact_lock_path, 'a+b') as f:
+        lock = FileLock(f)
+        lock.acquire(blocking=True)
+        lock.release()
+
+
+### Journal replay ###
+def test_load_replays_journal_over_snapshot(snapshot):
+    storage = storage_for(snapshot)
+    storage.write([
+        add_topic(1, 10),
+        record(2, 'update', 'subject', 2, {'description': 'changed'}),
+        record(3, 'delete', 'section', 3),
+    ])
+
+    store = storage_for(snapshot).load()
+
+    assert store.seq == 3
+    assert store.get_topic(10)['name'] == 'Added 10'
+    assert store.topic_parent[10] == 1
+    assert store.get_subject(2)['description'] == 'changed'
+    assert store.get_section(3) is None and store.get_topic(3) is None
+    assert store.next_ids['topic'] == 11
+
+
+def test_load_skips_records_the_snapshot_already_holds(snapshot):
+    data = notebook()
+    data['subjects'][1]['description'] = 'in snapshot'
+    data['journal_seq'] = 2
+    with open(snapshot, 'w') as f:
+        json.dump(data, f)
+    storage = storage_for(snapshot)
+    storage.write([
+        record(2, 'update', 'subject', 2, {'description': 'stale'}),
+        record(3, 'update', 'subject', 1, {'description': 'newer'}),
+    ])
+
+    store = storage_for(snapshot).load()
+
+    assert store.seq == 3
+    assert store.get_subject(2)['description'] == 'in snapshot'
+    assert store.get_subject(1)['description'] == 'newer'
+
+
+def test_torn_final_line_is_dropped_and_later_appends_survive(snapshot):
+    storage = storage_for(snapshot)
+    storage.write([add_topic(1, 10)])
+    # A crash in the middle of the next append
+    with open(storage.journal_path, 'ab') as f:
+        f.write(json.dumps(add_topic(2, 11)).encode('utf-8')[:25])
+
+    store = storage_for(snapshot).load()
+    assert store.seq == 1
+    assert store.get_topic(11) is None
+
+    # The next writer must not glue its record onto the torn line
+    storage_for(snapshot).write([add_topic(2, 12)])
+    store = storage_for(snapshot).load()
+    assert store.seq == 2
+    assert store.get_topic(12) is not None
+
+
+def test_unreadable_line_in_the_middle_is_skipped(snapshot):
+    storage = storage_for(snapshot)
+    storage.write([add_topic(1, 10)])
+    with open(storage.journal_path, 'ab') as f:
+        f.write(b'{"seq": 2, "op": \n')
+    storage.write([add_topic(3, 12)])
+
+    store = storage_for(snapshot).load()
+
+    assert store.seq == 3
+    assert store.get_topic(10) is not None and store.get_topic(12) is not None
+
+
+### Compaction ###
+def test_compacted_snapshot_holds_every_record(snapshot):
+    storage = storage_for(snapshot, compact_records=1, compact_bytes=0, compact_ratio=0)
+    store = storage.load()
+    records = [add_topic(1, 10), record(2, 'delete', 'subject', 2)]
+    storage.write(records)
+    for entry in records:
+        store.apply(entry)
+
+    storage.after_commit(store)
+    wait_for_compaction(storage)
+
+    assert not os.path.exists(storage.pending_path)
+    with open(snapshot) as f:
+        data = json.load(f)
+    assert data['journal_seq'] == 2
+    assert [subject['id'] for subject in data['subjects']] == [1]
+    assert shape(storage_for(snapshot).load()) == shape(store)
@@ -0,0 +1,92 @@
+"""Rendered topic fragments: markup, sharing through RENDERED_DIR and garbage collection."""
+import os
+import time
+import uuid
+from storage import SubjectStore
+from utils.topic_render import TopicFragments, content_key, render_details
+
+
+def details(text='', code='', table=None):
+    return {'text': text, 'code': code, 'table': table, 'image': None}
+
+
+def store_with(*topics):
+    return SubjectStore({'subjects': [{'id': 1, 'name': 'S', 'sections': [{'id': 1, 'name': 'A', 'topics': [
+        {'id': n, 'name': f"T{n}", 'details': topic} for n, topic in enumerate(topics, 1)
+    ]}]}]})
+
+
+def age(path, seconds):
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_render_details_escapes_text_and_highlights_code():
+    html = render_details(details(
+        text='a < b\nstill a\n\nnext', code='def f():\n    return 1\n',
+        table={'headers': ['x'], 'rows': [['<1>']]}
+    ))
+
+    assert '<p>a &lt; b<br>\nstill a</p>\n<p>next</p>' in html
+    assert '<div class="highlight">' in html and '<span class="k">def</span>' in html
+    assert '<td>&lt;1&gt;</td>' in html
+
+
+def test_fragments_are_shared_through_the_directory(tmp_path):
+    directory = str(tmp_path / 'rendered')
+    topic = details(text='shared', code='x = 1')
+    key = content_key(topic, 'python', ['python'])
+
+    first = TopicFragments(directory, guess_languages=['python'])
+    assert first.prerender(topic) is True
+    assert first.prerender(topic) is False
+    assert os.path.exists(first.path(key))
+
+    # Another worker reads the file instead of rendering
+    with open(first.path(key), 'w') as f:
+        f.write('<p>from disk</p>')
+    second = TopicFragments(directory, guess_languages=['python'])
+    assert second.get(topic) == '<p>from disk</p>'
+
+
+def test_backfill_renders_missing_topics_and_removes_unused_ones(tmp_path):
+    directory = str(tmp_path / 'rendered')
+    fragments = TopicFragments(directory, guess_languages=['python'], gc_grace=60)
+    kept, dropped, fresh = details(text='kept'), details(text='dropped'), details(text='fresh')
+    for topic in (kept, dropped, fresh):
+        fragments.prerender(topic)
+    paths = {name: fragments.path(content_key(topic, 'python', ['python']))
+             for name, topic in (('kept', kept), ('dropped', dropped), ('fresh', fresh))}
+    for name in ('kept', 'dropped'):
+        age(paths[name], 120)
+    stale_temp = f"{paths['dropped']}.1234.tmp"
+    open(stale_temp, 'w').close()
+    age(stale_temp, 120)
+    added = details(text='added')
+
+    rendered = TopicFragments(directory, guess_languages=['python'], gc_grace=60).backfill(
+        store_with(kept, added, {})
+    )
+
+    assert rendered == 1
+    assert os.path.exists(fragments.path(content_key(added, 'python', ['python'])))
+    assert os.path.exists(paths['kept'])
+    assert not os.path.exists(paths['dropped']) and not os.path.exists(stale_temp)
+    # Younger than the grace period: a worker may have just written it
+    assert os.path.exists(paths['fresh'])
+
+
+def test_subject_page_shows_the_rendered_topic(admin, client):
+    name = f"Rendered {uuid.uuid4().hex[:8]}"
+    admin.post('/api/batch', json={'operations': [
+        {'op': 'add', 'type': 'subject', 'name': name, 'description': ''},
+        {'op': 'add', 'type': 'section', 'name': 'Basics'},
+        {'op': 'add', 'type': 'topic', 'name': 'Escaping', 'text': '1 < 2', 'code': 'print(1)'},
+    ]})
+
+    response = client.get(f'/subject/{name}')
+
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert '<p>1 &lt; 2</p>' in html
+    assert '<div class="highlight">' in html
@@ -0,0 +1,60 @@
+"""Entity versions and If-Match preconditions on PUT and DELETE."""
+import uuid
+
+
+def add_subject(admin):
+    name = f"Versioned {uuid.uuid4().hex[:8]}"
+    payload = admin.post('/api/batch', json={'operations': [
+        {'op': 'add', 'type': 'subject', 'name': name, 'description': 'd'},
+        {'op': 'add', 'type': 'section', 'name': 'Basics'},
+        {'op': 'add', 'type': 'topic', 'name': 'First', 'text': 'text'},
+    ]}).get_json()
+    return name, [result['id'] for result in payload['results']]
+
+
+def test_update_with_the_current_version_bumps_it(admin):
+    name, (subject_id, _, _) = add_subject(admin)
+    etag = admin.get(f'/api/subjects/{subject_id}').headers['ETag']
+
+    response = admin.put(f'/api/subjects/{subject_id}', json={'name': name, 'description': 'new'},
+                         headers={'If-Match': etag})
+
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 2
+    assert response.headers['ETag'] == '"v2"'
+
+
+def test_lost_update_is_refused_with_412(admin):
+    _, (_, section_id, topic_id) = add_subject(admin)
+    admin.put(f'/api/topics/{topic_id}', json={'name': 'First', 'text': 'theirs'}, headers={'If-Match': '"v1"'})
+
+    response = admin.put(f'/api/topics/{topic_id}', json={'name': 'First', 'text': 'mine'},
+                         headers={'If-Match': '"v1"'})
+
+    assert response.status_code == 412
+    assert response.get_json()['version'] == 2
+    assert response.headers['ETag'] == '"v2"'
+    assert admin.get(f'/api/topics/{topic_id}').get_json()['details']['text'] == 'theirs'
+    response = admin.put(f'/api/sections/{section_id}', json={'name': 'Renamed'}, headers={'If-Match': '"v7"'})
+    assert response.status_code == 412
+
+
+def test_delete_honours_if_match(admin):
+    _, (subject_id, section_id, topic_id) = add_subject(admin)
+
+    assert admin.delete(f'/api/topics/{topic_id}', headers={'If-Match': '"v2"'}).status_code == 412
+    assert admin.get(f'/api/topics/{topic_id}').status_code == 200
+    assert admin.delete(f'/api/topics/{topic_id}', headers={'If-Match': '"v1"'}).status_code == 200
+    assert admin.delete(f'/api/sections/{section_id}', headers={'If-Match': 'W/"v1"'}).status_code == 412
+    assert admin.delete(f'/api/sections/{section_id}', headers={'If-Match': '"v3", "v1"'}).status_code == 200
+    assert admin.delete(f'/api/subjects/{subject_id}', headers={'If-Match': '*'}).status_code == 200
+
+
+def test_writes_without_if_match_are_unconditional(admin):
+    name, (subject_id, _, _) = add_subject(admin)
+    admin.put(f'/api/subjects/{subject_id}', json={'name': name, 'description': 'one'})
+
+    response = admin.put(f'/api/subjects/{subject_id}', json={'name': name, 'description': 'two'})
+
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 3
@@ -1,6 +1,7 @@
 from .auth import check_login
+from .file_lock import FileLock
 
-# This makes check_login available when importing from utils
-__all__ = ['check_login']
+# This makes check_login and FileLock available when importing from utils
+__all__ = ['check_login', 'FileLock']
 
-# This file can be empty, it just marks the directory as a Python package 
\ No newline at end of file
+# This file can be empty, it just marks the directory as a Python package 
@@ -0,0 +1,35 @@
+import os
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+class FileLock:
+    """Exclusive advisory lock on an open file, shared by every process on the host."""
+    def __init__(self, file):
+        self.file = file
+        
+    def acquire(self, blocking=False):
+        if os.name == 'nt':
+            try:
+                mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                msvcrt.locking(self.file.fileno(), mode, 1)
+            except OSError:
+                return False
+            return True
+        else:
+            try:
+                flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                fcntl.flock(self.file.fileno(), flags)
+            except (IOError, BlockingIOError):
+                return False
+            return True
+            
+    def release(self):
+        if os.name == 'nt':
+            try:
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            except OSError:
+                pass
+        else:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
@@ -1,11 +1,16 @@
 import os
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
-from datetime import datetime
+import queue
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
+from datetime import datetime, timezone
 import json
+import config
+from utils.file_lock import FileLock
 
 # Create logs directory if it doesn't exist
-LOGS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'logs')
+LOGS_DIR = config.LOGS_DIR
 if not os.path.exists(LOGS_DIR):
     os.makedirs(LOGS_DIR)
 
@@ -23,7 +28,8 @@ LOG_FORMAT = logging.Formatter(
 class CustomJSONFormatter(logging.Formatter):
     def format(self, record):
         log_obj = {
-            'timestamp': datetime.utcnow().isoformat(),
+            # When the call was made, not when the queue got round to it
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).replace(tzinfo=None).isoformat(),
             'level': record.levelname,
             'message': record.getMessage(),
             'module': record.module,
@@ -32,43 +38,195 @@ class CustomJSONFormatter(logging.Formatter):
         }
         if record.exc_info:
             log_obj['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_obj['exception'] = record.exc_text
         return json.dumps(log_obj)
 
-def setup_logger(name):
+# Most records the writer thread takes off the queue and writes at once
+WRITE_BATCH = 256
+
+class ProcessSafeRotatingFileHandler(RotatingFileHandler):
     """
-    Creates a logging object and returns it
+    RotatingFileHandler that several processes can share. Writes and
+    rollovers happen under an flock on a sidecar .lock file, and a file
+    another process has rotated away is reopened before writing. The
+    writer thread hands over batches (emit_many), so the lock is taken and
+    the file checked once per batch rather than once per record.
     """
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    def __init__(self, filename, maxBytes=0, backupCount=0):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, delay=True)
+        self.lock_path = f"{self.baseFilename}.lock"
+        self._lock_file = None
+        self._lock_pid = None
 
-    # Create handlers
-    debug_handler = RotatingFileHandler(
-        DEBUG_LOG, 
-        maxBytes=1024*1024,  # 1MB
-        backupCount=5
-    )
-    debug_handler.setLevel(logging.DEBUG)
-    debug_handler.setFormatter(CustomJSONFormatter())
+    def _process_lock(self):
+        if self._lock_file is None or self._lock_pid != os.getpid():
+            self._lock_file = open(self.lock_path, 'a+b')
+            self._lock_pid = os.getpid()
+        return FileLock(self._lock_file)
 
-    error_handler = RotatingFileHandler(
-        ERROR_LOG,
-        maxBytes=1024*1024,  # 1MB
-        backupCount=5
-    )
-    error_handler.setLevel(logging.ERROR)
-    error_handler.setFormatter(CustomJSONFormatter())
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            current = os.stat(self.baseFilename).st_ino
+        except FileNotFoundError:
+            current = None
+        if current != os.fstat(self.stream.fileno()).st_ino:
+            self.stream.close()
+            self.stream = None
+
+    def emit(self, record):
+        self.emit_many([record])
+
+    def emit_many(self, records):
+        records = [record for record in records if record.levelno >= self.level]
+        if not records:
+            return
+        lock = self._process_lock()
+        lock.acquire(blocking=True)
+        try:
+            self._reopen_if_rotated()
+            for record in records:
+                super().emit(record)
+        finally:
+            lock.release()
+
+    def detach(self):
+        """Drop file handles inherited across a fork without touching the parent's."""
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
 
-    access_handler = RotatingFileHandler(
-        ACCESS_LOG,
-        maxBytes=1024*1024,  # 1MB
-        backupCount=5
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the caller: the message is rendered
+    here, everything else (JSON formatting, file writes) happens on the
+    listener thread, and records are dropped when the queue is full.
+    """
+    dropped = 0
+
+    def prepare(self, record):
+        # Render %-args now: they may be mutated after the call returns
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = LOG_FORMAT.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+def _file_handlers():
+    handlers = []
+    for path, level in ((DEBUG_LOG, logging.DEBUG), (ERROR_LOG, logging.ERROR), (ACCESS_LOG, logging.INFO)):
+        handler = ProcessSafeRotatingFileHandler(
+            path,
+            maxBytes=1024*1024,  # 1MB
+            backupCount=5
+        )
+        handler.setLevel(level)
+        handler.setFormatter(CustomJSONFormatter())
+        handlers.append(handler)
+    return handlers
+
+class _Pipeline:
+    """
+    The process's log queue and the one writer thread draining it in
+    batches. Each process writes for itself: a single writer per host would
+    need a socket between the workers and a hand-over when its process
+    exits, while batching already keeps the shared lock off the per-record
+    path and callers never wait on it either way.
+    """
+    _STOP = None
+
+    def __init__(self):
+        self.handlers = _file_handlers()
+        self.queue_handler = DroppingQueueHandler(queue.Queue(config.LOG_QUEUE_SIZE))
+        self.writer = None
+        self._lock = threading.Lock()
+        # Held while a batch is written, so a fork never copies a file
+        # object whose buffer lock belongs to the writer thread
+        self._writing = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._drain, daemon=True, name='log-writer')
+                self.writer.start()
+
+    def stop(self):
+        with self._lock:
+            if self.writer is not None:
+                self.queue_handler.queue.put(self._STOP)
+                self.writer.join()
+                self.writer = None
+
+    def _drain(self):
+        pending = self.queue_handler.queue
+        while True:
+            batch = [pending.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not self._STOP]
+            with self._writing:
+                for handler in self.handlers:
+                    try:
+                        handler.emit_many(records)
+                    except Exception:
+                        pass  # nowhere left to report it
+            if len(records) != len(batch):
+                return
+
+    def before_fork(self):
+        self._writing.acquire()
+
+    def after_fork_in_parent(self):
+        self._writing.release()
+
+    def after_fork(self):
+        # The writer thread did not survive the fork; start a fresh one
+        self.writer = None
+        self._lock = threading.Lock()
+        self._writing = threading.Lock()
+        self.queue_handler.queue = queue.Queue(config.LOG_QUEUE_SIZE)
+        for handler in self.handlers:
+            handler.detach()
+        self.start()
+
+_pipeline = _Pipeline()
+atexit.register(_pipeline.stop)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(
+        before=_pipeline.before_fork,
+        after_in_parent=_pipeline.after_fork_in_parent,
+        after_in_child=_pipeline.after_fork
     )
-    access_handler.setLevel(logging.INFO)
-    access_handler.setFormatter(CustomJSONFormatter())
 
-    # Add handlers to logger
-    logger.addHandler(debug_handler)
-    logger.addHandler(error_handler)
-    logger.addHandler(access_handler)
+def setup_logger(name):
+    """
+    Creates a logging object and returns it.
+
+    Records below config.LOG_LEVEL are discarded before their message is
+    built; the rest are queued and written to the debug, error and access
+    logs by a background listener, so callers never wait on disk.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(config.LOG_LEVEL)
+
+    if _pipeline.queue_handler not in logger.handlers:
+        logger.addHandler(_pipeline.queue_handler)
+    _pipeline.start()
 
-    return logger 
\ No newline at end of file
+    return logger
@@ -0,0 +1,284 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import config
+from utils.file_lock import FileLock
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    """
+    Process-local counters and histograms, shared with the other workers
+    on the host through one JSON file per process in `directory`.
+
+    Recording only touches memory. A background thread rewrites this
+    process's file every `flush_interval` seconds; `expose()` sums every
+    file in the directory, so /metrics reports host-wide totals whichever
+    worker serves the scrape. Files of exited workers are folded into one
+    `dead.json` and removed, so their counts stay in the totals without the
+    directory growing with every restart.
+    """
+
+    def __init__(self, directory, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics = {}  # name -> metric object, in registration order
+        self._lock = threading.Lock()
+        self._values = {}  # (name, label items) -> float or [bucket counts..., sum, count]
+        self._dirty = False
+        self._path = None
+        self._pid = None
+        self._thread = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    ### Recording ###
+    def _ensure_process(self):
+        if self._pid == os.getpid():
+            return
+        # First use, or a forked child: its copied values belong to the parent
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._values = {}
+            self._dirty = False
+            self._path = os.path.join(self.directory, f"{self._pid}-{uuid.uuid4().hex[:8]}.json")
+            self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._thread.start()
+
+    def add(self, name, labels, amount):
+        self._ensure_process()
+        key = (name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+            self._dirty = True
+
+    def observe(self, name, labels, buckets, value):
+        self._ensure_process()
+        key = (name, labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+            self._dirty = True
+
+    ### Sharing between processes ###
+    def flush(self):
+        """Write this process's values to its file in the metrics directory."""
+        with self._lock:
+            if not self._dirty or self._path is None:
+                return
+            payload = json.dumps([
+                [name, list(labels), value if isinstance(value, float) else list(value)]
+                for (name, labels), value in self._values.items()
+            ])
+            self._dirty = False
+            path = self._path
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_file = f"{path}.tmp"
+            with open(temp_file, 'w') as f:
+                f.write(payload)
+            os.replace(temp_file, path)
+        except OSError:
+            self._dirty = True
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def collect(self):
+        """Sum the values of every process that has written a file."""
+        self.flush()
+        try:
+            lock_file = open(os.path.join(self.directory, '.collect.lock'), 'a+b')
+        except FileNotFoundError:
+            return {}
+        # Folding and reading under one lock: no scrape sees a dead
+        # process's values both in its own file and in dead.json
+        lock = FileLock(lock_file)
+        lock.acquire(blocking=True)
+        try:
+            self._fold_dead_processes()
+            totals = {}
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith('.json'):
+                    _merge(totals, self._read(file_name))
+            return totals
+        finally:
+            lock.release()
+            lock_file.close()
+
+    def _read(self, file_name):
+        try:
+            with open(os.path.join(self.directory, file_name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _fold_dead_processes(self):
+        dead = [name for name in os.listdir(self.directory) if _exited(name)]
+        if not dead:
+            return
+        totals = {}
+        for file_name in ['dead.json'] + [name for name in dead if name.endswith('.json')]:
+            _merge(totals, self._read(file_name))
+        payload = json.dumps([
+            [name, [list(item) for item in labels], value]
+            for (name, labels), value in totals.items()
+        ])
+        temp_file = os.path.join(self.directory, 'dead.json.tmp')
+        with open(temp_file, 'w') as f:
+            f.write(payload)
+        os.replace(temp_file, os.path.join(self.directory, 'dead.json'))
+        for file_name in dead:
+            try:
+                os.remove(os.path.join(self.directory, file_name))
+            except FileNotFoundError:
+                pass
+
+    def expose(self):
+        """All metrics in the Prometheus text exposition format."""
+        totals = self.collect()
+        by_name = {}
+        for (name, labels), value in totals.items():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(by_name.get(name, []), key=lambda item: item[0]):
+                lines.extend(metric.samples(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(totals, entries):
+    for name, labels, value in entries:
+        key = (name, tuple(tuple(item) for item in labels))
+        if isinstance(value, list):
+            current = totals.get(key)
+            totals[key] = value if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            totals[key] = totals.get(key, 0.0) + value
+
+
+def _exited(file_name):
+    """Whether `file_name` is a per-process file whose process is gone."""
+    pid, _, rest = file_name.partition('-')
+    if not (pid.isdigit() and rest.endswith(('.json', '.json.tmp'))):
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False  # alive, owned by another user
+    return False
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, registry=None):
+        self.name = name
+        self.help = help
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(self.name, tuple(sorted(labels.items())), amount)
+
+    def samples(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS, registry=None):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def observe(self, value, **labels):
+        self.registry.observe(self.name, tuple(sorted(labels.items())), self.buckets, value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self, labels, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts[:-2] + [counts[-1] - sum(counts[:-2])]):
+            cumulative += count
+            bucket_labels = labels + (('le', _format_value(bound)),)
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(counts[-2])}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {counts[-1]}")
+        return lines
+
+
+REGISTRY = Registry(config.METRICS_DIR, config.METRICS_FLUSH_INTERVAL)
+atexit.register(REGISTRY.flush)
+
+
+### Metrics shared by the storage layer, models.py and app.py ###
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to build a response, by route, method and status.'
+)
+STORAGE_SECONDS = Histogram(
+    'storage_operation_duration_seconds',
+    'Time spent in storage operations (load/parse, dump, journal append, commit, refresh).'
+)
+STORAGE_BYTES_READ = Counter('storage_bytes_read_total', 'Bytes read from snapshot and journal files.')
+STORAGE_BYTES_WRITTEN = Counter('storage_bytes_written_total', 'Bytes written to snapshot and journal files.')
+STORE_LOOKUPS = Counter(
+    'store_cache_lookups_total',
+    'Resident store lookups: hit (current), refresh (caught up incrementally) or load (full reload).'
+)
+STORE_INVALIDATIONS = Counter('store_invalidations_total', 'Times the resident store was dropped.')
+WRITE_BATCH_SIZE = Histogram(
+    'write_batch_records', 'Mutation records persisted per group commit.',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500)
+)
+RENDER_CACHE_LOOKUPS = Counter('render_cache_lookups_total', 'Rendered subject page cache lookups by result.')
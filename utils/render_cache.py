@@ -0,0 +1,49 @@
+import threading
+from collections import OrderedDict
+
+
+class RenderCache:
+    """
+    LRU cache of rendered pages keyed by an id plus a content version,
+    bounded by the total size of the cached bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (version, body)
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Return the cached body for this key and version, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (version, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, oldest) = self._entries.popitem(last=False)
+                self.size -= len(oldest)
+
+    def evict(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
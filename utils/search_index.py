@@ -0,0 +1,285 @@
+import bisect
+import heapq
+import math
+import re
+import sys
+import threading
+from collections import Counter, OrderedDict
+from utils.logger_config import setup_logger
+
+logger = setup_logger('search')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+NAME_WEIGHT = 3  # a name hit counts like this many body hits
+
+
+def tokenize(text):
+    """
+    Lower-cased word tokens; snake_case identifiers also yield their parts.
+    Tokens are interned, so every document holding a term shares one string.
+    """
+    if not text:
+        return []
+    tokens = []
+    for token in TOKEN_RE.findall(str(text).lower()):
+        tokens.append(sys.intern(token))
+        if '_' in token:
+            tokens.extend(sys.intern(part) for part in token.split('_') if part)
+    return tokens
+
+
+def document_terms(kind, entity):
+    """Term frequencies for a subject, section or topic dict."""
+    terms = Counter()
+    for token in tokenize(entity.get('name')):
+        terms[token] += NAME_WEIGHT
+    if kind == 'subject':
+        terms.update(tokenize(entity.get('description')))
+    elif kind == 'topic':
+        details = entity.get('details') or {}
+        terms.update(tokenize(details.get('text')))
+        terms.update(tokenize(details.get('code')))
+        table = details.get('table')
+        if isinstance(table, dict):
+            terms.update(tokenize(' '.join(map(str, table.get('headers') or []))))
+            for row in table.get('rows') or []:
+                terms.update(tokenize(' '.join(map(str, row))))
+    return terms
+
+
+class SearchIndex:
+    """
+    Inverted index over subject, section and topic names, subject
+    descriptions and topic text, code and tables, ranked with BM25.
+
+    Documents are keyed (kind, id). After a full store load the index is
+    rebuilt by a background thread; queries keep using the previous index
+    (empty before the first build) until it is swapped in, and the changes
+    made meanwhile are replayed onto it. Afterwards it is kept current one
+    document at a time through models.add_change_listener.
+
+    Document lengths are normalised by the average length at the last
+    build, refreshed once the live average drifts by `drift`, so a
+    document's weight for a term stays fixed. The postings of the terms
+    queried most recently are also kept ranked by that weight, which lets
+    a query stop as soon as no unseen document can reach its page
+    (Fagin's threshold algorithm) instead of scoring every match.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, drift=0.1, ranked_terms=256):
+        self.k1 = k1
+        self.b = b
+        self.drift = drift
+        self.ranked_terms = ranked_terms
+        self._lock = threading.Lock()
+        self._postings = {}  # term -> {doc key: term frequency}
+        self._doc_terms = {}  # doc key -> tuple of its distinct terms
+        self._doc_lengths = {}
+        self._total_length = 0
+        self._average = 1.0  # average document length the weights use
+        self._ranked = OrderedDict()  # term -> [(-weight, doc key), ...] ascending
+        self._build = None  # the background build running, if any
+        self._missed = set()  # doc keys changed while it runs
+
+    ### Maintenance ###
+    def on_change(self, store, record, subject_id):
+        """Change listener: reindex the one entity a mutation record touched."""
+        if record is None:
+            self.rebuild_in_background(store)
+            return
+        key = (record['kind'], record['id'])
+        with self._lock:
+            if self._build is not None:
+                self._missed.add(key)
+            # As the store has it now, which also covers rolled back records
+            self._reindex(store, key, deleted=record['op'] == 'delete')
+
+    def _reindex(self, store, key, deleted=False):
+        entity = None if deleted else getattr(store, f"get_{key[0]}")(key[1])
+        if entity is None:
+            self._remove(key)
+        else:
+            self._add(key, document_terms(key[0], entity))
+
+    def rebuild(self, store):
+        """Rebuild from `store` in the calling thread."""
+        build = object()
+        with self._lock:
+            self._build = build
+            self._missed = set()
+        self._run_build(store, build)
+
+    def rebuild_in_background(self, store):
+        """Start rebuilding from `store`; a build already running is abandoned."""
+        build = object()
+        with self._lock:
+            self._build = build
+            self._missed = set()
+        threading.Thread(target=self._run_build, args=(store, build), daemon=True,
+                         name='search-index').start()
+
+    def _run_build(self, store, build):
+        try:
+            with store.lock:
+                documents = [(kind, list(entities.items())) for kind, entities in (
+                    ('subject', store.subject_by_id),
+                    ('section', store.section_by_id),
+                    ('topic', store.topic_by_id))]
+            postings, doc_terms, doc_lengths = {}, {}, {}
+            total_length = 0
+            for kind, entities in documents:
+                for entity_id, entity in entities:
+                    if self._build is not build:
+                        return
+                    key = (kind, entity_id)
+                    terms = document_terms(kind, entity)
+                    doc_terms[key] = tuple(terms)
+                    doc_lengths[key] = length = sum(terms.values())
+                    total_length += length
+                    for term, frequency in terms.items():
+                        postings.setdefault(term, {})[key] = frequency
+            with self._lock:
+                if self._build is not build:
+                    return
+                self._postings, self._doc_terms = postings, doc_terms
+                self._doc_lengths, self._total_length = doc_lengths, total_length
+                self._reset_average()
+                for key in self._missed:
+                    self._reindex(store, key)
+                self._build = None
+                self._missed = set()
+            logger.info("Search index built: %d documents, %d terms", len(doc_lengths), len(postings))
+        except Exception:
+            logger.exception("Search index build failed")
+            with self._lock:
+                if self._build is build:
+                    self._build = None
+
+    def _reset_average(self):
+        # The ranked postings were ordered by weights from the old average
+        if self._doc_lengths and self._total_length:
+            self._average = self._total_length / len(self._doc_lengths)
+        else:
+            self._average = 1.0
+        self._ranked.clear()
+
+    def _weight(self, frequency, length):
+        """BM25 weight of a term occurring `frequency` times in a document of `length`."""
+        norm = self.k1 * (1 - self.b + self.b * length / self._average)
+        return frequency * (self.k1 + 1) / (frequency + norm)
+
+    def _add(self, key, terms):
+        self._remove(key)
+        self._doc_terms[key] = tuple(terms)
+        length = sum(terms.values())
+        self._doc_lengths[key] = length
+        self._total_length += length
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[key] = frequency
+            ranked = self._ranked.get(term)
+            if ranked is not None:
+                bisect.insort(ranked, (-self._weight(frequency, length), key))
+        if abs(self._total_length / len(self._doc_lengths) - self._average) > self.drift * self._average:
+            self._reset_average()
+
+    def _remove(self, key):
+        terms = self._doc_terms.pop(key, None)
+        if terms is None:
+            return
+        length = self._doc_lengths.pop(key)
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings[term]
+            frequency = postings.pop(key)
+            ranked = self._ranked.get(term)
+            if ranked is not None:
+                del ranked[bisect.bisect_left(ranked, (-self._weight(frequency, length), key))]
+            if not postings:
+                del self._postings[term]
+                self._ranked.pop(term, None)
+
+    def _ranked_postings(self, term, postings):
+        ranked = self._ranked.get(term)
+        if ranked is None:
+            lengths = self._doc_lengths
+            ranked = self._ranked[term] = sorted(
+                (-self._weight(frequency, lengths[key]), key) for key, frequency in postings.items()
+            )
+            while len(self._ranked) > self.ranked_terms:
+                self._ranked.popitem(last=False)
+        else:
+            self._ranked.move_to_end(term)
+        return ranked
+
+    ### Queries ###
+    def search(self, query, limit=20, offset=0, kinds=None):
+        """
+        Return (total, [(score, (kind, id)), ...]) for one page of matches,
+        best first. `kinds` optionally restricts the document kinds.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._doc_lengths)
+            if not terms or not count:
+                return 0, []
+            lists = []
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings:
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    lists.append((idf, postings, self._ranked_postings(term, postings)))
+            if not lists:
+                return 0, []
+            matches = lists[0][1].keys() if len(lists) == 1 else set().union(*(p for _, p, _ in lists))
+            total = sum(1 for key in matches if key[0] in kinds) if kinds else len(matches)
+
+            # Walk the ranked lists side by side; a document not seen yet
+            # scores at most the sum of the weights at the current depth
+            wanted = offset + limit
+            best = []  # min-heap of (score, key)
+            seen = set()
+            depth = 0
+            deepest = max(len(ranked) for _, _, ranked in lists)
+            while depth < deepest:
+                threshold = 0.0
+                for idf, _, ranked in lists:
+                    if depth >= len(ranked):
+                        continue
+                    negative_weight, key = ranked[depth]
+                    threshold -= idf * negative_weight
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    if kinds and key[0] not in kinds:
+                        continue
+                    length = self._doc_lengths[key]
+                    score = sum(
+                        idf_ * self._weight(postings[key], length)
+                        for idf_, postings, _ in lists if key in postings
+                    )
+                    if len(best) < wanted:
+                        heapq.heappush(best, (score, key))
+                    elif score > best[0][0]:
+                        heapq.heapreplace(best, (score, key))
+                if len(best) >= wanted and best[0][0] >= threshold:
+                    break
+                depth += 1
+        best.sort(reverse=True)
+        return total, [(score, key) for score, key in best[offset:]]
+
+
+def make_snippet(text, query, width=160):
+    """A window of `text` around the first query term it contains."""
+    if not text:
+        return ''
+    text = ' '.join(str(text).split())
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in set(tokenize(query))]
+    positions = [p for p in positions if p >= 0]
+    start = max(0, min(positions) - width // 4) if positions else 0
+    snippet = text[start:start + width]
+    if start > 0:
+        snippet = '…' + snippet
+    if start + width < len(text):
+        snippet += '…'
+    return snippet
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from urllib.parse import quote
+from flask import render_template, url_for
+from werkzeug.security import safe_join
+from utils.file_lock import FileLock
+from utils.logger_config import setup_logger
+
+logger = setup_logger('render')
+
+
+def _digest(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def subject_fingerprint(subject):
+    """Changes whenever the subject, or a section or topic in it, changes."""
+    parts = [subject['id'], subject['name'], subject.get('updated_at'), subject.get('version', 1)]
+    for section in subject['sections']:
+        parts.append((section['id'], section.get('updated_at'), section.get('version', 1)))
+        for topic in section['topics']:
+            parts.append((topic['id'], topic.get('updated_at'), topic.get('version', 1)))
+    return _digest(*parts)
+
+
+def index_fingerprint(subjects):
+    """Changes whenever something the index page shows changes."""
+    return _digest(*((s['id'], s['name'], s.get('description')) for s in subjects))
+
+
+def page_path(subject_name):
+    """Output path of a subject's page, or None for names nginx could not map to a file."""
+    if not subject_name or subject_name.startswith('.') or any(c in subject_name for c in '/\\\0'):
+        return None
+    return os.path.join('subject', f"{subject_name}.html")
+
+
+def _copy_subject(subject):
+    """A copy of `subject` to render once the store lock is released; writers change entities in place."""
+    data = subject.to_dict()
+    for section in data['sections']:
+        for topic in section['topics']:
+            if isinstance(topic.get('details'), dict):
+                topic['details'] = dict(topic['details'])
+    return data
+
+
+class StaticSiteBuilder:
+    """
+    Renders the public pages into `output_dir` so nginx or a CDN can serve
+    anonymous reads without Flask:
+
+        index.html
+        subject/<subject name>.html
+        static/<path>.<hash>.<ext>   assets the pages link to, fingerprinted
+
+    nginx serves / from index.html, /subject/<name> from
+    subject/<name>.html and /static/ from static/, with try_files falling
+    back to the app for everything else. Incremental builds only
+    re-render the subjects whose fingerprint changed since the last build
+    and drop the pages of deleted or renamed subjects. A change to the
+    templates or the static files makes the next build a full one.
+
+    What the last build wrote, and the locks, live in `state_dir`, not in
+    the directory nginx serves. Files there are named after the output
+    directory, so several outputs can share one state_dir.
+    """
+
+    def __init__(self, app, output_dir, get_store, templates_digest, state_dir, delay=2.0):
+        self.app = app
+        self.output_dir = output_dir
+        self.get_store = get_store
+        self.templates_digest = templates_digest
+        self.state_dir = state_dir
+        self.delay = delay
+        self._assets = {}  # static filename -> fingerprinted URL
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    def _state_path(self, suffix):
+        name = hashlib.sha1(os.path.abspath(self.output_dir).encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.state_dir, f"site-{name}.{suffix}")
+
+    ### Assets ###
+    def static_digest(self):
+        """Hash of every file under the app's static folder."""
+        digest = hashlib.sha1()
+        for root, _, files in sorted(os.walk(self.app.static_folder)):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, self.app.static_folder).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        return digest.hexdigest()[:8]
+
+    def asset_url(self, filename):
+        """
+        URL of a fingerprinted copy of static/`filename` in the output,
+        copied on first use. Files outside the static folder keep their
+        ordinary URL.
+        """
+        url = self._assets.get(filename)
+        if url is not None:
+            return url
+        source = safe_join(self.app.static_folder, filename)
+        if source is None or not os.path.isfile(source):
+            return url_for('static', filename=filename)
+        with open(source, 'rb') as f:
+            data = f.read()
+        stem, ext = os.path.splitext(filename)
+        fingerprinted = f"{stem}.{hashlib.sha1(data).hexdigest()[:8]}{ext}"
+        target = os.path.join(self.output_dir, 'static', fingerprinted)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+        url = self._assets[filename] = f"/static/{quote(fingerprinted)}"
+        return url
+
+    def _url_for(self, endpoint, **values):
+        # Stands in for url_for in the templates while building
+        if endpoint == 'static':
+            return self.asset_url(values['filename'])
+        return url_for(endpoint, **values)
+
+    ### Pages ###
+    def _write_page(self, relative_path, html):
+        path = os.path.join(self.output_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_file = f"{path}.{os.getpid()}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(temp_file, path)
+
+    def _remove_page(self, relative_path):
+        try:
+            os.remove(os.path.join(self.output_dir, relative_path))
+        except FileNotFoundError:
+            pass
+
+    def _read_manifest(self):
+        try:
+            with open(self._state_path('json'), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return manifest if isinstance(manifest, dict) else {}
+
+    def build(self, full=False):
+        """
+        Bring the output up to date. Returns {'rendered', 'removed',
+        'unchanged'} page counts, or None if another build is running.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        os.makedirs(self.state_dir, exist_ok=True)
+        lock_file = open(self._state_path('lock'), 'a+b')
+        lock = FileLock(lock_file)
+        if not lock.acquire():
+            lock_file.close()
+            return None
+        try:
+            with self.app.test_request_context():
+                return self._build(full)
+        finally:
+            lock.release()
+            lock_file.close()
+
+    def _build(self, full):
+        site_digest = f"{self.templates_digest}-{self.static_digest()}"
+        manifest = self._read_manifest()
+        previous_pages = manifest.get('subjects', {})
+        if full or manifest.get('digest') != site_digest:
+            manifest = {}
+            self._assets.clear()
+        built = manifest.get('subjects', {})
+        pages = {}
+        rendered = unchanged = 0
+        # Caught up with every worker's commits before deciding what changed
+        store = self.get_store()
+        for subject in list(store.subjects):
+            key = str(subject['id'])
+            # Only the fingerprint and copy are taken under the lock, one
+            # subject at a time, so writers never wait on rendering
+            with store.lock:
+                if store.get_subject(subject['id']) is not subject:
+                    continue
+                path = page_path(subject['name'])
+                if path is None:
+                    continue
+                fingerprint = subject_fingerprint(subject)
+                previous = built.get(key)
+                if previous and previous['file'] == path and previous['fingerprint'] == fingerprint:
+                    pages[key] = previous
+                    unchanged += 1
+                    continue
+                data = _copy_subject(subject)
+            html = render_template('/public/subject_page.html', subject=data, url_for=self._url_for)
+            self._write_page(path, html)
+            pages[key] = {'file': path, 'fingerprint': fingerprint}
+            rendered += 1
+
+        with store.lock:
+            fingerprint = index_fingerprint(store.subjects)
+            subjects = [
+                {'id': s['id'], 'name': s['name'], 'description': s.get('description')}
+                for s in store.subjects
+            ] if manifest.get('index') != fingerprint else None
+        if subjects is not None:
+            html = render_template('/public/index.html', subjects=subjects, url_for=self._url_for)
+            self._write_page('index.html', html)
+            rendered += 1
+
+        kept = {page['file'] for page in pages.values()}
+        removed = 0
+        for page in previous_pages.values():
+            if page['file'] not in kept:
+                self._remove_page(page['file'])
+                removed += 1
+
+        self._write_state(json.dumps(
+            {'digest': site_digest, 'index': fingerprint, 'subjects': pages}, indent=4
+        ))
+        # Older builds kept their state in the output, where nginx served it
+        for name in ('.build.json', '.build.lock'):
+            self._remove_page(name)
+        if rendered or removed:
+            logger.info("Static site: %d pages rendered, %d removed, %d unchanged",
+                        rendered, removed, unchanged)
+        return {'rendered': rendered, 'removed': removed, 'unchanged': unchanged}
+
+    def _write_state(self, payload):
+        path = self._state_path('json')
+        temp_file = f"{path}.{os.getpid()}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(temp_file, path)
+
+    ### Automatic rebuilds ###
+    def on_change(self, store, record, subject_id):
+        """
+        Change listener: make sure this process takes part in automatic
+        builds (see _auto_build). The first call in each process starts it.
+        """
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            # Threads do not survive a fork: one per process
+            if self._thread_pid != os.getpid():
+                self._thread_pid = os.getpid()
+                threading.Thread(target=self._auto_build, daemon=True, name='static-site').start()
+
+    def _auto_build(self):
+        """
+        Only the process holding the host-wide auto-build lock builds:
+        every `delay` seconds it catches up with all workers' commits and
+        builds if the store moved since its last build. The others block on
+        the lock, so one of them takes over if that process exits.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        lock_file = open(self._state_path('auto.lock'), 'a+b')
+        # Never released: held until this process exits
+        FileLock(lock_file).acquire(blocking=True)
+        built = None
+        while True:
+            time.sleep(self.delay)
+            try:
+                store = self.get_store()
+                seen = (store.generation, store.seq)
+                # build() only returns None while `flask build-static` runs
+                if seen != built and self.build() is not None:
+                    built = seen
+            except Exception:
+                logger.exception("Static site build failed")
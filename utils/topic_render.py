@@ -0,0 +1,312 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from markupsafe import Markup, escape
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import TextLexer, find_lexer_class_by_name, get_lexer_by_name, guess_lexer
+from pygments.util import ClassNotFound
+from storage import BlobStore, LazyDetails
+from utils.file_lock import FileLock
+from utils.logger_config import setup_logger
+from utils.metrics import STORAGE_BYTES_READ, STORAGE_BYTES_WRITTEN
+
+logger = setup_logger('render')
+
+RENDERER_VERSION = 2  # bump when the fragment markup changes
+# guess_lexer weighs every lexer Pygments has, and short snippets often land
+# on obscure ones; below this score the default language is used instead
+GUESS_THRESHOLD = 0.3
+_FORMATTER = HtmlFormatter(cssclass='highlight')
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+def content_key(details, language, candidates=None):
+    """
+    Hash of the text/code/table/image a topic's details hold (the same
+    digest their blob has, so details kept in a blob need not be read),
+    plus what else shapes the fragment.
+    """
+    if isinstance(details, LazyDetails):
+        digest = details.digest
+    else:
+        digest = hashlib.sha256(BlobStore.encode(details)).hexdigest()
+    if candidates is not None:
+        language = f"{language}-{hashlib.sha1(','.join(candidates).encode('utf-8')).hexdigest()[:8]}"
+    return f"{digest}.{language}.v{RENDERER_VERSION}"
+
+
+def format_text(text):
+    """Paragraphs at blank lines, line breaks kept, everything escaped."""
+    paragraphs = (p.strip() for p in _PARAGRAPH_BREAK.split(text.strip()))
+    return ''.join(
+        f"<p>{str(escape(p)).replace(chr(10), '<br>' + chr(10))}</p>\n" for p in paragraphs if p
+    )
+
+
+@lru_cache(maxsize=None)
+def _lexer_classes(names):
+    classes = []
+    for name in names:
+        try:
+            classes.append(find_lexer_class_by_name(name))
+        except ClassNotFound:
+            logger.warning("Unknown Pygments lexer %r in the languages to guess from", name)
+    return classes
+
+
+def highlight_code(code, language, candidates=None):
+    """
+    Pygments markup for a code snippet: its language if it is clear from
+    the source, else `language`. Only the lexers named in `candidates` are
+    considered, or every lexer Pygments has when it is None.
+    """
+    try:
+        if candidates is None:
+            lexer = guess_lexer(code)
+            score = lexer.analyse_text(code)
+        else:
+            scores = [(cls.analyse_text(code), cls) for cls in _lexer_classes(tuple(candidates))]
+            score, cls = max(scores, key=lambda pair: pair[0], default=(0, None))
+            lexer = cls() if cls is not None else None
+        if score < GUESS_THRESHOLD:
+            lexer = get_lexer_by_name(language)
+    except ClassNotFound:
+        lexer = TextLexer()
+    return highlight(code, lexer, _FORMATTER)
+
+
+def format_table(table):
+    """The {'headers': [...], 'rows': [[...]]} table as an HTML table."""
+    if not isinstance(table, dict):
+        return ''
+    head = ''.join(f"<th>{escape(header)}</th>" for header in table.get('headers') or [])
+    body = ''.join(
+        '<tr>' + ''.join(f"<td>{escape(cell)}</td>" for cell in row) + '</tr>'
+        for row in table.get('rows') or []
+    )
+    return f'<table class="table"><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>\n'
+
+
+def render_details(details, language='python', candidates=None):
+    """HTML for a topic's text, code and table (the image stays with the template)."""
+    parts = []
+    if details.get('text'):
+        parts.append(format_text(str(details['text'])))
+    if details.get('code'):
+        parts.append(highlight_code(str(details['code']), language, candidates))
+    if details.get('table'):
+        parts.append(format_table(details['table']))
+    return ''.join(parts)
+
+
+class TopicFragments:
+    """
+    Rendered topic details keyed by content_key, so each distinct content
+    is rendered once. Fragments are kept in an LRU of `cache_size` entries
+    and, with a `directory`, as files under it
+    (<first two hex digits>/<key>.html) that every worker shares. Code is
+    highlighted as `language` unless the snippet clearly is one of
+    `guess_languages` (any language Pygments knows when None).
+
+    As a change listener it renders every added or updated topic in a
+    background thread, however it was written (form, import, batch or
+    another worker), and after a full load it backfills the topics that
+    have no file yet, so views rarely render anything themselves. The
+    backfill also removes files no topic uses any more once they are
+    `gc_grace` seconds old.
+    """
+
+    def __init__(self, directory=None, cache_size=4096, language='python', guess_languages=None,
+                 gc_grace=3600):
+        self.directory = directory
+        self.gc_grace = gc_grace
+        self.cache_size = cache_size
+        self.language = language
+        self.guess_languages = tuple(guess_languages) if guess_languages is not None else None
+        self._entries = OrderedDict()  # key -> fragment
+        self._lock = threading.Lock()
+        self._queue = deque()  # topic details, or a store to backfill
+        self._queued = threading.Condition()
+        self._worker_pid = None
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.html")
+
+    def get(self, details):
+        """The rendered fragment for `details`, rendering it on a miss."""
+        if not details:
+            return Markup('')
+        key = content_key(details, self.language, self.guess_languages)
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                return fragment
+        fragment = self._read(key)
+        if fragment is None:
+            fragment = Markup(render_details(details, self.language, self.guess_languages))
+            self._write(key, fragment)
+        self._remember(key, fragment)
+        return fragment
+
+    def _remember(self, key, fragment):
+        with self._lock:
+            self._entries[key] = fragment
+            while len(self._entries) > self.cache_size:
+                self._entries.popitem(last=False)
+
+    def prerender(self, details):
+        """Render `details` unless its fragment exists already; returns True if it was rendered."""
+        if not details:
+            return False
+        return self._prerender(content_key(details, self.language, self.guess_languages), details)
+
+    def _prerender(self, key, details):
+        with self._lock:
+            if key in self._entries:
+                return False
+        if self.directory is not None and os.path.exists(self.path(key)):
+            return False
+        fragment = Markup(render_details(details, self.language, self.guess_languages))
+        self._write(key, fragment)
+        self._remember(key, fragment)
+        return True
+
+    def backfill(self, store):
+        """
+        Render every topic in `store` without a fragment file, then remove
+        the files none of its topics uses (see collect_garbage). Returns
+        how many were rendered, or None without a directory or while
+        another process is backfilling it.
+        """
+        if self.directory is None:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, '.backfill.lock'), 'a+b')
+        lock = FileLock(lock_file)
+        if not lock.acquire():
+            lock_file.close()
+            return None
+        try:
+            with store.lock:
+                pending = [topic['details'] for topic in store.topic_by_id.values()]
+            rendered = 0
+            referenced = set()
+            complete = True
+            for details in pending:
+                if not details:
+                    continue
+                try:
+                    key = content_key(details, self.language, self.guess_languages)
+                    referenced.add(key)
+                    rendered += self._prerender(key, details)
+                except Exception as e:
+                    complete = False
+                    logger.error(f"Error pre-rendering topic: {str(e)}")
+            if rendered:
+                logger.info("Pre-rendered %d topics into %s", rendered, self.directory)
+            # A topic whose key is unknown may still use one of the files
+            if complete:
+                self.collect_garbage(referenced)
+            return rendered
+        finally:
+            lock.release()
+            lock_file.close()
+
+    def collect_garbage(self, referenced):
+        """
+        Delete fragment files whose key is not in `referenced` and that are
+        older than `gc_grace` seconds, so fragments a worker still on an
+        older copy of the store, or a render of a topic added since, asks
+        for are kept. Leftover temp files of interrupted writes go as well.
+        """
+        removed = 0
+        cutoff = time.time() - self.gc_grace
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                key, ext = os.path.splitext(name)
+                if name.startswith('.') or (ext == '.html' and key in referenced):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        if removed:
+            logger.info("Removed %d unused rendered fragments", removed)
+        return removed
+
+    ### Background rendering ###
+    def on_change(self, store, record, subject_id):
+        """
+        Change listener: queue an added or updated topic, or after a full
+        load the whole store, for the background thread. Listeners run
+        under the store lock, so nothing is rendered here.
+        """
+        if record is None:
+            if self.directory is not None:
+                self._enqueue(store)
+        elif record['kind'] == 'topic' and record['op'] in ('add', 'update'):
+            topic = store.get_topic(record['id'])
+            if topic is not None and topic['details']:
+                self._enqueue(topic['details'])
+
+    def _enqueue(self, item):
+        with self._queued:
+            self._queue.append(item)
+            # Threads do not survive a fork: start one per process
+            if self._worker_pid != os.getpid():
+                self._worker_pid = os.getpid()
+                threading.Thread(target=self._render_queued, daemon=True, name='prerender').start()
+            self._queued.notify()
+
+    def _render_queued(self):
+        while True:
+            with self._queued:
+                while not self._queue:
+                    self._queued.wait()
+                item = self._queue.popleft()
+            try:
+                if isinstance(item, (dict, LazyDetails)):
+                    self.prerender(item)
+                else:
+                    self.backfill(item)
+            except Exception as e:
+                logger.error(f"Error pre-rendering topic: {str(e)}")
+
+    def _read(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                fragment = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f"Error reading rendered fragment {key}: {str(e)}")
+            return None
+        STORAGE_BYTES_READ.inc(len(fragment), file='fragment')
+        return Markup(fragment)
+
+    def _write(self, key, fragment):
+        if self.directory is None:
+            return
+        path = self.path(key)
+        temp_file = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.write(fragment)
+            os.replace(temp_file, path)
+            STORAGE_BYTES_WRITTEN.inc(len(fragment), file='fragment')
+        except OSError as e:
+            logger.error(f"Error writing rendered fragment {key}: {str(e)}")
+            if os.path.exists(temp_file):
+                os.remove(temp_file)